@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Import time benchmark of the hreports command line interface.
+
+Runs ``python -X importtime -c "import hreports.cli"`` a few times and
+reports the fastest cumulative import time of hreports.cli as JSON. Exits
+with status 1 if it exceeds the threshold or if modules that only rendering
+commands need are imported at startup.
+"""
+
+import re
+import sys
+import json
+import subprocess
+
+import click
+
+
+# Modules the CLI must not import before a subcommand needs them
+DEFERRED_MODULES = ('jinja2', 'yaml', 'subprocess', 'tempfile',
+                    'hreports.hreports', 'hreports.batch')
+
+DEFAULT_THRESHOLD_MS = 100
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|'
+                           r'(\s*)(\S+)')
+
+
+def measure(module='hreports.cli'):
+    """Return cumulative import time of module in µs and all imports."""
+    cmd = [sys.executable, '-X', 'importtime', '-c', 'import %s' % module]
+    output = subprocess.run(cmd, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True).stderr
+    cumulative = None
+    imported = []
+    for line in output.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        imported.append(match.group(4))
+        if match.group(4) == module:
+            cumulative = int(match.group(2))
+    return cumulative, imported
+
+
+def run(repeat=5):
+    times = []
+    imported = []
+    for index in range(repeat):
+        cumulative, imported = measure()
+        times.append(cumulative)
+    deferred = [module for module in DEFERRED_MODULES if module in imported]
+    return {'benchmark': 'startup',
+            'module': 'hreports.cli',
+            'best_ms': min(times) / 1000.0,
+            'times_ms': [value / 1000.0 for value in times],
+            'deferred_modules_imported': deferred}
+
+
+@click.command()
+@click.option('--repeat', '-n', default=5, help='Number of measurements')
+@click.option('--threshold', '-t', default=DEFAULT_THRESHOLD_MS,
+              help='Maximum import time in ms')
+def main(repeat, threshold):
+    """Measure the import time of hreports.cli."""
+    result = run(repeat)
+    result['threshold_ms'] = threshold
+    click.echo(json.dumps(result, indent=2))
+
+    if result['deferred_modules_imported']:
+        click.echo('Imported at startup: %s' %
+                   ', '.join(result['deferred_modules_imported']), err=True)
+        sys.exit(1)
+    if result['best_ms'] > threshold:
+        click.echo('Import time %.1f ms exceeds %s ms' %
+                   (result['best_ms'], threshold), err=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
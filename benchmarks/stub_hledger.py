@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Stand-in for hledger that reads the synthetic benchmark journals.
+
+Supports register and balance reports filtered by account substrings,
+monthly balance tables (-M) and csv output (-O csv), which is all the
+benchmarks ask for. Its output has the shape of hledger's, so templates and
+filters do the same work as on real output.
+"""
+
+import io
+import sys
+from collections import OrderedDict
+
+
+def read_postings(path):
+    """Yield date, description, account and amount of each posting."""
+    date = description = None
+    pending = []
+    with io.open(path, encoding='utf-8') as journal:
+        for line in journal:
+            if not line.strip():
+                continue
+            if not line[0].isspace():
+                date, _, description = line.strip().partition(' ')
+                pending = []
+                continue
+            parts = line.split()
+            if len(parts) >= 3:
+                amount = float(parts[1])
+                pending.append(amount)
+            else:
+                # The posting without amount balances the transaction
+                amount = -sum(pending)
+            yield date, description, parts[0], amount
+
+
+def amount(value):
+    return '{:,.2f} EUR'.format(value)
+
+
+def register(postings, csv):
+    total = 0.0
+    if csv:
+        yield '"date","description","account","amount","total"'
+    for date, description, account, value in postings:
+        total += value
+        if csv:
+            yield '"%s","%s","%s","%s","%s"' % (date, description, account,
+                                                amount(value), amount(total))
+        else:
+            yield '%s %-20s %-26s %16s %18s' % (date, description[:20],
+                                                account, amount(value),
+                                                amount(total))
+
+
+def balance(postings, csv):
+    totals = OrderedDict()
+    for date, description, account, value in postings:
+        totals[account] = totals.get(account, 0.0) + value
+    if csv:
+        yield '"account","balance"'
+        for account, value in sorted(totals.items()):
+            yield '"%s","%s"' % (account, amount(value))
+        yield '"total","%s"' % amount(sum(totals.values()))
+        return
+    for account, value in sorted(totals.items()):
+        yield '%20s  %s' % (amount(value), account)
+    yield '-' * 20
+    yield '%20s' % amount(sum(totals.values()))
+
+
+def monthly_balance(postings):
+    months = []
+    totals = OrderedDict()
+    for date, description, account, value in postings:
+        month = date[:7]
+        if month not in months:
+            months.append(month)
+        row = totals.setdefault(account, {})
+        row[month] = row.get(month, 0.0) + value
+    width = max([len(account) for account in totals] + [10])
+    yield 'Balance changes:'
+    yield ''
+    yield '%s || %s' % (' ' * width, ' '.join('%16s' % month
+                                              for month in months))
+    yield '%s++%s' % ('=' * (width + 1), '=' * (17 * len(months)))
+    for account, row in sorted(totals.items()):
+        yield '%s || %s' % (account.ljust(width), ' '.join(
+            '%16s' % amount(row.get(month, 0.0)) for month in months))
+
+
+def main(args):
+    journal = None
+    csv = '-O' in args and args[args.index('-O') + 1] == 'csv'
+    if '-f' in args:
+        journal = args[args.index('-f') + 1]
+    words = [arg for arg in args if not arg.startswith('-') and
+             arg not in (journal, 'csv')]
+    command, patterns = words[0], words[1:]
+
+    postings = [posting for posting in read_postings(journal)
+                if not patterns or
+                any(pattern in posting[2] for pattern in patterns)]
+    if command in ('reg', 'register'):
+        lines = register(postings, csv)
+    elif '-M' in args:
+        lines = monthly_balance(postings)
+    else:
+        lines = balance(postings, csv)
+
+    out = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8',
+                           write_through=False)
+    for line in lines:
+        out.write(line)
+        out.write('\n')
+    out.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of config loading, queries, templates, filters and pdf export.
+
+Generates a synthetic journal and a config with many reports in a temporary
+directory, puts stand-ins for hledger and pandoc on the PATH and times the
+main steps of a report run. Results are written as JSON, so runs of
+different versions can be compared with --compare.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import datetime
+import platform
+import tempfile
+from collections import OrderedDict
+
+import click
+
+from . import synthetic
+
+
+STUBS = {'hledger': 'stub_hledger.py', 'pandoc': 'stub_pandoc.py'}
+
+
+def install_stubs(directory):
+    """Write hledger and pandoc stand-ins to directory."""
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    for name, source in STUBS.items():
+        path = os.path.join(directory, name)
+        with io.open(os.path.join(source_dir, source),
+                     encoding='utf-8') as source_file:
+            code = source_file.read()
+        with io.open(path, 'w', encoding='utf-8') as stub:
+            stub.write('#!%s\n%s' % (sys.executable, code))
+        os.chmod(path, 0o755)
+
+
+def timed(function, repeat=5, number=1, setup=None):
+    """Return best and mean time of a call to function in ms."""
+    times = []
+    for index in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for call in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return OrderedDict([('best_ms', min(times) * 1000.0),
+                        ('mean_ms', sum(times) / len(times) * 1000.0),
+                        ('repeat', repeat),
+                        ('number', number)])
+
+
+class Suite(object):
+    """Benchmarks on a synthetic journal and config in directory."""
+
+    def __init__(self, directory, postings, reports):
+        self.directory = directory
+        self.journal = os.path.join(directory, 'bench.journal')
+        self.postings = synthetic.write_journal(self.journal, postings)
+        self.config_file = synthetic.write_config(directory, self.journal,
+                                                  reports)
+        self.reports = reports
+
+    def new_config(self):
+        from hreports.config import Config
+        config = Config(self.config_file)
+        config.force_save = True
+        return config
+
+    def new_hreport(self):
+        from hreports.hreports import Hreport
+        return Hreport(self.new_config())
+
+    def benchmarks(self):
+        """Yield name, function, setup and number of calls per timing."""
+        from hreports.config import SNAPSHOT_MIN_AGE
+
+        config = self.new_config()
+        snapshot_file = config.get_snapshot_file()
+
+        def without_snapshot():
+            if os.path.exists(snapshot_file):
+                os.unlink(snapshot_file)
+            # A young config file is not snapshotted again
+            os.utime(self.config_file, None)
+
+        def with_snapshot():
+            if not os.path.exists(snapshot_file):
+                past = time.time() - 2 * SNAPSHOT_MIN_AGE
+                os.utime(self.config_file, (past, past))
+                self.new_config()
+
+        yield 'config.read_config', self.new_config, without_snapshot, 1
+        yield 'config.read_config[snapshot]', self.new_config, \
+            with_snapshot, 1
+
+        hreport = self.new_hreport()
+        names = sorted(hreport.config.get_stored_reports())
+
+        def get_contexts():
+            for name in names:
+                hreport.get_context(name)['report']['title']
+
+        yield 'hreport.get_context', get_contexts, hreport.clear_contexts, 1
+
+        for title, query in [('register', 'reg'), ('balance', 'bal')]:
+            yield 'hreport.run[%s]' % title, \
+                lambda query=query: hreport.run(query=query,
+                                                ledger=self.journal), \
+                hreport.clear_query_results, 1
+
+        yield 'hreport.render', lambda: hreport.render(names[0]), \
+            hreport.clear_query_results, 1
+        yield 'hreport.save', lambda: hreport.save(names[0]), \
+            hreport.clear_query_results, 1
+
+        register = hreport.run(query='reg', ledger=self.journal)
+        balance = hreport.run(query='bal expenses', ledger=self.journal)
+        monthly = hreport.run(query='bal -M', ledger=self.journal)
+        table = hreport.run_table(query='bal expenses', ledger=self.journal,
+                                  output_format='csv')
+        today = datetime.date(2018, 3, 14)
+        cases = [
+            ('datetime', (datetime.datetime.now(),), 1000),
+            ('datetime_strptime', ('2018/03',), 1000),
+            ('german_float', ('1234567.891',), 1000),
+            ('last_day_of_month', (today,), 1000),
+            ('substract_days', (today, 30), 1000),
+            ('multiply_last_column',
+             (register.splitlines(), 1.19, 'net',
+              [['tax', 0.5], ['food', 1.07]]), 1),
+            ('add_percentage_column', (balance.splitlines(),), 1),
+            ('round_output', (register,), 1),
+            ('format_table', (monthly.splitlines(),), 1),
+            ('multiply_last_column[table]', (table, 1.19), 1),
+            ('add_percentage_column[table]', (table,), 1),
+            ('round_output[table]', (table,), 1),
+            ('format_table[table]', (table,), 1),
+        ]
+        for name, args, number in cases:
+            function = hreport.env.filters[name.split('[')[0]]
+            yield 'filters.%s' % name, \
+                lambda function=function, args=args: function(*args), \
+                None, number
+
+    def run(self, repeat=5, pattern=None):
+        results = OrderedDict()
+        for name, function, setup, number in self.benchmarks():
+            if pattern and not fnmatch.fnmatchcase(name, pattern):
+                continue
+            results[name] = timed(function, repeat, number, setup)
+        return results
+
+
+def compare(results, baseline):
+    """Add the ratio to the baseline's best time to every result."""
+    ratios = OrderedDict()
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous and previous.get('best_ms'):
+            ratios[name] = result['best_ms'] / previous['best_ms']
+            result['ratio'] = ratios[name]
+    return ratios
+
+
+@click.command()
+@click.option('--postings', '-p', default=10000,
+              help='Postings in the synthetic journal')
+@click.option('--reports', '-r', default=100,
+              help='Reports in the synthetic config')
+@click.option('--repeat', '-n', default=5, help='Number of measurements')
+@click.option('--only', metavar='PATTERN',
+              help='Only run benchmarks matching the glob PATTERN')
+@click.option('--output', '-o', type=click.Path(),
+              help='Write the results to a JSON file')
+@click.option('--compare', 'baseline_file', type=click.Path(exists=True),
+              help='Compare with the results in a JSON file')
+@click.option('--max-slowdown', type=float,
+              help='Fail if a benchmark is this many times slower than '
+                   'the compared results')
+def main(postings, reports, repeat, only, output, baseline_file,
+         max_slowdown):
+    """Time config loading, queries, templates, filters and pdf export."""
+    directory = tempfile.mkdtemp(prefix='hreports-bench-')
+    stubs = os.path.join(directory, 'bin')
+    os.makedirs(stubs)
+    install_stubs(stubs)
+    environment = dict(os.environ)
+    os.environ['PATH'] = stubs + os.pathsep + os.environ.get('PATH', '')
+    # Keep bytecode cache and build manifest out of the user's app dir
+    os.environ['XDG_CONFIG_HOME'] = os.path.join(directory, 'app')
+
+    try:
+        suite = Suite(directory, postings, reports)
+        results = suite.run(repeat, only)
+    finally:
+        os.environ.clear()
+        os.environ.update(environment)
+        shutil.rmtree(directory)
+
+    import hreports
+    report = OrderedDict([
+        ('benchmark', 'suite'),
+        ('version', hreports.__version__),
+        ('python', platform.python_version()),
+        ('postings', suite.postings),
+        ('reports', reports),
+        ('results', results),
+    ])
+
+    slower = []
+    if baseline_file:
+        with io.open(baseline_file, encoding='utf-8') as baseline:
+            ratios = compare(results, json.load(baseline))
+        for name, ratio in ratios.items():
+            click.echo('%-40s %6.2fx' % (name, ratio), err=True)
+            if max_slowdown and ratio > max_slowdown:
+                slower.append(name)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with io.open(output, 'w', encoding='utf-8') as output_file:
+            output_file.write(text + '\n')
+    else:
+        click.echo(text)
+
+    if slower:
+        click.echo('Slower than %sx: %s' % (max_slowdown, ', '.join(slower)),
+                   err=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""Synthetic journals and configs for the benchmarks."""
+
+import io
+import os
+import random
+import datetime
+
+import yaml
+
+
+ACCOUNTS = ['assets:bank:checking', 'assets:bank:savings', 'assets:cash',
+            'expenses:food', 'expenses:rent', 'expenses:tax',
+            'expenses:travel', 'expenses:office', 'income:salary',
+            'income:consulting', 'liabilities:creditcard']
+
+DESCRIPTIONS = ['Groceries', 'Rent', 'Salary', 'Invoice', 'Train ticket',
+                'Office supplies', 'Tax prepayment', 'Transfer']
+
+TEMPLATE = '''---
+papersize: a4
+---
+# {{ report.title }} for {{ client }}
+
+{% for line in output %}
+    {{ line }}
+{% endfor %}
+
+Total: {{ output|last }}
+'''
+
+
+def write_journal(path, postings, seed=0):
+    """Write a journal with about postings postings, two per transaction.
+
+    Returns the number of postings written.
+    """
+    rng = random.Random(seed)
+    day = datetime.date(2010, 1, 1)
+    written = 0
+    with io.open(path, 'w', encoding='utf-8') as journal:
+        while written < postings:
+            if rng.random() < 0.3:
+                day += datetime.timedelta(days=1)
+            amount = rng.randint(1, 500000) / 100.0
+            account = rng.choice(ACCOUNTS)
+            other = rng.choice([name for name in ACCOUNTS
+                                if name != account])
+            journal.write('%s %s\n    %s  %.2f EUR\n    %s\n\n' %
+                          (day.isoformat(), rng.choice(DESCRIPTIONS),
+                           account, amount, other))
+            written += 2
+    return written
+
+
+def write_config(directory, journal, reports):
+    """Write a config with reports reports on journal and a template.
+
+    Returns the path of the config file.
+    """
+    templates = os.path.join(directory, 'templates')
+    if not os.path.exists(templates):
+        os.makedirs(templates)
+    with io.open(os.path.join(templates, 'bench.md'), 'w',
+                 encoding='utf-8') as template:
+        template.write(TEMPLATE)
+
+    config = {
+        'global': {
+            'cache': False,
+            'manifest': False,
+            'ledger': journal,
+            'title': 'Report {{ year }} of {{ company }}',
+            'variables': {
+                'company': 'Example Ltd',
+                'year': '2018',
+            },
+        },
+        'reports': {},
+    }
+    for index in range(reports):
+        account = ACCOUNTS[index % len(ACCOUNTS)]
+        report = {
+            'query': '%s %s' % ('reg' if index % 2 else 'bal', account),
+            'ledger': journal,
+            'filename': os.path.join(directory, 'report_%s.pdf' % index),
+            'title': '{{ client }}: {{ rate|int * 2 }} ({{ year }})',
+            'variables': {
+                'client': 'client_%s' % index,
+                'rate': str(index),
+            },
+        }
+        if index % 4 == 0:
+            report['template'] = 'bench.md'
+        config['reports']['report_%s' % index] = report
+
+    config_file = os.path.join(directory, 'config.yml')
+    with io.open(config_file, 'w', encoding='utf-8') as config_stream:
+        yaml.safe_dump(config, config_stream, default_flow_style=False)
+    return config_file
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""Asyncio interface to hreports."""
+
+import asyncio
+from sys import stdout
+from subprocess import PIPE
+
+from click.parser import split_arg_string
+from click.exceptions import ClickException, UsageError
+
+from .hreports import Hreport
+from .batch import default_jobs
+from .converters import PandocConverter
+
+
+class AsyncHreport(Hreport):
+    """Hreport with coroutines that do not block the event loop.
+
+    hledger and pandoc run as asyncio subprocesses, at most concurrency of
+    them at the same time. Template rendering and file access run in the
+    loop's default executor. Query results are shared with the synchronous
+    methods, so a template rendered in the executor gets the output of its
+    report's query without running it again. Like render, every call of
+    render_async, save_async or process_reports_async is a batch that
+    starts with fresh results, see Hreport.batch.
+    """
+
+    def __init__(self, config, concurrency=None):
+        super(AsyncHreport, self).__init__(config)
+        self.concurrency = concurrency or default_jobs(config)
+        self.semaphores = {}
+
+    def get_semaphore(self):
+        # Semaphores belong to the loop they are first used in
+        loop = asyncio.get_running_loop()
+        if loop not in self.semaphores:
+            self.semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return self.semaphores[loop]
+
+    async def in_executor(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, function, *args)
+
+    async def run_async(self, name=False, query=False, ledger=False,
+                        output_format=None):
+        prepared = self.prepare_query(name, query, ledger, output_format)
+        if not prepared:
+            return ''
+        cmd, ledger, query = prepared
+        self.config.cmd = cmd
+
+        key = (ledger, query)
+        result, owner = self.claim_result(self.query_results, key)
+        if not owner:
+            return await asyncio.wrap_future(result)
+
+        try:
+            output = await self.run_command_async(cmd, ledger, query)
+        except BaseException as exception:
+            self.fail_result(self.query_results, key, result, exception)
+            raise
+        result.set_result(output)
+        return output
+
+    async def run_command_async(self, cmd, ledger=None, query=None):
+        cache, cache_key, output = await self.in_executor(
+            self.get_cached, cmd, ledger, query)
+        if output is None:
+            output = await self.execute_async(cmd, ledger, query)
+            await self.in_executor(self.set_cached, cache, cache_key, ledger,
+                                   query, output)
+        return output
+
+    async def execute_async(self, cmd, ledger=None, query=None):
+        with self.span('hledger', cmd, rusage=True):
+            return await self.execute_query_async(cmd, ledger, query)
+
+    async def execute_query_async(self, cmd, ledger=None, query=None):
+        backend = self.get_backend()
+        if backend and query is not None:
+            output = await self.in_executor(backend.query, ledger, query)
+            if output is not None:
+                self.config.returncode = 0
+                return output
+
+        async with self.get_semaphore():
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *split_arg_string(cmd), stdout=PIPE)
+            except OSError:
+                raise UsageError('Hledger was not found on your system')
+            output, _ = await process.communicate()
+
+        if process.returncode:
+            self.config.error = output
+            self.config.returncode = process.returncode
+            raise UsageError('Query %s returned non-zero exit status' % cmd)
+        self.config.returncode = 0
+        return output.decode(stdout.encoding or 'utf-8')
+
+    async def render_async(self, name):
+        # Run the report's query here, the template then finds its result.
+        # Queries of periods run on threads while rendering.
+        with self.batch():
+            if not self.get_periods(name):
+                await self.run_async(
+                    name, output_format=self.get_output_format(name))
+            return await self.in_executor(self.render, name)
+
+    async def convert_async(self, converter, document, output_file, css):
+        async with self.get_semaphore():
+            if not isinstance(converter, PandocConverter):
+                return await self.in_executor(converter.convert, document,
+                                              output_file, css)
+
+            cmd = converter.command(output_file, css)
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd, stdin=PIPE, stdout=PIPE)
+            except OSError:
+                raise UsageError('Pandoc was not found on your system')
+            await process.communicate(document.encode('utf-8'))
+
+        if process.returncode:
+            raise UsageError('Pandoc %s returned non-zero exit status' %
+                             ' '.join(cmd))
+        return output_file
+
+    async def save_async(self, name):
+        """Convert a report to pdf unless the pdf is up to date."""
+        with self.batch():
+            return await self.save_report_async(name)
+
+    async def save_report_async(self, name):
+        document = await self.render_async(name)
+        output_file, css, converter, manifest, digest = \
+            await self.in_executor(self.plan_save, name, document)
+        if manifest and await self.in_executor(manifest.is_current,
+                                               output_file, digest):
+            self.skipped.add(output_file)
+            return output_file
+
+        await self.convert_async(converter, document, output_file, css)
+
+        if manifest:
+            await self.in_executor(manifest.record, output_file, digest)
+        return output_file
+
+    async def process_report_async(self, name, save=False):
+        """Render or save a report and return (name, result, error)."""
+        try:
+            if save:
+                result = await self.save_async(name)
+            else:
+                result = await self.render_async(name)
+        except ClickException as exception:
+            return name, None, exception.format_message()
+        except EnvironmentError as exception:
+            return name, None, str(exception)
+        return name, result, None
+
+    async def process_reports_async(self, names, save=False):
+        """Render or save many reports concurrently.
+
+        Returns (name, result, error) tuples in the order of names. The
+        reports share query results, which are forgotten when the next call
+        or render starts.
+        """
+        with self.batch():
+            return await asyncio.gather(
+                *[self.process_report_async(name, save) for name in names])
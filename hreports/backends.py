@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""Execution backends for hledger queries.
+
+A backend answers a query for a ledger or returns None, in which case
+Hreport falls back to running hledger in a new subprocess.
+"""
+
+import os
+import uuid
+import atexit
+import threading
+import subprocess
+from queue import Queue, Empty
+
+from click.parser import split_arg_string
+
+from .cache import ledger_files, default_ledger, file_stats
+from .journal import load_index, Unsupported
+
+
+DEFAULT_TIMEOUT = 60
+
+
+class ReplUnsupported(EnvironmentError):
+    pass
+
+
+class HledgerRepl(object):
+    """A long lived `hledger repl` process for one ledger.
+
+    The journal is parsed once when the process starts. Each query is
+    followed by an `echo` command with a unique marker, which tells where
+    the output of the query ends. Any prompt hledger prints is detected
+    from the first marker and stripped from the output.
+
+    hledger writes the errors of a command before it runs the next one, so
+    once the marker arrived, all errors of the query are in the stderr
+    pipe, which is then read without blocking.
+    """
+
+    def __init__(self, ledger=None, timeout=DEFAULT_TIMEOUT):
+        self.ledger = ledger
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.process = None
+        self.prompt = ''
+        self.files = []
+        self.stats = None
+        self.lines = Queue()
+
+    def start(self):
+        cmd = ['hledger']
+        if self.ledger:
+            cmd += ['-f', self.ledger]
+        cmd.append('repl')
+
+        ledger = os.path.expanduser(self.ledger or default_ledger())
+        self.files = ledger_files(ledger) or [ledger]
+        self.stats = file_stats(self.files)
+        try:
+            self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE,
+                                            encoding='utf-8')
+        except OSError:
+            raise ReplUnsupported('hledger was not found')
+
+        self.lines = Queue()
+        reader = threading.Thread(target=self.read_stdout,
+                                  args=(self.process, self.lines))
+        reader.daemon = True
+        reader.start()
+        os.set_blocking(self.process.stderr.fileno(), False)
+
+        marker = self.marker()
+        try:
+            self.send('echo %s' % marker)
+            line = self.lines.get(timeout=self.timeout)
+        except (EnvironmentError, Empty):
+            line = None
+        if not line or not line.rstrip('\n').endswith(marker):
+            self.stop()
+            raise ReplUnsupported('hledger repl is not supported')
+        self.prompt = line.rstrip('\n')[:-len(marker)]
+
+    @staticmethod
+    def read_stdout(process, lines):
+        for line in iter(process.stdout.readline, ''):
+            lines.put(line)
+        lines.put(None)
+
+    def read_errors(self):
+        """Return what hledger wrote to stderr and was not read yet."""
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self.process.stderr.fileno(), 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b''.join(chunks).decode('utf-8', 'replace')
+
+    def marker(self):
+        return 'hreports-%s' % uuid.uuid4().hex
+
+    def send(self, command):
+        self.process.stdin.write(command + '\n')
+        self.process.stdin.flush()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def is_stale(self):
+        """Whether the ledger changed since the journal was parsed.
+
+        A changed include directive changes the stats of its file, so the
+        files found on start are enough.
+        """
+        return file_stats(self.files) != self.stats
+
+    def stop(self):
+        if self.is_alive():
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except (EnvironmentError, subprocess.TimeoutExpired):
+                self.process.kill()
+        self.process = None
+
+    def query(self, query):
+        """Return the output of query or None if hledger reported errors."""
+        with self.lock:
+            if not self.is_alive() or self.is_stale():
+                self.stop()
+                self.start()
+
+            # Errors of earlier commands
+            self.read_errors()
+            marker = self.marker()
+            self.send(query)
+            self.send('echo %s' % marker)
+
+            output = []
+            while True:
+                line = self.lines.get(timeout=self.timeout)
+                if line is None:
+                    raise EnvironmentError('hledger repl exited')
+                if line.rstrip('\n').endswith(marker):
+                    output.append(line.rstrip('\n')[:-len(marker)])
+                    break
+                output.append(line)
+
+            if self.read_errors():
+                return None
+
+            # The output is enclosed by the prompts before both commands
+            output = ''.join(output)
+            if self.prompt:
+                if output.startswith(self.prompt):
+                    output = output[len(self.prompt):]
+                if output.endswith(self.prompt):
+                    output = output[:-len(self.prompt)]
+            return output
+
+
+class ReplBackend(object):
+    """Send all queries for a ledger to one persistent hledger process."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.workers = {}
+        self.unsupported = False
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def get_worker(self, ledger):
+        key = os.path.abspath(ledger) if ledger else None
+        with self.lock:
+            if key not in self.workers:
+                self.workers[key] = HledgerRepl(ledger, self.timeout)
+            return self.workers[key]
+
+    def query(self, ledger, query):
+        if self.unsupported:
+            return None
+        # The repl reads only one journal, so queries with their own
+        # -f options have to run in a separate process
+        query_args = split_arg_string(query)
+        if '-f' in query_args or '--file' in query_args:
+            return None
+        worker = self.get_worker(ledger)
+        try:
+            return worker.query(query)
+        except ReplUnsupported:
+            # Old hledger versions lack the repl command
+            self.unsupported = True
+        except (EnvironmentError, Empty):
+            worker.stop()
+        return None
+
+    def close(self):
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers = {}
+
+
+class IndexBackend(object):
+    """Answer balance and csv register queries from a journal index.
+
+    Each ledger is parsed once into a columnar index, see journal.py, which
+    is saved in index_dir and used until one of its files changes. Queries
+    the index can't answer, and all queries on journals it can't read, go
+    to hledger.
+    """
+
+    def __init__(self, timeout=None, index_dir=None):
+        self.index_dir = index_dir
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def get_index(self, ledger):
+        """Return the index of ledger or None if it is unsupported."""
+        key = os.path.abspath(os.path.expanduser(ledger or
+                                                 default_ledger()))
+        with self.lock:
+            entry = self.indexes.get(key)
+            if entry and file_stats(entry[0]) == entry[1]:
+                return entry[2]
+            try:
+                index = load_index(key, self.index_dir)
+                files = index.files
+            except Unsupported:
+                index = None
+                files = ledger_files(key) or [key]
+            self.indexes[key] = (files, file_stats(files), index)
+            return index
+
+    def query(self, ledger, query):
+        query_args = split_arg_string(query)
+        if '-f' in query_args or '--file' in query_args:
+            return None
+        index = self.get_index(ledger)
+        if index is None:
+            return None
+        return index.query(query)
+
+
+BACKENDS = {
+    'repl': ReplBackend,
+    'index': IndexBackend,
+}
+
+_backends = {}
+
+
+def get_backend(name, **options):
+    """Return a shared backend instance or None for the subprocess path."""
+    if not name or name == 'subprocess':
+        return None
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend %s' % name)
+    if name not in _backends:
+        _backends[name] = BACKENDS[name](**options)
+    return _backends[name]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""Render or save many reports concurrently."""
+
+import os
+import fnmatch
+
+from .graph import schedule
+from .pool import RenderPool
+
+
+def match_reports(config, pattern=None):
+    """Return sorted names of stored reports matching a glob pattern."""
+    names = sorted(config.get_stored_reports() or {})
+    if not pattern:
+        return names
+    return [name for name in names if fnmatch.fnmatchcase(name, pattern)]
+
+
+def default_jobs(config):
+    jobs = config.data.get('global', {}).get('jobs', None)
+    if not jobs:
+        # Workers mostly wait on subprocesses, so use more than one per CPU
+        jobs = min(32, (os.cpu_count() or 1) + 4)
+    return int(jobs)
+
+
+def default_processes(config):
+    """Return the number of render processes, 0 renders in threads."""
+    processes = getattr(config, 'processes', None)
+    if processes is None:
+        processes = config.data.get('global', {}).get('processes', None)
+    return int(processes or 0)
+
+
+def process_reports(hreport, names, save=False, jobs=None):
+    """Render or save reports on a bounded pool of worker threads.
+
+    The hledger and pandoc subprocesses started by Hreport.run and
+    Hreport.save release the GIL while waiting, so threads are sufficient
+    to run them in parallel. All workers share the same Hreport and thus
+    the same Jinja environment. Reports with inputs are scheduled after
+    their inputs, see graph.schedule. Results are yielded in the order of
+    names.
+
+    With processes set, templates are rendered in a RenderPool instead.
+    """
+    if not jobs:
+        jobs = default_jobs(hreport.config)
+    processes = default_processes(hreport.config)
+    if not processes:
+        return schedule(hreport, names, save, jobs)
+    return schedule_in_processes(hreport, names, save, jobs, processes)
+
+
+def schedule_in_processes(hreport, names, save, jobs, processes):
+    with RenderPool(hreport, processes, names):
+        for result in schedule(hreport, names, save, jobs):
+            yield result
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+"""On-disk cache for hledger query output."""
+
+import os
+import io
+import glob
+import hashlib
+import datetime
+import tempfile
+import threading
+import contextlib
+from collections import OrderedDict
+
+from .lines import MappedLines
+
+
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+# Fingerprints of ledgers by path, with the files and stats they hash
+_fingerprints = {}
+
+# Reader prefixes hledger accepts in front of included file names,
+# e.g. "include timeclock:hours.timeclock"
+READER_PREFIXES = ('journal', 'ledger', 'timeclock', 'timedot',
+                   'csv', 'ssv', 'tsv', 'rules')
+
+
+def default_ledger():
+    """Return the ledger hledger reads when no -f option is given."""
+    ledger = os.environ.get('LEDGER_FILE')
+    if not ledger:
+        ledger = os.path.join('~', '.hledger.journal')
+    return ledger
+
+
+def parse_include(line, base):
+    """Return the paths an include directive refers to."""
+    parts = line.split(None, 1)
+    if len(parts) < 2 or parts[0] != 'include':
+        return []
+    target = parts[1].strip()
+    prefix, _, rest = target.partition(':')
+    if rest and prefix in READER_PREFIXES:
+        target = rest
+    target = os.path.join(base, os.path.expanduser(target))
+    return sorted(glob.glob(target, recursive=True))
+
+
+def walk_ledger(ledger):
+    """Yield path, stat and content of a ledger and its included files.
+
+    Each file is stat'ed before it is read, so a change while reading
+    shows in the next stat.
+    """
+    seen = set()
+    pending = [os.path.abspath(os.path.expanduser(ledger))]
+    while pending:
+        path = pending.pop(0)
+        if path in seen or not os.path.isfile(path):
+            continue
+        seen.add(path)
+        with io.open(path, 'rb') as ledger_file:
+            stat = os.fstat(ledger_file.fileno())
+            data = ledger_file.read()
+        yield path, stat, data
+
+        base = os.path.dirname(path)
+        for line in data.splitlines():
+            if line.startswith(b'include'):
+                line = line.decode('utf-8', 'replace')
+                pending.extend(parse_include(line, base))
+
+
+def ledger_files(ledger):
+    """Return a ledger and all files it includes."""
+    return [path for path, stat, data in walk_ledger(ledger)]
+
+
+def file_stats(paths):
+    """Return mtime and size of each path, None for missing ones."""
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((stat.st_mtime_ns, stat.st_size))
+        except EnvironmentError:
+            stats.append(None)
+    return stats
+
+
+def ledger_fingerprint(ledger):
+    """Hash path, mtime, size and content of a ledger and its includes.
+
+    The fingerprint is kept for the life of the process and returned
+    without reading the files again as long as their mtimes and sizes are
+    unchanged. Returns None if the ledger does not exist.
+    """
+    ledger = os.path.abspath(os.path.expanduser(ledger))
+    entry = _fingerprints.get(ledger)
+    if entry and file_stats(entry[0]) == entry[1]:
+        return entry[2]
+
+    digest = hashlib.sha256()
+    files, stats = [], []
+    for path, stat, data in walk_ledger(ledger):
+        files.append(path)
+        stats.append((stat.st_mtime_ns, stat.st_size))
+        digest.update(('%s:%s:%s:' % (path, stat.st_mtime,
+                                      stat.st_size)).encode('utf-8'))
+        digest.update(hashlib.sha256(data).digest())
+    if not files:
+        return None
+    fingerprint = digest.hexdigest()
+    _fingerprints[ledger] = (files, stats, fingerprint)
+    return fingerprint
+
+
+class QueryCache(object):
+    """Size bounded LRU cache of query results.
+
+    Each result is stored in its own file named after the key. Reading an
+    entry bumps its mtime, so the least recently used entries are evicted
+    first once the directory grows beyond max_size bytes.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, cmd, ledger=None):
+        """Return the cache key of cmd run against ledger.
+
+        Returns None if the result can not be cached. The current date is
+        part of the key because hledger resolves relative periods such as
+        "thismonth" against it.
+        """
+        fingerprint = ledger_fingerprint(ledger or default_ledger())
+        if not fingerprint:
+            return None
+        digest = hashlib.sha256()
+        digest.update(cmd.encode('utf-8'))
+        digest.update(datetime.date.today().isoformat().encode('utf-8'))
+        digest.update(fingerprint.encode('utf-8'))
+        return digest.hexdigest()
+
+    def period_key(self, cmd, ledger=None):
+        """Return the cache key of cmd on a closed period of ledger.
+
+        Transactions of a closed period are not expected to change, so
+        neither the ledger's content nor the date is part of the key.
+        """
+        ledger = os.path.abspath(os.path.expanduser(ledger or
+                                                    default_ledger()))
+        digest = hashlib.sha256()
+        digest.update(b'period\0')
+        digest.update(cmd.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(ledger.encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def index_path(self, key):
+        """Return the file with the line offsets of an entry."""
+        return os.path.join(self.directory, '.%s.lines' % key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with io.open(path, encoding='utf-8') as cache_file:
+                output = cache_file.read()
+        except EnvironmentError:
+            return None
+        try:
+            os.utime(path, None)
+        except EnvironmentError:
+            pass
+        return output
+
+    def lines(self, key):
+        """Return the lines of an entry without reading them, or None.
+
+        The entry is memory mapped, see MappedLines.
+        """
+        path = self.path(key)
+        try:
+            lines = MappedLines(path, self.index_path(key))
+        except (EnvironmentError, ValueError):
+            return None
+        try:
+            os.utime(path, None)
+        except EnvironmentError:
+            pass
+        return lines
+
+    def set(self, key, output):
+        with self.writer(key) as cache_file:
+            cache_file.write(output.encode('utf-8'))
+
+    @contextlib.contextmanager
+    def writer(self, key):
+        """Return a binary file that becomes the entry of key once it is
+        closed without errors."""
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        # Write to a temporary file first so readers never see partial data
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                            prefix='.tmp')
+        try:
+            with io.open(handle, 'wb') as cache_file:
+                yield cache_file
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.remove(self.index_path(key))
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def remove(self, path):
+        try:
+            os.unlink(path)
+        except EnvironmentError:
+            return False
+        return True
+
+    def entries(self):
+        """Return (mtime, size, path) of all entries, oldest first."""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except EnvironmentError:
+            return entries
+        for entry_name in names:
+            if entry_name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, entry_name)
+            try:
+                stat = os.stat(path)
+            except EnvironmentError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            if not self.remove(path):
+                continue
+            self.remove(self.index_path(os.path.basename(path)))
+            size -= entry_size
+
+    def clear(self):
+        for mtime, size, path in self.entries():
+            self.remove(path)
+            self.remove(self.index_path(os.path.basename(path)))
+
+
+class MemoryCache(object):
+    """Keep the most recently used results of a QueryCache in memory.
+
+    Keys are those of the wrapped cache, so changed ledgers still miss.
+    At most max_size characters of output are kept.
+    """
+
+    def __init__(self, cache, max_size=DEFAULT_MAX_SIZE):
+        self.cache = cache
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def key(self, cmd, ledger=None):
+        return self.cache.key(cmd, ledger)
+
+    def period_key(self, cmd, ledger=None):
+        return self.cache.period_key(cmd, ledger)
+
+    def get(self, key):
+        with self.lock:
+            output = self.entries.get(key)
+            if output is not None:
+                self.entries.move_to_end(key)
+                return output
+        output = self.cache.get(key)
+        if output is not None:
+            self.remember(key, output)
+        return output
+
+    def set(self, key, output):
+        self.cache.set(key, output)
+        self.remember(key, output)
+
+    def lines(self, key):
+        return self.cache.lines(key)
+
+    @contextlib.contextmanager
+    def writer(self, key):
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+        with self.cache.writer(key) as cache_file:
+            yield cache_file
+
+    def remember(self, key, output):
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = output
+            self.size += len(output)
+            while self.size > self.max_size and len(self.entries) > 1:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.size = 0
+        self.cache.clear()
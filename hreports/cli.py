@@ -4,10 +4,12 @@
 
 import os
 import click
-import yaml
 
-from .hreports import Hreport
-from .config import Config
+from .config import load_config
+
+# Modules needed to render reports (jinja2, subprocess, ...) are imported by
+# the commands that use them. Keep it that way: shell completion and prompt
+# integrations run this module all the time.
 
 
 def composed(*decs):
@@ -27,10 +29,116 @@ common = composed(click.option('--query', '-q', required=False),
                   click.option('--filename', '-f', required=False),
                   click.option('--ledger', '-l', required=False),
                   click.option('--desc', '-d', required=False),
+                  click.option('--output-format', '-O', required=False,
+                               type=click.Choice(['csv', 'json'])),
                   click.option('--variables', '-var', required=False,
                                type=(str, str), multiple=True)
                   )
 
+cache_options = composed(click.option('--no-cache', is_flag=True,
+                                      help='Do not use cached query results'),
+                         click.option('--refresh', is_flag=True,
+                                      help='Rerun queries and update the '
+                                           'cache')
+                         )
+
+
+def set_cache_options(config, no_cache, refresh):
+    config.use_cache = not no_cache
+    config.refresh_cache = refresh
+
+
+def get_hreport(config):
+    from .hreports import Hreport
+    return Hreport(config)
+
+
+def echo_saved(hreport, output_file, skipped=None):
+    if skipped is None:
+        skipped = output_file in hreport.skipped
+    if skipped:
+        click.echo('Skipped %s (up to date)' % output_file)
+    else:
+        click.echo('Saved %s' % output_file)
+
+
+def ask_daemon(config, command, name):
+    """Return the reply of a running daemon or None to work locally."""
+    if not getattr(config, 'use_daemon', True) or config.verbose or \
+            getattr(config, 'timings', None):
+        return None
+    from .daemon import get_socket_path, send_request
+
+    reply = send_request(get_socket_path(config), {
+        'command': command,
+        'name': name,
+        'config': os.path.abspath(config.cfg_file),
+        'cwd': os.getcwd(),
+        'use_cache': config.use_cache,
+        'refresh_cache': config.refresh_cache,
+        'force': config.force_save,
+    })
+    if not reply or reply.get('fallback'):
+        return None
+    if 'error' in reply:
+        if reply.get('usage'):
+            raise click.UsageError(reply['error'])
+        raise click.ClickException(reply['error'])
+    return reply
+
+
+def run_batch(config, pattern, save, jobs, changed=()):
+    from .batch import match_reports, process_reports
+    from .graph import ReportGraph
+
+    names = match_reports(config, pattern)
+    if not names:
+        raise click.UsageError('No reports match %s' % pattern)
+
+    hreport = get_hreport(config)
+    if changed:
+        affected = ReportGraph(hreport).affected_by(changed)
+        names = [name for name in names if name in affected]
+        if not names:
+            click.echo('No reports use %s' % ', '.join(changed))
+            return
+    failed = echo_results(hreport, process_reports(hreport, names, save,
+                                                   jobs), save)
+    if failed:
+        raise click.ClickException('%s of %s reports failed' %
+                                   (len(failed), len(names)))
+
+
+def echo_results(hreport, results, save):
+    """Echo results of process_reports and return the failed names."""
+    failed = []
+    for name, result, error in results:
+        if error:
+            failed.append(name)
+            click.secho('%s failed: %s' % (name, error), fg='red',
+                        err=True)
+        elif save:
+            echo_saved(hreport, result)
+        else:
+            click.secho(name, fg='green')
+            click.echo(result)
+    return failed
+
+
+def start_timings(context, show_timings, profile):
+    """Return a Timings reported when the command is done."""
+    from .timings import Timings
+    timings = Timings()
+
+    def report():
+        if show_timings:
+            click.echo(timings.format_summary(), err=True)
+        if profile:
+            timings.write(profile)
+            click.echo('Wrote profile %s' % profile, err=True)
+    context.call_on_close(report)
+    return timings
+
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -52,12 +160,26 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 @click.option('--ledger', '-l', metavar='FILE', required=False,
               type=click.Path(exists=True),
               help='Use FILE ledger')
+@click.option('--timings', 'show_timings', is_flag=True,
+              help='Print the time spent in each stage')
+@click.option('--profile', metavar='FILE', type=click.Path(),
+              help='Write a Chrome trace to FILE, or a speedscope profile '
+                   'if FILE ends with .speedscope.json')
+@click.option('--no-daemon', is_flag=True,
+              help='Do not hand reports to a running hreports serve')
 @click.version_option()
 @click.pass_context
 def main(context, config_info, config_file, ledger, verbose,
-         query, report_config):
+         query, report_config, show_timings, profile, no_daemon):
     """Manage hledger queries."""
-    config = Config(config_file)
+    if show_timings or profile:
+        timings = start_timings(context, show_timings, profile)
+        with timings.span('config', config_file or 'default'):
+            config = load_config(config_file)
+        config.timings = timings
+    else:
+        config = load_config(config_file)
+    config.use_daemon = not no_daemon
     context.obj = config
     click.echo(ledger)
     context.obj.ledger = ledger
@@ -66,17 +188,19 @@ def main(context, config_info, config_file, ledger, verbose,
         config.verbose = True
         click.echo("Config file %s" % config.cfg_file)
     if not context.invoked_subcommand and query:
-        hreport = Hreport(config)
+        hreport = get_hreport(config)
         click.echo("Running %s" % query)
         click.echo(hreport.run(query=query))
     elif report_config:
+        import yaml
         report_content = config.get_stored_reports().get(report_config)
         if not report_content:
             click.echo("%s contains no configuration" % report_config)
         else:
             click.echo(yaml.dump(report_content, default_flow_style=False))
     elif config_info:
-        print(yaml.dump(config.data))
+        import yaml
+        print(yaml.dump(config.as_dict()))
     elif not context.invoked_subcommand:
         config.echo_saved_reports()
 
@@ -117,8 +241,12 @@ def delete(config, name):
 @main.command(short_help='Show report result')
 @click.argument('name', required=False)
 @common
+@cache_options
+@click.option('--stream', is_flag=True,
+              help='Print the report while hledger is still running')
 @click.pass_obj
-def show(config, name, variables, **meta):
+def show(config, name, variables, no_cache, refresh, stream, **meta):
+    set_cache_options(config, no_cache, refresh)
 
     if config.verbose:
         click.echo("Showing report", nl=True)
@@ -127,10 +255,26 @@ def show(config, name, variables, **meta):
         config.echo_saved_reports()
         raise click.UsageError('Nothing to show')
     elif name in config.get_stored_reports() or any(meta.values()):
+        reply = None
+        if name in config.get_stored_reports():
+            # The daemon replies with the whole output, streaming avoids that
+            stream = stream or \
+                (config.get_stored_reports()[name] or {}).get('stream')
+        if not any(meta.values()) and not variables and not stream:
+            reply = ask_daemon(config, 'show', name)
+        if reply:
+            click.echo(reply['output'])
+            return
+
         config.update_report(name, meta=meta, variables=variables,
                              write=False)
-        hreport = Hreport(config)
-        click.echo(hreport.render(name))
+        hreport = get_hreport(config)
+        if stream or hreport.get_report_config_value(name, 'stream'):
+            for chunk in hreport.render_stream(name):
+                click.echo(chunk, nl=False)
+            click.echo()
+        else:
+            click.echo(hreport.render(name))
 
         if config.verbose:
             click.echo('Ran query "%s"' % config.cmd)
@@ -169,25 +313,160 @@ def edit(config, template):
 
         click.edit(filename=template_file)
     else:
-        click.edit(filename=config.cfg_file)
+        click.edit(filename=config.get_edit_file())
 
 
 @click.argument('name', required=False)
 @main.command(short_help='Save report to pdf file')
 @common
+@cache_options
+@click.option('--all', 'save_all', is_flag=True,
+              help='Save all reports or those matching NAME as a pattern')
+@click.option('--jobs', '-j', type=int, required=False,
+              help='Number of reports saved in parallel')
+@click.option('--processes', type=int, required=False,
+              help='Number of processes rendering templates')
+@click.option('--force', is_flag=True,
+              help='Rebuild pdf files that are up to date')
 @click.pass_obj
-def save(config, name, variables, **meta):
-
-    if not name and not any(meta.values()):
+def save(config, name, variables, no_cache, refresh, save_all, jobs,
+         processes, force, **meta):
+    set_cache_options(config, no_cache, refresh)
+    config.force_save = force
+    config.processes = processes
+
+    if save_all:
+        run_batch(config, name, True, jobs)
+    elif not name and not any(meta.values()):
         raise click.UsageError('Nothing to save')
     elif name in config.get_stored_reports() or any(meta.values()):
+        reply = None
+        if not any(meta.values()) and not variables:
+            reply = ask_daemon(config, 'save', name)
+        if reply:
+            echo_saved(None, reply['output'], reply['skipped'])
+            return
+
         config.update_report(name, meta, variables, write=False)
-        hreport = Hreport(config)
+        hreport = get_hreport(config)
         output_file = hreport.save(name)
-        click.echo('Saved %s' % output_file)
+        echo_saved(hreport, output_file)
     elif name not in config.get_stored_reports():
         raise click.UsageError('Report does not exist')
 
 
+@main.command('split-config',
+              short_help='Convert config file into a config directory')
+@click.argument('directory', type=click.Path(exists=False))
+@click.pass_obj
+def split_config(config, directory):
+    """Write all reports into DIRECTORY with one file per report.
+
+    Use the directory with --config-file afterwards.
+    """
+    from .config import DirectoryConfig
+
+    if os.path.exists(directory) and os.listdir(directory):
+        raise click.UsageError('Directory %s is not empty.' % directory)
+    DirectoryConfig.create_from(config, directory)
+    click.echo('Wrote config directory %s' % directory)
+
+
+@main.command(short_help='Keep reports ready for fast show and save')
+@click.option('--socket', 'socket_path', type=click.Path(),
+              help='Listen on this Unix socket')
+@click.pass_obj
+def serve(config, socket_path):
+    """Serve show and save requests of the current config.
+
+    While the daemon runs, show and save of stored reports are handed to
+    it. It keeps the config, compiled templates and recent query results
+    in memory. Stop it with Ctrl-C.
+    """
+    from . import daemon
+
+    socket_path = socket_path or daemon.get_socket_path(config)
+    server = daemon.create_server(config.cfg_file, socket_path)
+    click.echo('Serving %s on %s' % (server.daemon.config_file, socket_path))
+    daemon.serve(server)
+
+
+@main.command(short_help='Rebuild reports when their files change')
+@click.argument('patterns', nargs=-1)
+@click.option('--show', 'show_reports', is_flag=True,
+              help='Print reports instead of saving them')
+@click.option('--jobs', '-j', type=int, required=False,
+              help='Number of reports processed in parallel')
+@click.option('--processes', type=int, required=False,
+              help='Number of processes rendering templates')
+@click.option('--debounce', type=float, default=None, metavar='SECONDS',
+              help='Wait until files stop changing for SECONDS')
+@click.option('--poll', is_flag=True,
+              help='Poll files even if watchdog is installed')
+@click.pass_obj
+def watch(config, patterns, show_reports, jobs, processes, debounce,
+          poll):
+    """Save all reports or those matching the glob PATTERNS and save them
+    again whenever their ledger, an included file, their template or css
+    file changes.
+
+    Stop with Ctrl-C.
+    """
+    from .batch import process_reports
+    from .watch import ReportWatcher, get_watcher, DEBOUNCE
+
+    config.processes = processes
+    watcher = get_watcher(poll)
+    reports = ReportWatcher(config, patterns, watcher,
+                            DEBOUNCE if debounce is None else debounce)
+    if not reports.names:
+        watcher.close()
+        raise click.UsageError('No reports match %s' % ' '.join(patterns))
+
+    save = not show_reports
+    try:
+        for changed, names in reports.runs():
+            if changed:
+                click.echo('Changed %s' % ', '.join(sorted(changed)))
+            hreport = reports.hreport
+            try:
+                echo_results(hreport, process_reports(hreport, names, save,
+                                                      jobs), save)
+            except click.ClickException as exception:
+                click.secho(exception.format_message(), fg='red', err=True)
+            click.echo('Watching for changes')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+@main.command('run-all', short_help='Show or save many reports')
+@click.argument('pattern', required=False)
+@click.option('--save', 'save_reports', is_flag=True,
+              help='Save reports to pdf files')
+@click.option('--jobs', '-j', type=int, required=False,
+              help='Number of reports processed in parallel')
+@click.option('--processes', type=int, required=False,
+              help='Number of processes rendering templates')
+@click.option('--force', is_flag=True,
+              help='Rebuild pdf files that are up to date')
+@click.option('--changed', multiple=True, metavar='FILE',
+              help='Only reports reading FILE and the reports using them')
+@cache_options
+@click.pass_obj
+def run_all(config, pattern, save_reports, jobs, processes, force, changed,
+            no_cache, refresh):
+    """Show all reports or those matching the glob PATTERN.
+
+    Reports are processed after the reports and queries they list as
+    inputs.
+    """
+    set_cache_options(config, no_cache, refresh)
+    config.force_save = force
+    config.processes = processes
+    run_batch(config, pattern, save_reports, jobs, changed)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""Numeric columns of hledger's plain text output."""
+
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# The tokens float() accepts, e.g. "-3", "2e3", "1_000", "inf" or "nan",
+# with surrounding whitespace other than the space tokens are split at
+DIGITS = r'\d(?:_?\d)*'
+NUMBER = (r'[^\S ]*[-+]?(?:(?:%(digits)s(?:\.(?:%(digits)s)?)?|\.%(digits)s)'
+          r'(?:[eE][-+]?%(digits)s)?|(?i:inf(?:inity)?|nan))[^\S ]*' %
+          {'digits': DIGITS})
+
+# The greedy prefix makes a single search find the last number of a line
+LAST_NUMBER_RE = re.compile(r'^.*(?:^| )(%s)(?= |$)' % NUMBER)
+
+LABEL_RE = re.compile(r'\S+')
+
+
+def last_numbers(lines):
+    """Return the last number of each line, None for lines without one.
+
+    Like float() on every space separated token with thousands separators
+    removed, e.g. "1,234.50".
+    """
+    search = LAST_NUMBER_RE.search
+    return [float(match.group(1)) if match else None
+            for match in (search(line.replace(',', '')) for line in lines)]
+
+
+# Below this many keywords testing each of them is faster than a regex
+REGEX_MIN_KEYWORDS = 8
+
+
+class KeywordFactors(object):
+    """Factors for lines or accounts that contain a keyword.
+
+    If several keywords occur, the first one in keywords wins. With many
+    keywords a single regular expression finds the lines that contain any
+    of them, so only those are tested keyword by keyword.
+    """
+
+    def __init__(self, factor, keywords=None):
+        self.factor = factor
+        self.keywords = keywords or {}
+        self.pattern = None
+        if len(self.keywords) >= REGEX_MIN_KEYWORDS:
+            self.pattern = re.compile('|'.join(
+                re.escape(keyword) for keyword in self.keywords))
+
+    def __call__(self, text):
+        if self.pattern and not self.pattern.search(text):
+            return self.factor
+        return self.keyword_factor(text)
+
+    def keyword_factor(self, text):
+        for keyword in self.keywords:
+            if keyword in text:
+                return float(self.keywords[keyword])
+        return self.factor
+
+    def factors(self, texts):
+        """Return the factor of each of texts."""
+        if not self.keywords:
+            return [self.factor] * len(texts)
+        if not self.pattern:
+            return [self.keyword_factor(text) for text in texts]
+        search = self.pattern.search
+        return [self.keyword_factor(text) if search(text) else self.factor
+                for text in texts]
+
+
+def multiply(values, factors):
+    """Multiply values by factors element-wise."""
+    if numpy is not None and values:
+        return (numpy.asarray(values, dtype=float) *
+                numpy.asarray(factors)).tolist()
+    return [value * factor for value, factor in zip(values, factors)]
+
+
+def percentages(values, total):
+    """Return 100 * value / total for values and their running sum."""
+    if values and not total:
+        raise ZeroDivisionError('total is zero')
+    if numpy is not None and values:
+        shares = 100 * (numpy.asarray(values, dtype=float) / total)
+        # cumsum adds in order, like the loop below. Adding 0.0 turns a
+        # sum of -0.0 into 0.0 as starting the loop at 0 does.
+        return shares.tolist(), float(numpy.cumsum(shares)[-1]) + 0.0
+    shares = [100 * (value / total) for value in values]
+    sum_of_shares = 0
+    for share in shares:
+        sum_of_shares += share
+    return shares, sum_of_shares
+
+
+FORMAT = '{:,.2f}'.format
+
+
+def format_value(value):
+    return FORMAT(value)
+
+
+def column_spans(header):
+    """Return (start, stop) of the columns of a table header.
+
+    hledger right aligns labels and cells, so a column ends with its label
+    and starts where the previous one ends. The last column extends to the
+    end of the line.
+    """
+    spans = []
+    start = 0
+    for match in LABEL_RE.finditer(header):
+        spans.append((start, match.end()))
+        start = match.end()
+    if not spans:
+        return [(0, None)]
+    spans[-1] = (spans[-1][0], None)
+    return spans
+
+
+def split_cells(text, spans):
+    """Cut text into the stripped cells of spans."""
+    return [text[start:stop].strip() for start, stop in spans]
+
+
+class TextColumns(object):
+    """Lines of text output and the last number on each of them.
+
+    All lines are parsed in a single pass. Numeric work is done on the
+    list of numbers, with NumPy if it is installed.
+    """
+
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.values = last_numbers(self.lines)
+        self.numbered = [index for index, value in enumerate(self.values)
+                         if value is not None]
+
+    def numbers(self):
+        return [self.values[index] for index in self.numbered]
+
+    def cells(self, values, title=None):
+        """Return a column with values on the numbered lines.
+
+        Other lines get a single space. The first value is replaced by
+        title.
+        """
+        column = [' '] * len(self.lines)
+        for index, value in zip(self.numbered, values):
+            column[index] = value if isinstance(value, str) \
+                else FORMAT(value)
+        if title and self.numbered:
+            column[self.numbered[0]] = title
+        return column
+
+    def multiplied(self, factor, keywords=None):
+        factors = KeywordFactors(factor, keywords).factors(
+            [self.lines[index] for index in self.numbered])
+        return multiply(self.numbers(), factors)
+
+    def append(self, column):
+        """Return the lines with column appended, right aligned."""
+        width = max(map(len, self.lines))
+        column_width = max(map(len, column))
+        return ['%s %s' % (line.ljust(width), cell.rjust(column_width))
+                for line, cell in zip(self.lines, column)]
@@ -4,17 +4,57 @@
 
 import os
 import copy
-import yaml
+import time
+import marshal
+from collections.abc import MutableMapping
+from urllib.parse import quote
 import click
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 
 APP_NAME = 'hreports'
 
+SNAPSHOT_VERSION = 1
+
+# A config file changed less than this many seconds ago could change again
+# without changing its mtime on file systems with coarse timestamps
+SNAPSHOT_MIN_AGE = 2
+
+
+def get_cache_dir():
+    """Return the default directory for caches of hreports."""
+    return os.path.join(click.get_app_dir(APP_NAME), 'cache')
+
+
+def get_snapshot_file(cfg_file):
+    """Return the snapshot file of a config, named after its path."""
+    import hashlib
+
+    path = os.path.abspath(cfg_file).encode('utf-8')
+    return os.path.join(get_cache_dir(), '.snapshots',
+                        hashlib.sha256(path).hexdigest())
+
+
+def yaml_loader(yaml):
+    """Return the C accelerated yaml loader if libyaml is available."""
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def yaml_dumper(yaml):
+    return getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
 
 class Config(object):
 
     def __init__(self, config_file=None):
         self.verbose = False
+        self.use_cache = True
+        self.refresh_cache = False
+        self.force_save = False
         self.data = {'global': {}, 'reports': {}}
         self.cfg_file = config_file
         self.read_config()
@@ -22,6 +62,16 @@ class Config(object):
     def get_stored_reports(self):
         return self.data.get('reports')
 
+    def get_config_dir(self):
+        """Return the directory that holds templates and styling."""
+        return os.path.dirname(self.cfg_file)
+
+    def get_edit_file(self):
+        return self.cfg_file
+
+    def as_dict(self):
+        return self.data
+
     def store_report_data(self, name, data):
         if name not in self.data.get('reports').keys():
             self.data.get('reports')[name] = {}
@@ -62,14 +112,88 @@ class Config(object):
         if write:
             self.write_config()
 
+    def get_snapshot_file(self):
+        return get_snapshot_file(self.cfg_file)
+
+    def get_config_stat(self):
+        stat = os.stat(self.cfg_file)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_config_files(self):
+        """Return the files the config is read from."""
+        return [self.cfg_file]
+
+    def get_config_stamp(self):
+        """Return path, mtime and size of the config files.
+
+        The stamp changes whenever one of the files does.
+        """
+        stamp = []
+        for path in self.get_config_files():
+            try:
+                stat = os.stat(path)
+                stamp.append((path, stat.st_mtime_ns, stat.st_size))
+            except EnvironmentError:
+                stamp.append((path, None, None))
+        return stamp
+
+    def read_snapshot(self):
+        """Return the parsed config saved for the current config file.
+
+        Returns None if there is no snapshot or the config file changed
+        since it was taken.
+        """
+        try:
+            with open(self.get_snapshot_file(), 'rb') as snapshot_file:
+                version, stat, data = marshal.load(snapshot_file)
+            if version == SNAPSHOT_VERSION and \
+                    stat == self.get_config_stat():
+                return data
+        except (EnvironmentError, EOFError, ValueError, TypeError):
+            pass
+        return None
+
+    def write_snapshot(self):
+        """Save the parsed config in the cache directory.
+
+        marshal only stores plain data, configs with values it can't store,
+        e.g. YAML dates, are parsed every time.
+        """
+        snapshot_file = self.get_snapshot_file()
+        tmp_file = '%s.%s' % (snapshot_file, os.getpid())
+        try:
+            stat = self.get_config_stat()
+            if time.time() - stat[0] / 1e9 < SNAPSHOT_MIN_AGE:
+                return
+            snapshot = marshal.dumps((SNAPSHOT_VERSION, stat, self.data))
+            os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+            with open(tmp_file, 'wb') as outfile:
+                outfile.write(snapshot)
+            os.replace(tmp_file, snapshot_file)
+        except (EnvironmentError, ValueError):
+            pass
+
     def read_config(self):
         if not self.cfg_file:
             self.cfg_file = os.path.join(click.get_app_dir(APP_NAME),
                                          'config.yaml')
+
+        data = self.read_snapshot()
+        if data:
+            self.data = data
+            if self.verbose:
+                click.echo('Loaded config snapshot of %s' % self.cfg_file)
+            return
+
+        import yaml
+
         try:
-            self.data = yaml.safe_load(open(self.cfg_file))
+            with open(self.cfg_file) as infile:
+                self.data = yaml.load(infile, Loader=yaml_loader(yaml))
 
-            if not self.data:
+            if self.data:
+                self.write_snapshot()
+            else:
                 self.data = {'global': {}, 'reports': {}}
                 self.write_config()
         except yaml.YAMLError as exc:
@@ -82,6 +206,7 @@ class Config(object):
             click.echo('Loaded config file %s' % self.cfg_file)
 
     def write_config(self):
+        import yaml
 
         config_dir = os.path.dirname(self.cfg_file)
 
@@ -92,10 +217,12 @@ class Config(object):
                 os.makedirs(config_dir)
 
         with open(self.cfg_file, 'w') as outfile:
-            yaml.safe_dump(self.data, outfile,
-                           encoding='utf-8',
-                           default_flow_style=False,
-                           allow_unicode=True)
+            yaml.dump(self.data, outfile,
+                      Dumper=yaml_dumper(yaml),
+                      encoding='utf-8',
+                      default_flow_style=False,
+                      allow_unicode=True)
+        self.write_snapshot()
 
         if self.verbose:
             click.echo('Config file updated at %s.' % self.cfg_file)
@@ -118,3 +245,213 @@ class Config(object):
                             )
             else:
                 click.secho('%s' % report_name, fg='green')
+
+
+def read_yaml(path, default=None):
+    import yaml
+
+    try:
+        with open(path) as infile:
+            data = yaml.load(infile, Loader=yaml_loader(yaml))
+    except EnvironmentError:
+        return default
+    if data is None:
+        return default
+    return data
+
+
+def write_yaml(path, data):
+    """Replace path atomically, so readers never see a partial file."""
+    import tempfile
+    import yaml
+
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        prefix='.tmp')
+    with os.fdopen(handle, 'w') as outfile:
+        yaml.dump(data, outfile,
+                  Dumper=yaml_dumper(yaml),
+                  encoding='utf-8',
+                  default_flow_style=False,
+                  allow_unicode=True)
+    os.replace(tmp_path, path)
+
+
+class ReportStore(MutableMapping):
+    """Reports of a config directory, loaded one file at a time.
+
+    Names and descriptions come from the index. A report file is only read
+    when the report is accessed. Changes are collected until write().
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = read_yaml(self.get_index_file(), {})
+        self.loaded = {}
+        self.changed = set()
+        self.deleted = set()
+
+    def get_index_file(self):
+        return os.path.join(self.directory, 'index.yaml')
+
+    def get_report_file(self, name):
+        return os.path.join(self.directory, 'reports',
+                            '%s.yaml' % quote(name, safe=''))
+
+    def __getitem__(self, name):
+        if name not in self.index:
+            raise KeyError(name)
+        if name not in self.loaded:
+            self.loaded[name] = read_yaml(self.get_report_file(name), {})
+        return self.loaded[name]
+
+    def __setitem__(self, name, value):
+        self.loaded[name] = value
+        self.index[name] = value.get('desc')
+        self.mark_changed(name)
+
+    def __delitem__(self, name):
+        del self.index[name]
+        self.loaded.pop(name, None)
+        self.changed.discard(name)
+        self.deleted.add(name)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def mark_changed(self, name):
+        self.changed.add(name)
+        self.deleted.discard(name)
+        self.index[name] = self.loaded.get(name, {}).get('desc')
+
+    def descriptions(self):
+        return dict(self.index)
+
+    def write(self):
+        """Write changed reports and merge them into the index on disk.
+
+        The index is re-read under an exclusive lock, so reports created or
+        deleted by others in the meantime are kept.
+        """
+        if not self.changed and not self.deleted:
+            return
+        report_dir = os.path.join(self.directory, 'reports')
+        if not os.path.exists(report_dir):
+            os.makedirs(report_dir)
+
+        for name in self.changed:
+            write_yaml(self.get_report_file(name), self.loaded[name])
+
+        with open(os.path.join(self.directory, '.index.lock'), 'w') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            index = read_yaml(self.get_index_file(), {})
+            for name in self.changed:
+                index[name] = self.index.get(name)
+            for name in self.deleted:
+                index.pop(name, None)
+                try:
+                    os.unlink(self.get_report_file(name))
+                except EnvironmentError:
+                    pass
+            write_yaml(self.get_index_file(), index)
+            self.index = index
+
+        self.changed = set()
+        self.deleted = set()
+
+
+class DirectoryConfig(Config):
+    """Config stored in a directory with one file per report.
+
+    The directory holds global.yaml with the global section, index.yaml
+    with the names and descriptions of all reports and one file per
+    report in reports/. Commands only read and write the files of the
+    reports they use.
+    """
+
+    def get_config_dir(self):
+        return self.cfg_file
+
+    def get_global_file(self):
+        return os.path.join(self.cfg_file, 'global.yaml')
+
+    def get_edit_file(self):
+        return self.get_global_file()
+
+    def get_config_files(self):
+        reports = self.get_stored_reports()
+        report_dir = os.path.join(self.cfg_file, 'reports')
+        try:
+            report_files = sorted(os.listdir(report_dir))
+        except EnvironmentError:
+            report_files = []
+        return [self.get_global_file(), reports.get_index_file()] + \
+            [os.path.join(report_dir, name) for name in report_files]
+
+    def read_config(self):
+        self.data = {'global': read_yaml(self.get_global_file(), {}),
+                     'reports': ReportStore(self.cfg_file)}
+        if self.verbose:
+            click.echo('Loaded config directory %s' % self.cfg_file)
+
+    def write_config(self):
+        if not os.path.exists(self.cfg_file):
+            os.makedirs(self.cfg_file)
+        if not os.path.exists(self.get_global_file()):
+            write_yaml(self.get_global_file(), self.data.get('global'))
+        self.get_stored_reports().write()
+
+        if self.verbose:
+            click.echo('Config directory updated at %s.' % self.cfg_file)
+
+    def store_report_data(self, name, data):
+        super(DirectoryConfig, self).store_report_data(name, data)
+        self.get_stored_reports().mark_changed(name)
+
+    def as_dict(self):
+        reports = self.get_stored_reports()
+        return {'global': self.data.get('global'),
+                'reports': dict((name, reports[name]) for name in reports)}
+
+    def echo_saved_reports(self):
+        descriptions = self.get_stored_reports().descriptions()
+        if not descriptions:
+            click.secho('No reports saved.', fg='red')
+            return
+        click.echo('Stored reports:')
+        report_names = sorted(descriptions)
+        report_name_length = max([len(name) for name in report_names])
+
+        for report_name in report_names:
+            if descriptions.get(report_name):
+                click.secho(report_name.ljust(report_name_length),
+                            fg='green', nl=False)
+                click.secho(' -- %s' % descriptions.get(report_name))
+            else:
+                click.secho('%s' % report_name, fg='green')
+
+    @classmethod
+    def create_from(cls, config, directory):
+        """Write the reports of a config file into a config directory."""
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        target = cls(directory)
+        target.data['global'] = config.data.get('global') or {}
+        write_yaml(target.get_global_file(), target.data['global'])
+        for name, report in (config.get_stored_reports() or {}).items():
+            target.get_stored_reports()[name] = copy.deepcopy(report)
+        target.write_config()
+        return target
+
+
+def load_config(config_file=None):
+    """Return a DirectoryConfig for directories, otherwise a Config."""
+    if config_file and os.path.isdir(config_file):
+        return DirectoryConfig(config_file)
+    return Config(config_file)
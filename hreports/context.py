@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Lazily rendered template context."""
+
+import threading
+from collections import ChainMap
+from collections.abc import Mapping
+
+
+class LazyDict(Mapping):
+    """Config section whose strings are rendered on first access."""
+
+    def __init__(self, data, render, lock):
+        self.data = data or {}
+        self.render = render
+        self.lock = lock
+        self.rendered = {}
+
+    def __getitem__(self, key):
+        with self.lock:
+            if key in self.rendered:
+                return self.rendered[key]
+            value = self.data[key]
+            if isinstance(value, str):
+                value = self.render(value)
+            self.rendered[key] = value
+            return value
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class ReportInputs(Mapping):
+    """Outputs of the inputs a report declares, computed on access."""
+
+    def __init__(self, hreport, name):
+        self.hreport = hreport
+        self.name = name
+        self.names = hreport.get_inputs(name)
+
+    def __getitem__(self, key):
+        if key not in self.names:
+            raise KeyError(key)
+        return self.hreport.get_input(key, self.name)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+def generate_template(template, context):
+    """Render template against a mapping without copying it.
+
+    Template.render copies the context into a dict, which would render
+    every lazy value. A shared context only reads the names the template
+    looks up. Yields the rendered text piece by piece.
+    """
+    template_context = template.new_context(context, shared=True)
+    return template.root_render_func(template_context)
+
+
+def render_template(template, context):
+    return template.environment.concat(generate_template(template, context))
+
+
+def build_context(hreport, name, builtins):
+    """Return the lazy template context of a report.
+
+    Later layers of the original context take precedence, so they come
+    first in the ChainMap: the report section, report variables, the global
+    section, global variables, builtins and the Jinja globals. As before,
+    the strings of a layer are rendered against the layers after it only,
+    e.g. a report variable that refers to a global variable of the same
+    name gets the global one.
+    """
+    lock = threading.RLock()
+    context = ChainMap()
+
+    def renderer(layer):
+        def render(value):
+            with hreport.span('render_string', value):
+                return render_template(hreport.from_string(value),
+                                       ChainMap(*context.maps[layer + 1:]))
+        return render
+
+    global_config = hreport.get_global_config() or {}
+    report_config = hreport.get_report_config(name) or {}
+
+    context.maps[:] = [
+        {'hreport': hreport,
+         'report': LazyDict(report_config, renderer(0), lock)},
+        LazyDict(report_config.get('variables'), renderer(1), lock),
+        {'global': LazyDict(global_config, renderer(2), lock)},
+        LazyDict(global_config.get('variables'), renderer(3), lock),
+        builtins,
+        hreport.env.globals,
+    ]
+    return context
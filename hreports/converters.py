@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""Converters from rendered markdown to pdf."""
+
+import os
+import io
+import json
+import subprocess
+from urllib.request import Request, urlopen
+from urllib.error import URLError
+
+from click.exceptions import UsageError
+
+
+DEFAULT_SERVER_URL = 'http://localhost:3030'
+
+# Metadata of the document that pandoc passes on to wkhtmltopdf
+WKHTMLTOPDF_OPTIONS = {
+    'papersize': '--page-size',
+    'margin-top': '--margin-top',
+    'margin-bottom': '--margin-bottom',
+    'margin-left': '--margin-left',
+    'margin-right': '--margin-right',
+}
+
+
+def parse_metadata(markdown):
+    """Return the YAML metadata block at the start of a document."""
+    lines = markdown.lstrip().splitlines()
+    if not lines or lines[0].strip() != '---':
+        return {}
+    block = []
+    for line in lines[1:]:
+        if line.strip() in ('---', '...'):
+            break
+        block.append(line)
+    else:
+        return {}
+
+    import yaml
+
+    try:
+        metadata = yaml.safe_load('\n'.join(block))
+    except yaml.YAMLError:
+        return {}
+    return metadata if isinstance(metadata, dict) else {}
+
+
+class PandocConverter(object):
+    """Pass each document to a new pandoc process on stdin.
+
+    pandoc writes the pdf itself, so no temporary files are needed.
+    """
+
+    def __init__(self, pdf_engine=None):
+        self.pdf_engine = pdf_engine
+
+    def command(self, output_file, css=None):
+        cmd = ['pandoc', '-t', 'html5', '-o', output_file]
+        if self.pdf_engine:
+            cmd += ['--pdf-engine', self.pdf_engine]
+        if css:
+            cmd += ['--css', css]
+        return cmd
+
+    def signature(self, output_file, css=None):
+        """Describe how output_file is built, for the build manifest."""
+        return ' '.join(self.command(output_file, css))
+
+    def convert(self, markdown, output_file, css=None):
+        cmd = self.command(output_file, css)
+        try:
+            subprocess.run(cmd, input=markdown.encode('utf-8'),
+                           stdout=subprocess.PIPE, check=True)
+        except OSError:
+            raise UsageError('Pandoc was not found on your system')
+        except subprocess.CalledProcessError:
+            raise UsageError('Pandoc %s returned non-zero exit status' %
+                             ' '.join(cmd))
+        return output_file
+
+
+class PandocServerConverter(object):
+    """Convert documents with a long running pandoc-server.
+
+    pandoc-server turns markdown into standalone html, which is piped
+    through the pdf engine. The engine reads html on stdin and writes the
+    pdf to stdout, page size and margins of the document's metadata are
+    passed to wkhtmltopdf only.
+    """
+
+    def __init__(self, url=DEFAULT_SERVER_URL, pdf_engine='wkhtmltopdf'):
+        self.url = url.rstrip('/')
+        self.pdf_engine = pdf_engine
+
+    def signature(self, output_file, css=None):
+        return 'pandoc-server %s %s' % (self.url, self.pdf_engine)
+
+    def request(self, markdown, css=None):
+        request = {'text': markdown, 'from': 'markdown', 'to': 'html5',
+                   'standalone': True}
+        if css:
+            # Inline the stylesheet, so the pdf engine need not read files
+            with io.open(css, encoding='utf-8') as css_file:
+                style = css_file.read()
+            request['variables'] = {
+                'header-includes': '<style>\n%s\n</style>' % style}
+        return request
+
+    def post(self, path, data):
+        request = Request(self.url + path,
+                          data=json.dumps(data).encode('utf-8'),
+                          headers={'Content-Type': 'application/json',
+                                   'Accept': 'application/json'})
+        try:
+            response = urlopen(request)
+        except URLError as exception:
+            raise UsageError('Pandoc server %s failed: %s' %
+                             (self.url, exception))
+        return json.loads(response.read().decode('utf-8'))
+
+    def pdf_engine_command(self, markdown):
+        cmd = [self.pdf_engine]
+        if os.path.basename(self.pdf_engine).startswith('wkhtmltopdf'):
+            cmd += ['--quiet', '--encoding', 'utf-8']
+            metadata = parse_metadata(markdown)
+            for key, option in sorted(WKHTMLTOPDF_OPTIONS.items()):
+                if metadata.get(key):
+                    cmd += [option, str(metadata.get(key))]
+        return cmd + ['-', '-']
+
+    def html_to_pdf(self, html, markdown):
+        """Return pdf bytes of html, using metadata of the markdown."""
+        cmd = self.pdf_engine_command(markdown)
+        try:
+            result = subprocess.run(cmd, input=html.encode('utf-8'),
+                                    stdout=subprocess.PIPE, check=True)
+        except OSError:
+            raise UsageError('%s was not found on your system' %
+                             self.pdf_engine)
+        except subprocess.CalledProcessError:
+            raise UsageError('%s returned non-zero exit status' %
+                             ' '.join(cmd))
+        return result.stdout
+
+    @staticmethod
+    def output_of(result):
+        if isinstance(result, dict):
+            return result['output']
+        return result
+
+    def to_pdf(self, markdown, css=None):
+        result = self.post('/', self.request(markdown, css))
+        return self.html_to_pdf(self.output_of(result), markdown)
+
+    def write(self, pdf, output_file):
+        with io.open(output_file, 'wb') as outfile:
+            outfile.write(pdf)
+        return output_file
+
+    def convert(self, markdown, output_file, css=None):
+        return self.write(self.to_pdf(markdown, css), output_file)
+
+
+CONVERTERS = {
+    'pandoc': PandocConverter,
+    'pandoc-server': PandocServerConverter,
+}
+
+
+def get_converter(name=None, **options):
+    if not name:
+        name = 'pandoc'
+    if name not in CONVERTERS:
+        raise UsageError('Unknown converter %s' % name)
+    return CONVERTERS[name](**options)
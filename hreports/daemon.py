@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""Resident process answering show and save requests on a Unix socket.
+
+The daemon keeps the parsed config, compiled templates, hledger repl
+processes and recent query results between requests. Requests and replies
+are single lines of JSON.
+"""
+
+import os
+import json
+import socket
+import threading
+import socketserver
+
+import click
+
+from .config import APP_NAME, load_config
+from .cache import MemoryCache
+
+
+def get_socket_path(config):
+    """Return the socket set as socket in the global section or the
+    default one in the app directory."""
+    path = (config.data.get('global') or {}).get('socket')
+    if path:
+        return os.path.expanduser(path)
+    return os.path.join(click.get_app_dir(APP_NAME), 'daemon.sock')
+
+
+def send_request(path, request):
+    """Return the daemon's reply to request or None if none is running."""
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            client.connect(path)
+            client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            with client.makefile('rb') as replies:
+                line = replies.readline()
+        except EnvironmentError:
+            return None
+    finally:
+        client.close()
+    if not line:
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+class Daemon(object):
+    """Config and Hreports shared by all requests.
+
+    Requests are handled one at a time. Each runs in the working directory
+    of its client, with one Hreport per directory as templates and output
+    files can be relative to it. The config is read again when its files
+    change.
+    """
+
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        self.config = load_config(self.config_file)
+        # Requests change the working directory
+        self.config_file = self.config.cfg_file = \
+            os.path.abspath(self.config.cfg_file)
+        self.stamp = self.config.get_config_stamp()
+        self.hreports = {}
+
+    def get_hreport(self, cwd):
+        from .hreports import Hreport
+
+        if self.config.get_config_stamp() != self.stamp:
+            self.load()
+        hreport = self.hreports.get(cwd)
+        if hreport is None:
+            hreport = self.hreports[cwd] = Hreport(self.config)
+        return hreport
+
+    def handle(self, request):
+        """Return the reply to a request."""
+        command = request.get('command')
+        if command == 'ping':
+            return {'config': self.config.cfg_file}
+        if command not in ('show', 'save'):
+            return {'error': 'Unknown command %s' % command}
+        if request.get('config') != self.config_file:
+            # Serving another config, the client works on its own
+            return {'fallback': True}
+
+        with self.lock:
+            try:
+                os.chdir(request['cwd'])
+                return self.run(command, request)
+            except click.ClickException as exception:
+                return {'error': exception.format_message(),
+                        'usage': isinstance(exception, click.UsageError)}
+            except EnvironmentError as exception:
+                return {'error': str(exception)}
+            except Exception as exception:
+                # Any other failure still gets the client a reply
+                return {'error': '%s: %s' % (type(exception).__name__,
+                                             exception)}
+
+    def run(self, command, request):
+        hreport = self.get_hreport(request['cwd'])
+        config = self.config
+        config.use_cache = request.get('use_cache', True)
+        config.refresh_cache = request.get('refresh_cache', False)
+        config.force_save = request.get('force', False)
+
+        cache = hreport.get_query_cache()
+        if cache and not isinstance(cache, MemoryCache):
+            hreport.query_cache = MemoryCache(cache, cache.max_size)
+
+        # Each render starts with fresh query results, which are reused
+        # through the cache as long as the ledgers are unchanged
+        hreport.clear_contexts()
+        hreport.skipped = set()
+
+        name = request.get('name')
+        if name not in config.get_stored_reports():
+            raise click.UsageError('Report does not exist')
+        if command == 'show':
+            return {'output': hreport.render(name)}
+        output_file = hreport.save(name)
+        return {'output': output_file,
+                'skipped': output_file in hreport.skipped}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError:
+            reply = {'error': 'Invalid request'}
+        else:
+            reply = self.server.daemon.handle(request)
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+
+
+def create_server(config_file, path):
+    """Return a server for config_file listening on path.
+
+    A socket left behind by a daemon that is gone is replaced.
+    """
+    if os.path.exists(path):
+        if send_request(path, {'command': 'ping'}) is not None:
+            raise click.UsageError('A daemon is already listening on %s' %
+                                   path)
+        os.unlink(path)
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    umask = os.umask(0o077)
+    try:
+        return DaemonServer(path, Daemon(config_file))
+    finally:
+        os.umask(umask)
+
+
+def serve(server):
+    """Handle requests until interrupted, then remove the socket."""
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(server.server_address)
+        except EnvironmentError:
+            pass
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""Dependencies between reports and a scheduler that follows them."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from click.exceptions import ClickException, UsageError
+
+from .cache import default_ledger, ledger_files
+
+
+class ReportGraph(object):
+    """Reports and named queries with the inputs they declare.
+
+    Reports list their inputs in the config, each input is the name of
+    another report or of a query in the queries of the global section:
+
+        global:
+          queries:
+            net_worth: bal assets liabilities
+        reports:
+          group:
+            template: group.md
+            inputs: [subsidiary_a, subsidiary_b, net_worth]
+    """
+
+    def __init__(self, hreport):
+        self.hreport = hreport
+
+    def is_report(self, name):
+        return name in (self.hreport.config.get_stored_reports() or {})
+
+    def is_query(self, name):
+        return name in self.hreport.get_named_queries()
+
+    def inputs_of(self, name):
+        """Return the declared inputs of a report or named query."""
+        if not self.is_report(name):
+            return []
+        inputs = self.hreport.get_inputs(name)
+        for input_name in inputs:
+            if not self.is_report(input_name) and \
+                    not self.is_query(input_name):
+                raise UsageError('Input %s of report %s is neither a report '
+                                 'nor a query' % (input_name, name))
+        return inputs
+
+    def dependencies(self, names):
+        """Return names and all their inputs, inputs first.
+
+        Raises UsageError if reports depend on each other.
+        """
+        order = []
+        done = set()
+        path = []
+
+        def visit(name):
+            if name in done:
+                return
+            if name in path:
+                cycle = path[path.index(name):] + [name]
+                raise UsageError('Reports depend on each other: %s' %
+                                 ' -> '.join(cycle))
+            path.append(name)
+            for input_name in self.inputs_of(name):
+                visit(input_name)
+            path.pop()
+            done.add(name)
+            order.append(name)
+
+        for name in names:
+            visit(name)
+        return order
+
+    def dependents(self, names):
+        """Return all reports that directly or indirectly use names."""
+        reports = sorted(self.hreport.config.get_stored_reports() or {})
+        users = {}
+        for report in reports:
+            for input_name in self.inputs_of(report):
+                users.setdefault(input_name, []).append(report)
+
+        result = []
+        pending = list(names)
+        while pending:
+            for user in users.get(pending.pop(0), []):
+                if user not in result:
+                    result.append(user)
+                    pending.append(user)
+        return result
+
+    def ledger_of(self, name):
+        """Return the ledger a report or named query reads.
+
+        Named queries without a ledger of their own read the ledgers of the
+        reports using them, so None is returned for them.
+        """
+        if not self.is_report(name):
+            named_query = self.hreport.get_named_query(name)
+            return named_query[1] if named_query else None
+        ledger = self.hreport.get_report_config_value(name, 'ledger')
+        if not ledger:
+            ledger = self.hreport.get_global_config_value('ledger')
+        return ledger or default_ledger()
+
+    def template_files_of(self, name):
+        """Return the template and css file of a report, if any."""
+        if not self.is_report(name):
+            return []
+        files = []
+        template_name = self.hreport.get_report_config_value(name,
+                                                             'template')
+        if template_name:
+            template, error = self.hreport.get_template(template_name)
+            if template is not None and template.filename:
+                files.append(os.path.abspath(template.filename))
+        styling = self.hreport.get_styling(name)
+        if styling:
+            files.append(os.path.abspath(styling))
+        return files
+
+    def files(self, names):
+        """Return the files each of names reads.
+
+        These are its ledger with all included files, and for reports the
+        template and css file.
+        """
+        ledgers = {}
+        files = {}
+        for name in names:
+            ledger = self.ledger_of(name)
+            if not ledger:
+                ledgers[ledger] = []
+            elif ledger not in ledgers:
+                ledgers[ledger] = ledger_files(ledger)
+            files[name] = set(ledgers[ledger]) | \
+                set(self.template_files_of(name))
+        return files
+
+    def affected_by(self, paths):
+        """Return the reports to rebuild after the files in paths changed.
+
+        These are the reports and named queries reading one of the files,
+        directly or through an include, and everything downstream of them.
+        """
+        paths = set(os.path.abspath(os.path.expanduser(path))
+                    for path in paths)
+        reports = sorted(self.hreport.config.get_stored_reports() or {})
+        names = reports + sorted(self.hreport.get_named_queries())
+
+        changed = [name for name, files in self.files(names).items()
+                   if files & paths]
+
+        affected = set(changed) | set(self.dependents(changed))
+        return [name for name in reports if name in affected]
+
+
+def schedule(hreport, names, save=False, jobs=1):
+    """Render or save reports and their inputs in dependency order.
+
+    The queries of all reports have no dependencies and start right away.
+    A report is rendered as soon as its query and its inputs are done, so
+    independent parts of the graph run in parallel. Every input is computed
+    once and shared by all reports that use it.
+
+    Yields (name, result, error) tuples in the order of names.
+    """
+    with hreport.batch():
+        for result in schedule_tasks(hreport, names, save, jobs):
+            yield result
+
+
+def schedule_tasks(hreport, names, save, jobs):
+    graph = ReportGraph(hreport)
+    order = graph.dependencies(names)
+    requested = set(names)
+
+    tasks = {}
+    for name in order:
+        if not graph.is_report(name):
+            # Named queries run once per report, with its ledger
+            continue
+        query = ('query', name)
+        tasks[query] = ([], lambda name=name: hreport.run_queries(name))
+        dependencies = [query]
+        for input_name in graph.inputs_of(name):
+            if graph.is_report(input_name):
+                dependencies.append(('report', input_name))
+                continue
+            node = ('input', input_name, name)
+            tasks[node] = ([], lambda input_name=input_name, name=name:
+                           hreport.get_input(input_name, name))
+            dependencies.append(node)
+        if name in requested and save:
+            function = hreport.save
+        else:
+            function = hreport.render_once
+        tasks[('report', name)] = (
+            dependencies, lambda name=name, function=function: function(name))
+
+    results = {}
+    pending = list(names)
+    for node, result in run_tasks(tasks, jobs):
+        results[node] = result
+        while pending and ('report', pending[0]) in results:
+            name = pending.pop(0)
+            yield (name,) + results[('report', name)]
+
+
+def run_task(function):
+    """Return (result, error), so a failing task does not abort others."""
+    try:
+        return function(), None
+    except ClickException as exception:
+        return None, exception.format_message()
+    except EnvironmentError as exception:
+        return None, str(exception)
+    except Exception as exception:
+        # Errors of templates and filters only fail their report
+        return None, '%s: %s' % (exception.__class__.__name__, exception)
+
+
+def run_tasks(tasks, jobs=1):
+    """Run {node: (dependencies, function)} on a pool of threads.
+
+    A node starts once all its dependencies succeeded, nodes whose
+    dependencies failed are not run. Yields (node, (result, error)) tuples
+    as the nodes finish.
+    """
+    results = {}
+    running = {}
+    waiting = dict(tasks)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while waiting or running:
+            # Tasks are in dependency order, so one pass starts all nodes
+            # that are ready
+            for node, (dependencies, function) in list(waiting.items()):
+                if not all(dependency in results
+                           for dependency in dependencies):
+                    continue
+                del waiting[node]
+                failed = [dependency for dependency in dependencies
+                          if results[dependency][1]]
+                if failed and failed[0][0] == 'query':
+                    # The report's own query failed
+                    results[node] = results[failed[0]]
+                    yield node, results[node]
+                elif failed:
+                    results[node] = (None, 'Input %s failed' %
+                                     failed[0][1])
+                    yield node, results[node]
+                else:
+                    running[executor.submit(run_task, function)] = node
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                results[node] = future.result()
+                yield node, results[node]
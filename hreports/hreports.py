@@ -4,29 +4,65 @@
 
 import os
 from sys import stdout
-import io
 import subprocess
 import datetime
-import tempfile
+import threading
+import contextlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from jinja2 import Environment, ChoiceLoader, \
-    FileSystemLoader, PackageLoader, select_autoescape
+    FileSystemLoader, PackageLoader, FileSystemBytecodeCache, \
+    select_autoescape
 from jinja2.exceptions import TemplateSyntaxError, TemplateNotFound, \
     UndefinedError
 from .template_filters import datetimeformat, german_float, \
     last_day_of_month, substract_days, multiply_last_column, \
     add_percentage_column, round_output, format_table, \
     datetime_strptime
-
-
+from .cache import QueryCache, DEFAULT_MAX_SIZE
+from .backends import get_backend
+from .table import parse_table, PARSERS
+from .context import build_context, render_template, \
+    generate_template, ReportInputs
+from .converters import get_converter
+from .manifest import BuildManifest
+from .graph import ReportGraph
+from .periods import expand_periods, period_options
+from .batch import default_jobs
+from .stream import LineStream
+from .config import APP_NAME, get_cache_dir
+from .timings import NO_SPAN
+
+
+from click import get_app_dir
 from click.parser import split_arg_string
 from click.exceptions import UsageError
 
 
+class LazyBytecodeCache(FileSystemBytecodeCache):
+    """Bytecode cache whose directory is created on the first write."""
+
+    def dump_bytecode(self, bucket):
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            FileSystemBytecodeCache.dump_bytecode(self, bucket)
+        except EnvironmentError:
+            pass
+
+
 class Hreport(object):
     def __init__(self, config):
         self.config = config
-
-        cfg_path = os.path.dirname(self.config.cfg_file)
+        self.timings = getattr(config, 'timings', None)
+        self.query_cache = None
+        self.query_results = {}
+        self.report_results = {}
+        self.cache_keys = {}
+        self.query_results_lock = threading.Lock()
+        self.batches = 0
+        self.render_pool = None
+
+        cfg_path = self.config.get_config_dir()
         self.cfg_templates = os.path.join(cfg_path, 'templates')
 
         loader = ChoiceLoader([
@@ -36,8 +72,12 @@ class Hreport(object):
                     PackageLoader('hreports', 'templates'),
         ])
         self.env = Environment(loader=loader,
-                               autoescape=select_autoescape(['html', 'xml'])
+                               autoescape=select_autoescape(['html', 'xml']),
+                               bytecode_cache=self.get_bytecode_cache()
                                )
+        self.string_templates = {}
+        self.contexts = {}
+        self.skipped = set()
 
         self.env.filters['datetime'] = datetimeformat
         self.env.filters['datetime_strptime'] = datetime_strptime
@@ -49,6 +89,34 @@ class Hreport(object):
         self.env.filters['round_output'] = round_output
         self.env.filters['format_table'] = format_table
 
+        if self.timings:
+            for filter_name, function in list(self.env.filters.items()):
+                self.env.filters[filter_name] = self.timings.wrap(
+                    function, 'filter', filter_name)
+
+    def span(self, category, name, **args):
+        """Time a block if timings are on, see Timings.span."""
+        if self.timings is None:
+            return NO_SPAN
+        return self.timings.span(category, name, **args)
+
+    def get_bytecode_cache(self):
+        """Return a cache for compiled templates in the cache directory.
+
+        Jinja stores a checksum of the template source with the bytecode, so
+        changed templates are recompiled.
+        """
+        return LazyBytecodeCache(os.path.join(self.get_cache_dir(),
+                                              '.bytecode'))
+
+    def from_string(self, string):
+        """Compile a template string once per Hreport."""
+        template = self.string_templates.get(string)
+        if template is None:
+            template = self.string_templates[string] = \
+                self.env.from_string(string)
+        return template
+
     def get_global_config(self):
         return self.config.data.get('global', None)
 
@@ -69,13 +137,58 @@ class Hreport(object):
     def get_global_config_value(self, key):
         return self.config.data.get('global').get(key, None)
 
-    def run(self, name=False, query=False, ledger=False):
+    def get_cache_dir(self):
+        """Return the configured cache directory.
 
+        Query results are stored in it, other caches in hidden
+        subdirectories the query cache leaves alone.
+        """
+        cache_dir = self.get_global_config_value('cache_dir')
+        if not cache_dir:
+            return get_cache_dir()
+        return os.path.expanduser(cache_dir)
+
+    def get_query_cache(self):
+        """Return the query result cache or None if caching is disabled."""
+        if not getattr(self.config, 'use_cache', True):
+            return None
+        if self.get_global_config_value('cache') is False:
+            return None
+        if not self.query_cache:
+            max_size = self.get_global_config_value('cache_size')
+            self.query_cache = QueryCache(self.get_cache_dir(),
+                                          max_size or DEFAULT_MAX_SIZE)
+        return self.query_cache
+
+    def get_backend(self):
+        """Return the configured query backend.
+
+        None stands for running every query in a new hledger process.
+        """
+        name = self.get_global_config_value('backend')
+        options = {}
+        timeout = self.get_global_config_value('backend_timeout')
+        if timeout:
+            options['timeout'] = timeout
+        if name == 'index':
+            options['index_dir'] = os.path.join(self.get_cache_dir(),
+                                                '.index')
+        try:
+            return get_backend(name, **options)
+        except ValueError as exception:
+            raise UsageError(str(exception))
+
+    def prepare_query(self, name=False, query=False, ledger=False,
+                      output_format=None):
+        """Return the hledger command, ledger and rendered query to run.
+
+        Returns None if there is no query.
+        """
         if not query:
             query = self.get_report_config_value(name, 'query')
 
         if not query:
-            return ''
+            return None
 
         if not ledger:
             ledger = self.get_report_config_value(name, 'ledger')
@@ -86,12 +199,296 @@ class Hreport(object):
 
         query = self.render_string(query, name)
 
+        if output_format:
+            query = '%s -O %s' % (query, output_format)
+
         if ledger:
             cmd = 'hledger -f %s %s' % (ledger, query)
         else:
             cmd = 'hledger %s' % query
+        return cmd, ledger, query
+
+    def run(self, name=False, query=False, ledger=False, output_format=None):
+        prepared = self.prepare_query(name, query, ledger, output_format)
+        if not prepared:
+            return ''
+        cmd, ledger, query = prepared
         self.config.cmd = cmd
 
+        # Identical queries share one result until the next render or
+        # batch starts, see batch. Concurrent callers wait for the first
+        # one to finish.
+        output, owner = self.share_result(self.query_results, (ledger, query),
+                                          self.run_command, cmd, ledger,
+                                          query)
+        if not owner:
+            self.config.returncode = 0
+        return output
+
+    def run_lines(self, name=False, query=False, ledger=False,
+                  output_format=None):
+        """Return the output of a query as a sequence of lines.
+
+        Cached output is memory mapped instead of read, so templates only
+        decode the lines they use, e.g. with output|last or output[-5:].
+        """
+        prepared = self.prepare_query(name, query, ledger, output_format)
+        if not prepared:
+            return []
+        cmd, ledger, query = prepared
+
+        with self.query_results_lock:
+            shared = (ledger, query) in self.query_results
+        if not shared and not getattr(self.config, 'refresh_cache', False):
+            cache, cache_key = self.get_cache_key(cmd, ledger, query)
+            if cache_key:
+                lines = cache.lines(cache_key)
+                if lines is not None:
+                    self.config.cmd = cmd
+                    self.config.returncode = 0
+                    return lines
+        return self.run(name, query, ledger, output_format).splitlines()
+
+    def share_result(self, results, key, function, *args):
+        """Call function once per key and share its result.
+
+        Concurrent callers with the same key wait for the first one. Failed
+        calls are not kept, so the next caller tries again. Returns the
+        result and whether this caller computed it.
+        """
+        result, owner = self.claim_result(results, key)
+        if not owner:
+            return result.result(), False
+
+        try:
+            output = function(*args)
+        except BaseException as exception:
+            self.fail_result(results, key, result, exception)
+            raise
+        result.set_result(output)
+        return output, True
+
+    def claim_result(self, results, key):
+        """Return the Future of key and whether the caller computes it."""
+        with self.query_results_lock:
+            result = results.get(key)
+            if result is None:
+                result = results[key] = Future()
+                return result, True
+        return result, False
+
+    def fail_result(self, results, key, result, exception):
+        """Pass exception to the callers waiting for key and forget it."""
+        with self.query_results_lock:
+            results.pop(key, None)
+        result.set_exception(exception)
+
+    def get_periods(self, name):
+        """Return the periods a report is split into, or None."""
+        spec = (self.get_report_config(name) or {}).get('periods')
+        if not spec:
+            return None
+        return expand_periods(spec)
+
+    def run_periods(self, name, periods, output_format=None):
+        """Run the query of a report once per period, in parallel.
+
+        Closed periods are cached independent of changes to the ledger.
+        Returns (period, output) tuples in the order of periods.
+        """
+        prepared = self.prepare_query(name, output_format=output_format)
+        if not prepared:
+            return []
+        cmd, ledger, query = prepared
+        self.config.cmd = cmd
+
+        def run_period(period):
+            dates = period_options(period)
+            return self.share_result(self.query_results,
+                                     (ledger, query + dates),
+                                     self.run_command, cmd + dates, ledger,
+                                     query + dates, period.closed)[0]
+
+        jobs = min(default_jobs(self.config), len(periods))
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            outputs = list(executor.map(run_period, periods))
+        self.config.returncode = 0
+        return list(zip(periods, outputs))
+
+    def run_queries(self, name):
+        """Run the queries of a report, so rendering finds them done."""
+        output_format = self.get_output_format(name)
+        periods = self.get_periods(name)
+        if periods:
+            self.run_periods(name, periods, output_format)
+        else:
+            self.run(name, output_format=output_format)
+
+    def query_keys(self, name):
+        """Return the keys of the query results rendering a report uses,
+        as in self.query_results."""
+        prepared = self.prepare_query(
+            name, output_format=self.get_output_format(name))
+        if not prepared:
+            return []
+        cmd, ledger, query = prepared
+        periods = self.get_periods(name)
+        if not periods:
+            return [(ledger, query)]
+        return [(ledger, query + period_options(period))
+                for period in periods]
+
+    def run_table(self, name=False, query=False, ledger=False,
+                  output_format=None):
+        """Run a query with csv or json output and parse it into a Table."""
+        if not output_format:
+            output_format = self.get_output_format(name) or 'csv'
+        output = self.run(name, query, ledger, output_format)
+        try:
+            return parse_table(output, output_format)
+        except (ValueError, IndexError, KeyError, TypeError) as exception:
+            raise UsageError('Could not parse %s output of %s: %s' %
+                             (output_format, self.config.cmd, exception))
+
+    def get_output_format(self, name):
+        output_format = self.get_report_config_value(name, 'output_format')
+        if output_format and output_format not in PARSERS:
+            raise UsageError('Unsupported output format %s' % output_format)
+        return output_format
+
+    def clear_query_results(self):
+        """Forget results of queries and reports rendered so far."""
+        with self.query_results_lock:
+            self.query_results = {}
+            self.report_results = {}
+            self.cache_keys = {}
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Share results of queries and reports within a render or batch.
+
+        Starting a batch forgets the results of earlier ones, so a long
+        lived Hreport never returns the output of a ledger that changed
+        since. Batches started within a batch, e.g. by rendering the
+        inputs of a report, share the results of the outer one.
+        """
+        with self.query_results_lock:
+            if not self.batches:
+                self.query_results = {}
+                self.report_results = {}
+                self.cache_keys = {}
+            self.batches += 1
+        try:
+            yield
+        finally:
+            with self.query_results_lock:
+                self.batches -= 1
+
+    def get_named_queries(self):
+        return (self.get_global_config() or {}).get('queries') or {}
+
+    def get_inputs(self, name):
+        """Return the names of reports and queries a report uses."""
+        inputs = (self.get_report_config(name) or {}).get('inputs') or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return list(inputs)
+
+    def get_named_query(self, name, report=False):
+        """Return query and ledger of a named query used by report.
+
+        A named query is either a query or a mapping with query and ledger.
+        Without a ledger of its own it runs against the ledger of report.
+        Returns None if there is no such query.
+        """
+        query = self.get_named_queries().get(name)
+        ledger = None
+        if isinstance(query, dict):
+            query, ledger = query.get('query'), query.get('ledger')
+        if not query:
+            return None
+        if not ledger and report:
+            ledger = self.get_report_config_value(report, 'ledger')
+        return query, ledger
+
+    def get_input(self, name, report=False):
+        """Return the output of a report or a named query used by report.
+
+        Each input is computed once and shared by all reports using it.
+        """
+        if name in (self.config.get_stored_reports() or {}):
+            return self.render_once(name)
+        named_query = self.get_named_query(name, report)
+        if not named_query:
+            raise UsageError('Input %s is neither a report nor a query' %
+                             name)
+        query, ledger = named_query
+        return self.run(query=query, ledger=ledger)
+
+    def render_once(self, name):
+        """Render a report once and share the result, like queries."""
+        render = self.render_pool.render if self.render_pool else \
+            self.render
+        return self.share_result(self.report_results, name, render, name)[0]
+
+    def get_cache_key(self, cmd, ledger=None, query=None, closed=False):
+        """Return the query cache and the key of cmd in it.
+
+        The key is None if the result of cmd can not be cached. Queries
+        of closed periods have keys that don't change with the ledger.
+        """
+        cache = self.get_query_cache()
+        if not cache:
+            return None, None
+
+        # Queries reading other files than the ledger can not be cached
+        query_args = split_arg_string(query or '')
+        if '-f' in query_args or '--file' in query_args:
+            return cache, None
+        if closed:
+            return cache, cache.period_key(cmd, ledger)
+        return cache, cache.key(cmd, ledger)
+
+    def run_command(self, cmd, ledger=None, query=None, closed=False):
+        cache, cache_key, output = self.get_cached(cmd, ledger, query,
+                                                   closed)
+        if output is None:
+            output = self.execute(cmd, ledger, query)
+            self.set_cached(cache, cache_key, ledger, query, output)
+        return output
+
+    def get_cached(self, cmd, ledger=None, query=None, closed=False):
+        """Return the query cache, the key of cmd and its cached output.
+
+        The output is None if cmd has to run.
+        """
+        cache, cache_key = self.get_cache_key(cmd, ledger, query, closed)
+
+        if cache_key and not getattr(self.config, 'refresh_cache', False):
+            output = cache.get(cache_key)
+            if output is not None:
+                self.cache_keys[(ledger, query)] = cache_key
+                self.config.returncode = 0
+                return cache, cache_key, output
+        return cache, cache_key, None
+
+    def set_cached(self, cache, cache_key, ledger, query, output):
+        if cache_key:
+            cache.set(cache_key, output)
+            self.cache_keys[(ledger, query)] = cache_key
+
+    def execute(self, cmd, ledger=None, query=None):
+        with self.span('hledger', cmd, rusage=True):
+            return self.execute_query(cmd, ledger, query)
+
+    def execute_query(self, cmd, ledger=None, query=None):
+        backend = self.get_backend()
+        if backend and query is not None:
+            output = backend.query(ledger, query)
+            if output is not None:
+                self.config.returncode = 0
+                return output
+
         try:
             cmd_list = split_arg_string(cmd)
             output = subprocess.check_output(cmd_list)
@@ -110,9 +507,14 @@ class Hreport(object):
     def render_string(self, string, name=False):
         if not string:
             return
-        string_template = self.env.from_string(string)
+        with self.span('render_string', string):
+            return self.render_string_template(string, name)
+
+    def render_string_template(self, string, name=False):
+        string_template = self.from_string(string)
         try:
-            string = string_template.render(self.get_context(name))
+            string = render_template(string_template,
+                                     self.get_context(name))
         except TemplateSyntaxError as exception:
             exception.translated = False
             string = 'Template syntax error in %s: %s' % (string,
@@ -122,80 +524,97 @@ class Hreport(object):
                 exception.message
         return string
 
-    def render_strings_in_dict(self, data_dict, context, section=False):
-        if not data_dict:
-            return context
-        for key, value in data_dict.items():
-            if isinstance(value, str):
-                value_template = self.env.from_string(value)
-                data_dict[key] = value_template.render(context)
-        if section:
-            context.update({section: data_dict})
-        else:
-            context.update(data_dict)
-        return context
-
     def get_context(self, name=False):
-        """Build context data for the template.
+        """Return the context data for templates of a report.
 
-        The template context dict is evaluated in this order:
+        The template context is looked up in this order:
 
-            1. Builtins at {}
-            2. variables of the global section at {}
+            1. report section at {'report'}
+            2. variables of the report section at {}
             3. global section at {'global'}
-            4. variables of the report section {'report'}
-            5 report section at {}
-        """
-        context = {}
-
-        builtins = {'now': datetime.datetime.now()}
-
-        if name:
-            builtins.update({'report_name': name})
-
-        context.update(builtins)
-
-        global_config = self.get_global_config()
-        if 'variables' in global_config:
-            global_variables = global_config.get('variables', {})
-            context = self.render_strings_in_dict(global_variables,
-                                                  context)
-        self.render_strings_in_dict(global_config, context, 'global')
-
-        report_config = self.get_report_config(name)
-        if report_config:
-            report_variables = report_config.get('variables', {})
-            self.render_strings_in_dict(report_variables, context)
+            4. variables of the global section at {}
+            5. Builtins at {}, including the outputs of the report's
+               inputs at {'inputs'}
 
-        self.render_strings_in_dict(report_config, context, 'report')
+        The context is built once per report. Strings in the config are
+        rendered when a template first looks them up, against the entries
+        below their own only.
+        """
+        context = self.contexts.get(name)
+        if context is None:
+            builtins = {'now': datetime.datetime.now()}
 
-        context.update({'hreport': self})
+            if name:
+                builtins.update({'report_name': name,
+                                 'inputs': ReportInputs(self, name)})
 
+            with self.span('context', name or 'global'):
+                context = self.contexts[name] = build_context(self, name,
+                                                              builtins)
         return context
 
-    def render(self, name):
-
-        template_name = self.get_report_config_value(name, 'template')
+    def clear_contexts(self):
+        """Rebuild report contexts on next use, e.g. after config changes."""
+        self.contexts = {}
 
-        if not template_name:
-            return self.run(name)
+    def check_inputs(self, name):
+        if self.get_inputs(name):
+            # Fail early instead of waiting on itself
+            ReportGraph(self).dependencies([name])
 
+    def get_template(self, template_name):
+        """Return the template and an error message if it can't be loaded."""
         try:
-            template = self.env.get_template(template_name)
+            return self.env.get_template(template_name), None
         except TemplateNotFound:
-            result = 'Template %s Not Found' % template_name
-            return result
+            return None, 'Template %s Not Found' % template_name
         except TemplateSyntaxError as exception:
             exception.translated = False
-            result = 'Template syntax error in %s: %s' % (template_name,
-                                                          exception)
-            return result
+            return None, 'Template syntax error in %s: %s' % (template_name,
+                                                              exception)
+
+    def render(self, name):
+        with self.batch():
+            return self.render_report(name)
+
+    def render_report(self, name):
 
-        context = self.get_context(name)
-        context['output'] = self.run(name).splitlines()
+        self.check_inputs(name)
+
+        template_name = self.get_report_config_value(name, 'template')
+        output_format = self.get_output_format(name)
+        periods = self.get_periods(name)
+
+        if periods:
+            periods = self.run_periods(name, periods, output_format)
+            output = '\n\n'.join('%s\n%s' % (period.label, text.rstrip('\n'))
+                                 for period, text in periods)
+            if not template_name:
+                return output
+
+        elif not template_name:
+            return self.run(name, output_format=output_format)
+
+        template, error = self.get_template(template_name)
+        if error:
+            return error
+
+        context = self.get_context(name).new_child()
+        if periods:
+            context['periods'] = [self.period_context(period, text,
+                                                      output_format)
+                                  for period, text in periods]
+            context['output'] = output.splitlines()
+        else:
+            if output_format:
+                context['table'] = self.run_table(
+                    name, output_format=output_format)
+            context['output'] = self.run_lines(
+                name, output_format=output_format)
 
         try:
-            result = template.render(context)
+            with self.span('template', template_name, report=name):
+                result = render_template(template, context)
         except TemplateSyntaxError as exception:
             exception.translated = False
             result = 'Template syntax error in %s: %s' % (template_name,
@@ -205,16 +624,94 @@ class Hreport(object):
                 (exception.message, template_name)
         return result
 
-    def save(self, name):
-        input_file = tempfile.NamedTemporaryFile(dir='.',
-                                                 delete=False)
+    def period_context(self, period, output, output_format=None):
+        """Return what templates get about a period and its output."""
+        context = dict(period._asdict(), output=output.splitlines())
+        if output_format:
+            try:
+                context['table'] = parse_table(output, output_format)
+            except (ValueError, IndexError, KeyError,
+                    TypeError) as exception:
+                raise UsageError('Could not parse %s output of %s: %s' %
+                                 (output_format, self.config.cmd, exception))
+        return context
+
+    def stream(self, name=False, query=False, ledger=False,
+               output_format=None):
+        """Return the output of a query as lines read while hledger runs.
+
+        Streamed output is neither cached nor shared with other reports, so
+        it never has to be held in memory as a whole. Only results that run
+        already holds are reused.
+        """
+        prepared = self.prepare_query(name, query, ledger, output_format)
+        if not prepared:
+            return []
+        cmd, ledger, query = prepared
+        self.config.cmd = cmd
 
-        input_file.close()
+        with self.query_results_lock:
+            result = self.query_results.get((ledger, query))
+        if result is not None and result.done() and not result.exception():
+            return result.result().splitlines()
+        return LineStream(cmd)
 
-        with io.open(input_file.name, 'w',
-                     encoding='utf-8') as input_file:
-            input_file.write(self.render(name))
+    def render_stream(self, name):
+        """Render a report piece by piece as hledger's output arrives.
 
+        The template gets output as a stream of lines, which can be read
+        only once. There is no table.
+        """
+        with self.batch():
+            for chunk in self.stream_report(name):
+                yield chunk
+
+    def stream_report(self, name):
+        self.check_inputs(name)
+
+        if self.get_periods(name):
+            # Periods run in parallel and are rendered together
+            yield self.render(name)
+            return
+
+        template_name = self.get_report_config_value(name, 'template')
+        output = self.stream(name, output_format=self.get_output_format(name))
+
+        if not template_name:
+            for line in output:
+                yield line + '\n'
+            return
+
+        template, error = self.get_template(template_name)
+        if error:
+            yield error
+            return
+
+        context = self.get_context(name).new_child()
+        context['output'] = output
+        try:
+            for chunk in generate_template(template, context):
+                yield chunk
+        except TemplateSyntaxError as exception:
+            exception.translated = False
+            yield 'Template syntax error in %s: %s' % (template_name,
+                                                       exception)
+        except UndefinedError as exception:
+            yield 'Variable UndefinedError %s in template "%s"' % \
+                (exception.message, template_name)
+
+    def get_converter(self):
+        name = self.get_global_config_value('converter')
+        options = {}
+        pdf_engine = self.get_global_config_value('pdf_engine')
+        if pdf_engine:
+            options['pdf_engine'] = pdf_engine
+        url = self.get_global_config_value('pandoc_server')
+        if url and name == 'pandoc-server':
+            options['url'] = url
+        return get_converter(name, **options)
+
+    def get_output_file(self, name):
         output_file = self.get_report_config_value(name, 'filename')
 
         if not output_file and name:
@@ -222,34 +719,74 @@ class Hreport(object):
         if not output_file:
             output_file = 'default.pdf'
 
-        output_file = self.render_string(output_file, name)
+        return self.render_string(output_file, name)
 
-        cmd = 'pandoc "%s" -t html5 -o "%s"' % (input_file.name,
-                                                output_file)
+    def get_styling(self, name):
+        """Return the css file of a report.
 
+        Either the file set as styling or a css file named after the
+        template in the config templates directory.
+        """
         styling = self.get_report_config_value(name, 'styling')
         template_name = self.get_report_config_value(name,
                                                      'template')
         if styling:
-            styling = os.path.join(self.cfg_templates, styling)
-            styling = '--css "%s"' % styling
+            return os.path.join(self.cfg_templates, styling)
         elif template_name:
             styling_default = template_name.split('.')[0] + '.css'
             styling_default_path = os.path.join(self.cfg_templates,
                                                 styling_default)
             if os.path.exists(styling_default_path):
-                cmd = cmd + ' --css %s' % styling_default_path
-        input_file.close()
-        cmd_list = split_arg_string(cmd)
-
-        try:
-            subprocess.check_output(cmd_list)
-
-        except OSError:
-            raise UsageError('Pandoc was not found on your system')
+                return styling_default_path
+        return None
+
+    def get_manifest(self):
+        """Return the build manifest or None if every save rebuilds."""
+        if getattr(self.config, 'force_save', False):
+            return None
+        manifest = self.get_global_config_value('manifest')
+        if manifest is False:
+            return None
+        if not manifest:
+            manifest = os.path.join(get_app_dir(APP_NAME), 'manifest.json')
+        return BuildManifest(os.path.expanduser(manifest))
+
+    def plan_save(self, name, document):
+        """Return how to save a rendered report.
+
+        Returns output file, css file, converter, build manifest and the
+        digest of the inputs. Manifest and digest are None if the pdf has
+        to be rebuilt in any case.
+        """
+        output_file = self.get_output_file(name)
+        css = self.get_styling(name)
+        converter = self.get_converter()
+        manifest = self.get_manifest()
+        digest = None
+        if manifest:
+            digest = manifest.digest(document, css,
+                                     converter.signature(output_file, css))
+        return output_file, css, converter, manifest, digest
 
-        except subprocess.CalledProcessError:
-            raise UsageError('Pandoc %s returned non-zero exit status' % cmd)
+    def save(self, name):
+        """Convert a report to pdf unless the pdf is up to date.
 
-        os.unlink(input_file.name)
+        Outputs that were not rebuilt are added to self.skipped.
+        """
+        with self.batch():
+            return self.save_report(name)
+
+    def save_report(self, name):
+        document = self.render_once(name)
+        output_file, css, converter, manifest, digest = \
+            self.plan_save(name, document)
+        if manifest and manifest.is_current(output_file, digest):
+            self.skipped.add(output_file)
+            return output_file
+
+        with self.span('pandoc', output_file, rusage=True):
+            converter.convert(document, output_file, css)
+
+        if manifest:
+            manifest.record(output_file, digest)
         return output_file
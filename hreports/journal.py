@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+
+"""Columnar index of a journal that answers simple queries without hledger.
+
+Only plain journals are indexed: transactions with explicitly balanced or
+one implicit posting, amounts with a commodity symbol on either side, a
+period as decimal mark and no digit groups, include directives and
+comments. Anything else, e.g. prices, balance assertions, virtual
+postings or other directives, makes the journal unsupported and its
+queries go to hledger.
+"""
+
+import os
+import io
+import re
+import marshal
+import hashlib
+import datetime
+from array import array
+from bisect import bisect_left
+from decimal import Decimal
+
+from click.parser import split_arg_string
+
+from .cache import default_ledger, ledger_fingerprint, parse_include
+from .config import get_cache_dir
+
+
+INDEX_VERSION = 2
+
+DATE_RE = re.compile(r'^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})')
+
+HEADER_RE = re.compile(r'^(?P<date>\d{4}[-/.]\d{1,2}[-/.]\d{1,2})'
+                       r'(?:=\d{4}[-/.]\d{1,2}[-/.]\d{1,2})?'
+                       r'(?:\s+[*!])?(?:\s+\((?P<code>[^)]*)\))?'
+                       r'(?:\s+(?P<description>[^;]*))?(?:;.*)?$')
+
+SYMBOL = r'[^\s\d.,+\-;"@=()\[\]*!]+'
+
+AMOUNT_RE = re.compile(r'^(?P<sign>-?)(?P<left>%s)?(?P<left_space>\s*)'
+                       r'(?P<sign2>-?)(?P<number>\d+(?:\.\d*)?|\.\d+)'
+                       r'(?P<right_space>\s*)(?P<right>%s)?$' %
+                       (SYMBOL, SYMBOL))
+
+# Query prefixes of hledger, acct: is the only one the index understands
+QUERY_PREFIXES = ('acct', 'amt', 'code', 'cur', 'date', 'date2', 'depth',
+                  'desc', 'inacct', 'not', 'note', 'payee', 'real',
+                  'status', 'tag', 'expr', 'any', 'all')
+
+BALANCE_COMMANDS = ('bal', 'balance', 'b')
+
+REGISTER_COMMANDS = ('reg', 'register', 'r')
+
+
+class Unsupported(ValueError):
+    """The journal or query needs hledger."""
+
+
+def parse_date(text):
+    match = DATE_RE.match(text)
+    if not match:
+        raise Unsupported('date %s' % text)
+    try:
+        return datetime.date(*[int(part) for part in match.groups()])
+    except ValueError:
+        raise Unsupported('date %s' % text)
+
+
+def parse_amount(text):
+    """Return commodity, quantity and style of an amount.
+
+    The style is the side of the commodity symbol, L, R or None, and
+    whether it is separated by a space.
+    """
+    match = AMOUNT_RE.match(text)
+    if not match or (match.group('left') and match.group('right')) or \
+            (match.group('sign') and match.group('sign2')):
+        raise Unsupported('amount %s' % text)
+    quantity = Decimal(match.group('number'))
+    if match.group('sign') or match.group('sign2'):
+        quantity = -quantity
+    if match.group('left'):
+        style = ('L', bool(match.group('left_space')))
+    elif match.group('right'):
+        style = ('R', bool(match.group('right_space')))
+    else:
+        style = (None, False)
+    commodity = match.group('left') or match.group('right') or ''
+    return commodity, quantity, style
+
+
+class JournalParser(object):
+    """Read the transactions of a journal and the files it includes."""
+
+    def __init__(self):
+        self.files = []
+        self.transactions = []
+        self.styles = {}
+        self.precisions = {}
+
+    def parse_file(self, path):
+        path = os.path.abspath(os.path.expanduser(path))
+        if path in self.files:
+            return
+        self.files.append(path)
+        with io.open(path, encoding='utf-8') as journal:
+            lines = journal.read().splitlines()
+
+        transaction = None
+        in_comment = False
+        for line in lines:
+            stripped = line.strip()
+            if in_comment:
+                in_comment = stripped != 'end comment'
+                continue
+            if not stripped:
+                transaction = self.finish(transaction)
+                continue
+            if line[0] in ' \t':
+                if stripped[0] in ';#':
+                    continue
+                if transaction is None:
+                    raise Unsupported('indented line %s' % stripped)
+                transaction[3].append(self.parse_posting(stripped))
+                continue
+
+            transaction = self.finish(transaction)
+            if line[0] in ';#*%|':
+                continue
+            if stripped == 'comment':
+                in_comment = True
+            elif line.startswith('include '):
+                for included in parse_include(line,
+                                              os.path.dirname(path)):
+                    self.parse_file(included)
+            elif line[0].isdigit():
+                match = HEADER_RE.match(stripped)
+                if not match:
+                    raise Unsupported('transaction %s' % stripped)
+                transaction = (parse_date(match.group('date')),
+                               match.group('code') or '',
+                               (match.group('description') or '').strip(),
+                               [])
+            else:
+                raise Unsupported('directive %s' % stripped)
+        self.finish(transaction)
+
+    def parse_posting(self, text):
+        if text[:2] in ('* ', '! '):
+            text = text[2:].lstrip()
+        text = text.split(';', 1)[0].rstrip()
+        parts = re.split(r'\t|  +', text, 1)
+        account = parts[0].strip()
+        if not account or account[0] in '([':
+            raise Unsupported('posting %s' % text)
+        if len(parts) < 2 or not parts[1].strip():
+            return account, None
+        commodity, quantity, style = parse_amount(parts[1].strip())
+        self.styles.setdefault(commodity, style)
+        exponent = -quantity.as_tuple().exponent
+        self.precisions[commodity] = max(self.precisions.get(commodity, 0),
+                                         exponent)
+        return account, (commodity, quantity)
+
+    def finish(self, transaction):
+        """Balance a transaction and add it, return None."""
+        if transaction is None:
+            return None
+        date, code, description, postings = transaction
+        missing = [index for index, (account, amount) in enumerate(postings)
+                   if amount is None]
+        sums = {}
+        for account, amount in postings:
+            if amount is not None:
+                sums[amount[0]] = sums.get(amount[0], 0) + amount[1]
+        unbalanced = dict((commodity, total)
+                          for commodity, total in sums.items() if total)
+        if len(missing) > 1 or (missing and len(unbalanced) > 1) or \
+                (not missing and unbalanced):
+            raise Unsupported('transaction on %s' % date)
+        if missing:
+            commodity, total = (list(unbalanced.items()) or
+                                [('', Decimal(0))])[0]
+            self.styles.setdefault(commodity, (None, False))
+            postings[missing[0]] = (postings[missing[0]][0],
+                                    (commodity, -total))
+        self.transactions.append((date, code, description, postings))
+        return None
+
+
+ARRAY_COLUMNS = ('dates', 'transactions', 'account_ids', 'commodity_ids',
+                 'amounts')
+
+
+def dump_array(column):
+    return column.typecode, column.tobytes()
+
+
+def load_array(data):
+    typecode, data = data
+    column = array(typecode)
+    column.frombytes(data)
+    return column
+
+
+class JournalIndex(object):
+    """Postings of a journal in columns sorted by date.
+
+    Amounts are integers in units of the smallest decimal place used for
+    their commodity. For balances each account and commodity has its dates
+    and cumulative amounts, so a balance over any date range takes two
+    binary searches.
+    """
+
+    def __init__(self, parser):
+        self.files = parser.files
+        self.commodities = sorted(parser.styles)
+        self.styles = [parser.styles[commodity] +
+                       (parser.precisions.get(commodity, 0),)
+                       for commodity in self.commodities]
+        self.codes = []
+        self.descriptions = []
+
+        postings = []
+        accounts = set()
+        for number, (date, code, description, transaction_postings) in \
+                enumerate(parser.transactions):
+            self.codes.append(code)
+            self.descriptions.append(description)
+            for account, (commodity, quantity) in transaction_postings:
+                accounts.add(account)
+                postings.append((date.toordinal(), number, account,
+                                 commodity, quantity))
+        # Sorting is stable, postings of a day stay in journal order
+        postings.sort(key=lambda posting: posting[0])
+
+        self.accounts = sorted(accounts)
+        account_ids = dict((account, index)
+                           for index, account in enumerate(self.accounts))
+        commodity_ids = dict((commodity, index) for index, commodity
+                             in enumerate(self.commodities))
+        self.dates = array('l')
+        self.transactions = array('l')
+        self.account_ids = array('l')
+        self.commodity_ids = array('l')
+        self.amounts = array('q')
+        self.series = {}
+        for date, number, account, commodity, quantity in postings:
+            commodity_id = commodity_ids[commodity]
+            amount = int(quantity.scaleb(self.styles[commodity_id][2]))
+            self.dates.append(date)
+            self.transactions.append(number)
+            self.account_ids.append(account_ids[account])
+            self.commodity_ids.append(commodity_id)
+            self.amounts.append(amount)
+
+            key = (account_ids[account], commodity_id)
+            if key not in self.series:
+                self.series[key] = (array('l'), array('q', [0]))
+            dates, totals = self.series[key]
+            dates.append(date)
+            totals.append(totals[-1] + amount)
+        self.series = dict(sorted(self.series.items()))
+
+    def to_data(self):
+        """Return the index as plain data for marshal."""
+        data = dict(self.__dict__)
+        for name in ARRAY_COLUMNS:
+            data[name] = dump_array(data[name])
+        data['series'] = dict(
+            (key, (dump_array(dates), dump_array(totals)))
+            for key, (dates, totals) in self.series.items())
+        return data
+
+    @classmethod
+    def from_data(cls, data):
+        index = cls.__new__(cls)
+        index.__dict__.update(data)
+        for name in ARRAY_COLUMNS:
+            setattr(index, name, load_array(data[name]))
+        index.series = dict(
+            (key, (load_array(dates), load_array(totals)))
+            for key, (dates, totals) in data['series'].items())
+        return index
+
+    def format_amount(self, amounts):
+        """Format {commodity id: amount} the way hledger does.
+
+        Returns None for several commodities.
+        """
+        amounts = dict((commodity_id, amount)
+                       for commodity_id, amount in amounts.items() if amount)
+        if not amounts:
+            return '0'
+        if len(amounts) > 1:
+            return None
+        commodity_id, amount = amounts.popitem()
+        side, spaced, precision = self.styles[commodity_id]
+        whole, fraction = divmod(abs(amount), 10 ** precision)
+        number = '%s%d' % ('-' if amount < 0 else '', whole)
+        if precision:
+            number = '%s.%0*d' % (number, precision, fraction)
+        symbol = self.commodities[commodity_id]
+        space = ' ' if spaced else ''
+        if side == 'L':
+            return symbol + space + number
+        if side == 'R':
+            return number + space + symbol
+        return number
+
+    def matching_accounts(self, patterns):
+        if not patterns:
+            return list(range(len(self.accounts)))
+        return [index for index, account in enumerate(self.accounts)
+                if any(pattern.search(account) for pattern in patterns)]
+
+    def balances(self, patterns, begin=None, end=None):
+        """Return [(account, {commodity id: amount})] of matching accounts
+        with postings from begin up to end."""
+        begin = begin.toordinal() if begin else None
+        end = end.toordinal() if end else None
+        balances = []
+        accounts = set(self.matching_accounts(patterns))
+        for (account_id, commodity_id), (dates, totals) in \
+                self.series.items():
+            if account_id not in accounts:
+                continue
+            low = bisect_left(dates, begin) if begin else 0
+            high = bisect_left(dates, end) if end else len(dates)
+            if low >= high:
+                continue
+            if not balances or balances[-1][0] != account_id:
+                balances.append((account_id, {}))
+            balances[-1][1][commodity_id] = totals[high] - totals[low]
+        return [(self.accounts[account_id], amounts)
+                for account_id, amounts in balances]
+
+    def postings(self, patterns, begin=None, end=None):
+        """Yield txnidx, date, account and amount of matching postings."""
+        low = bisect_left(self.dates, begin.toordinal()) if begin else 0
+        high = bisect_left(self.dates, end.toordinal()) if end \
+            else len(self.dates)
+        accounts = set(self.matching_accounts(patterns))
+        for index in range(low, high):
+            if self.account_ids[index] in accounts:
+                yield (self.transactions[index],
+                       datetime.date.fromordinal(self.dates[index]),
+                       self.accounts[self.account_ids[index]],
+                       self.commodity_ids[index], self.amounts[index])
+
+    def balance_report(self, patterns, begin=None, end=None, csv=False):
+        rows = []
+        total = {}
+        for account, amounts in self.balances(patterns, begin, end):
+            if not any(amounts.values()):
+                # Like hledger without --empty
+                continue
+            amount = self.format_amount(amounts)
+            if amount is None:
+                return None
+            rows.append((account, amount))
+            for commodity_id, value in amounts.items():
+                total[commodity_id] = total.get(commodity_id, 0) + value
+        total = self.format_amount(total)
+        if total is None:
+            return None
+
+        if csv:
+            lines = ['"account","balance"']
+            lines.extend(csv_row(row) for row in rows)
+            lines.append(csv_row(('total', total)))
+        else:
+            width = max([20, len(total)] + [len(amount)
+                                            for account, amount in rows])
+            lines = ['%s  %s' % (amount.rjust(width), account)
+                     for account, amount in rows]
+            lines.append('-' * width)
+            lines.append(total.rjust(width))
+        return '\n'.join(lines) + '\n'
+
+    def register_report(self, patterns, begin=None, end=None):
+        lines = ['"txnidx","date","code","description","account","amount",'
+                 '"total"']
+        total = {}
+        for number, date, account, commodity_id, amount in \
+                self.postings(patterns, begin, end):
+            total[commodity_id] = total.get(commodity_id, 0) + amount
+            running = self.format_amount(total)
+            if running is None:
+                return None
+            lines.append(csv_row((
+                str(number + 1), date.isoformat(), self.codes[number],
+                self.descriptions[number], account,
+                self.format_amount({commodity_id: amount}), running)))
+        return '\n'.join(lines) + '\n'
+
+    def query(self, query):
+        """Return the output of query or None if it needs hledger."""
+        try:
+            command, patterns, begin, end, csv = parse_query(query)
+        except Unsupported:
+            return None
+        if command in BALANCE_COMMANDS:
+            return self.balance_report(patterns, begin, end, csv)
+        if csv:
+            return self.register_report(patterns, begin, end)
+        # The register's text layout depends on the terminal width
+        return None
+
+
+def csv_row(values):
+    return ','.join('"%s"' % value.replace('"', '""') for value in values)
+
+
+def parse_query_date(text):
+    """Return the date of an exact YYYY, YYYY-MM or YYYY-MM-DD."""
+    parts = re.split(r'[-/.]', text)
+    if not 1 <= len(parts) <= 3 or not all(part.isdigit()
+                                           for part in parts):
+        raise Unsupported('date %s' % text)
+    try:
+        return datetime.date(*[int(part) for part in parts + ['1'] *
+                               (3 - len(parts))])
+    except ValueError:
+        raise Unsupported('date %s' % text)
+
+
+def parse_query(query):
+    """Return command, account patterns, begin, end and csv of a query.
+
+    Raises Unsupported for anything but account patterns and the options
+    -b, -e and -O.
+    """
+    args = split_arg_string(query)
+    if not args or args[0] not in BALANCE_COMMANDS + REGISTER_COMMANDS:
+        raise Unsupported(query)
+    options = {}
+    patterns = []
+    rest = args[1:]
+    while rest:
+        arg = rest.pop(0)
+        name, value = arg, None
+        if arg.startswith('--') and '=' in arg:
+            name, value = arg.split('=', 1)
+        elif arg[:2] in ('-b', '-e', '-O') and len(arg) > 2:
+            name, value = arg[:2], arg[2:]
+        name = {'--begin': '-b', '--end': '-e',
+                '--output-format': '-O'}.get(name, name)
+        if name in ('-b', '-e', '-O'):
+            if value is None:
+                if not rest:
+                    raise Unsupported(query)
+                value = rest.pop(0)
+            options[name] = value
+        elif arg.startswith('-'):
+            raise Unsupported(arg)
+        else:
+            prefix, _, pattern = arg.partition(':')
+            if prefix in QUERY_PREFIXES:
+                if prefix != 'acct':
+                    raise Unsupported(arg)
+                arg = pattern
+            try:
+                patterns.append(re.compile(arg, re.IGNORECASE))
+            except re.error:
+                raise Unsupported(arg)
+
+    output_format = options.get('-O', 'txt')
+    if output_format not in ('txt', 'csv'):
+        raise Unsupported(output_format)
+    begin = parse_query_date(options['-b']) if '-b' in options else None
+    end = parse_query_date(options['-e']) if '-e' in options else None
+    return args[0], patterns, begin, end, output_format == 'csv'
+
+
+def get_index_file(ledger, directory=None):
+    """Return the file of the saved index of ledger, named after its path.
+
+    Indexes are saved in directory, by default in the hreports cache.
+    """
+    if not directory:
+        directory = os.path.join(get_cache_dir(), '.index')
+    path = os.path.abspath(ledger).encode('utf-8')
+    return os.path.join(directory, hashlib.sha256(path).hexdigest())
+
+
+def read_index(ledger, directory=None):
+    """Return the saved index of ledger if it is up to date."""
+    try:
+        with open(get_index_file(ledger, directory), 'rb') as index_file:
+            version, fingerprint, data = marshal.load(index_file)
+        if version != INDEX_VERSION or \
+                fingerprint != ledger_fingerprint(ledger):
+            return None
+        return JournalIndex.from_data(data)
+    except (EnvironmentError, EOFError, ValueError, TypeError, KeyError,
+            AttributeError):
+        return None
+
+
+def write_index(ledger, index, directory=None):
+    """Save index, if the directory is writable."""
+    index_file = get_index_file(ledger, directory)
+    tmp_file = '%s.%s' % (index_file, os.getpid())
+    try:
+        data = marshal.dumps((INDEX_VERSION, ledger_fingerprint(ledger),
+                              index.to_data()))
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        with open(tmp_file, 'wb') as outfile:
+            outfile.write(data)
+        os.replace(tmp_file, index_file)
+    except (EnvironmentError, ValueError):
+        pass
+
+
+def load_index(ledger=None, directory=None):
+    """Return the index of a ledger, reading the saved one if it is up to
+    date. Raises Unsupported if the journal needs hledger."""
+    ledger = os.path.abspath(os.path.expanduser(ledger or default_ledger()))
+    index = read_index(ledger, directory)
+    if index is None:
+        parser = JournalParser()
+        try:
+            parser.parse_file(ledger)
+        except (EnvironmentError, UnicodeDecodeError) as exception:
+            raise Unsupported(str(exception))
+        index = JournalIndex(parser)
+        write_index(ledger, index, directory)
+    return index
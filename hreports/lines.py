@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""Lines of a UTF-8 file, read from a memory map when accessed."""
+
+import os
+import io
+import mmap
+from array import array
+from collections.abc import Sequence
+
+
+def line_offsets(data):
+    """Return the offsets at which the lines of data start, followed by
+    the length of data. A trailing newline does not start a line."""
+    offsets = array('q', [0])
+    find = data.find
+    size = len(data)
+    position = find(b'\n')
+    while position != -1 and position + 1 < size:
+        offsets.append(position + 1)
+        position = find(b'\n', position + 1)
+    if size:
+        offsets.append(size)
+    else:
+        offsets = array('q', [0])
+    return offsets
+
+
+def read_offsets(path, size):
+    """Return the offsets saved in path if they belong to size bytes."""
+    try:
+        with open(path, 'rb') as index_file:
+            offsets = array('q')
+            offsets.frombytes(index_file.read())
+    except (EnvironmentError, ValueError):
+        return None
+    if not offsets or offsets[-1] != size:
+        return None
+    return offsets
+
+
+def write_offsets(path, offsets):
+    tmp_path = '%s.%s' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as index_file:
+            offsets.tofile(index_file)
+        os.replace(tmp_path, path)
+    except EnvironmentError:
+        pass
+
+
+class MappedLines(Sequence):
+    """Lines of a file without their line breaks, like str.splitlines on
+    its text for hledger's output.
+
+    Only the offsets of the lines are held in memory. They are saved in
+    index_path, if given, so the file is scanned once. Slices are views
+    of the same file.
+    """
+
+    def __init__(self, path, index_path=None):
+        with io.open(path, 'rb') as data_file:
+            size = os.fstat(data_file.fileno()).st_size
+            # Empty files can't be mapped
+            self.data = mmap.mmap(data_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ) if size else b''
+        self.offsets = index_path and read_offsets(index_path, size)
+        if not self.offsets:
+            self.offsets = line_offsets(self.data)
+            if index_path:
+                write_offsets(index_path, self.offsets)
+        self.start = 0
+        self.stop = len(self.offsets) - 1
+
+    def view(self, start, stop):
+        lines = MappedLines.__new__(MappedLines)
+        lines.data = self.data
+        lines.offsets = self.offsets
+        lines.start = start
+        lines.stop = max(start, stop)
+        return lines
+
+    def line(self, index):
+        line = self.data[self.offsets[index]:self.offsets[index + 1]]
+        if line.endswith(b'\n'):
+            line = line[:-2] if line.endswith(b'\r\n') else line[:-1]
+        return line.decode('utf-8')
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self.view(self.start + start, self.start + stop)
+            return [self[position] for position in range(start, stop, step)]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('line index out of range')
+        return self.line(self.start + index)
+
+    def __iter__(self):
+        for index in range(self.start, self.stop):
+            yield self.line(index)
+
+    def __reversed__(self):
+        for index in range(self.stop - 1, self.start - 1, -1):
+            yield self.line(index)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, MappedLines)):
+            return len(self) == len(other) and \
+                all(line == other_line
+                    for line, other_line in zip(self, other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'MappedLines(%s lines)' % len(self)
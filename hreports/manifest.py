@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""Build manifest to skip conversions whose inputs did not change."""
+
+import io
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class BuildManifest(object):
+    """Digests of the inputs every output file was built from.
+
+    An output is up to date if it still has the size and mtime recorded
+    when it was built and the digest of the rendered document, the css file
+    and the converter command is unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def read(self):
+        try:
+            with io.open(self.path, encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except (EnvironmentError, ValueError):
+            return {}
+
+    @staticmethod
+    def digest(document, css=None, command=''):
+        digest = hashlib.sha256()
+        digest.update(document.encode('utf-8'))
+        digest.update(b'\0')
+        if css:
+            digest.update(css.encode('utf-8'))
+            try:
+                with io.open(css, 'rb') as css_file:
+                    digest.update(css_file.read())
+            except EnvironmentError:
+                pass
+        digest.update(b'\0')
+        digest.update(command.encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def output_stat(output_file):
+        stat = os.stat(output_file)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def is_current(self, output_file, digest):
+        entry = self.read().get(os.path.abspath(output_file))
+        if not entry or entry.get('digest') != digest:
+            return False
+        try:
+            return self.output_stat(output_file) == entry.get('stat')
+        except EnvironmentError:
+            return False
+
+    def record(self, output_file, digest):
+        """Store the digest of a freshly built output file.
+
+        Entries written by other processes in the meantime are kept.
+        """
+        entry = {'digest': digest, 'stat': self.output_stat(output_file)}
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with self.lock, open(self.path + '.lock', 'w') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self.read()
+            manifest[os.path.abspath(output_file)] = entry
+            handle, tmp_path = tempfile.mkstemp(dir=directory,
+                                                prefix='.tmp')
+            with io.open(handle, 'w', encoding='utf-8') as manifest_file:
+                json.dump(manifest, manifest_file, indent=1,
+                          sort_keys=True)
+            os.replace(tmp_path, self.path)
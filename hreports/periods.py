@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Calendar periods a report is split into."""
+
+import datetime
+from collections import namedtuple
+
+from click.exceptions import UsageError
+
+
+# A period runs from begin up to, but not including, end like hledger's
+# -b and -e options
+Period = namedtuple('Period', ['label', 'begin', 'end', 'closed'])
+
+MONTHS = {'month': 1, 'quarter': 3, 'year': 12}
+
+UNITS = ('week',) + tuple(MONTHS)
+
+
+def period_begin(date, every):
+    """Return the first day of the period containing date."""
+    if every == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    month = date.month
+    if every == 'quarter':
+        month = (month - 1) // 3 * 3 + 1
+    elif every == 'year':
+        month = 1
+    return datetime.date(date.year, month, 1)
+
+
+def add_periods(begin, every, count):
+    """Return the first day of the period count periods after begin."""
+    if every == 'week':
+        return begin + datetime.timedelta(weeks=count)
+    years, month = divmod(begin.month - 1 + MONTHS[every] * count, 12)
+    return datetime.date(begin.year + years, month + 1, 1)
+
+
+def period_label(begin, every):
+    if every == 'week':
+        return '%s-W%02d' % begin.isocalendar()[:2]
+    if every == 'quarter':
+        return '%sQ%s' % (begin.year, (begin.month - 1) // 3 + 1)
+    if every == 'year':
+        return str(begin.year)
+    return begin.strftime('%Y-%m')
+
+
+def parse_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.datetime.strptime(str(value), '%Y-%m-%d').date()
+    except ValueError:
+        raise UsageError('Invalid period end %s, use YYYY-MM-DD' % value)
+
+
+def expand_periods(spec, today=None):
+    """Return the periods of a report's periods setting, oldest first.
+
+    The setting is a unit or a mapping with these keys:
+
+        every: week, month, quarter or year, month by default
+        count: number of periods, 1 by default
+        end: a date in the last period, today by default
+        closed_after: days after its end a period counts as closed, 0 by
+                      default
+
+    The output of closed periods is cached until --refresh is used,
+    regardless of changes to the ledger.
+    """
+    if isinstance(spec, str):
+        spec = {'every': spec}
+    if not isinstance(spec, dict):
+        raise UsageError('Invalid periods %s' % (spec,))
+    every = spec.get('every', 'month')
+    if every not in UNITS:
+        raise UsageError('Unknown period %s, use one of %s' %
+                         (every, ', '.join(UNITS)))
+    try:
+        count = int(spec.get('count', 1))
+        closed_after = int(spec.get('closed_after', 0))
+    except (TypeError, ValueError):
+        raise UsageError('Invalid periods %s' % (spec,))
+    if count < 1:
+        raise UsageError('Invalid number of periods %s' % count)
+
+    today = today or datetime.date.today()
+    last = parse_date(spec['end']) if spec.get('end') else today
+    first = add_periods(period_begin(last, every), every, 1 - count)
+    settled = today - datetime.timedelta(days=closed_after)
+
+    periods = []
+    for index in range(count):
+        begin = add_periods(first, every, index)
+        end = add_periods(begin, every, 1)
+        periods.append(Period(period_label(begin, every), begin, end,
+                              end <= settled))
+    return periods
+
+
+def period_options(period):
+    """Return the hledger options limiting a query to period."""
+    return ' -b %s -e %s' % (period.begin.isoformat(),
+                             period.end.isoformat())
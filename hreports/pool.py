@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""Render the templates of batch runs in worker processes."""
+
+import copy
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from click.exceptions import ClickException
+
+
+# The Hreport of a worker process, see init_worker
+worker_hreport = None
+
+
+def done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def init_worker(config, template_names):
+    """Build the Hreport of a worker and compile templates up front."""
+    global worker_hreport
+    from .hreports import Hreport
+
+    worker_hreport = Hreport(config)
+    for template_name in template_names:
+        worker_hreport.get_template(template_name)
+
+
+def ping():
+    return True
+
+
+def render_report(name, queries, reports):
+    """Render a report in a worker.
+
+    queries maps keys of query results to (cache key, output), the output
+    is None if it is read from the query cache. reports maps the names of
+    input reports to their output.
+    """
+    hreport = worker_hreport
+    with hreport.batch():
+        cache = hreport.get_query_cache()
+        for key, (cache_key, output) in queries.items():
+            if output is None and cache:
+                output = cache.get(cache_key)
+            if output is not None:
+                hreport.query_results[key] = done(output)
+        for input_name, output in reports.items():
+            hreport.report_results[input_name] = done(output)
+        return hreport.render(name)
+
+
+class RenderPool(object):
+    """Render reports of an Hreport in a pool of processes.
+
+    Jinja and the template filters hold the GIL, so threads render one
+    template at a time. While the pool is open, Hreport.render_once hands
+    reports to the pool. Queries, inputs and pandoc still run in the
+    threads of graph.schedule, a worker only renders.
+
+    Workers are spawned, not forked from a process running threads. Each
+    builds its own Hreport and compiles the templates of names on start.
+    Query results are passed by their cache key, so workers read them from
+    the cache files the parent wrote, which the OS keeps in memory once.
+    Only results that are not cached are sent along.
+    """
+
+    def __init__(self, hreport, processes, names=()):
+        self.hreport = hreport
+        self.processes = processes
+
+        config = copy.copy(hreport.config)
+        config.timings = None
+        # Queries are refreshed by the parent
+        config.refresh_cache = False
+        template_names = set()
+        for name in names:
+            template_name = hreport.get_report_config_value(name,
+                                                            'template')
+            if template_name:
+                template_names.add(template_name)
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(config, sorted(template_names)))
+
+    def __enter__(self):
+        # Start the workers while the first queries run
+        for index in range(self.processes):
+            self.executor.submit(ping)
+        self.hreport.render_pool = self
+        return self
+
+    def __exit__(self, *exc_info):
+        self.hreport.render_pool = None
+        self.executor.shutdown(cancel_futures=True)
+
+    def shared(self, results, key):
+        """Return a successful result of the parent's Hreport or None."""
+        with self.hreport.query_results_lock:
+            result = results.get(key)
+        if result is None or not result.done() or result.exception():
+            return None
+        return result.result()
+
+    def inputs(self, name):
+        """Return the query results and input reports name needs."""
+        hreport = self.hreport
+        keys = hreport.query_keys(name)
+        reports = {}
+        for input_name in hreport.get_inputs(name):
+            output = self.shared(hreport.report_results, input_name)
+            named_query = hreport.get_named_query(input_name, name)
+            if output is not None:
+                reports[input_name] = output
+            elif named_query:
+                query, ledger = named_query
+                prepared = hreport.prepare_query(query=query, ledger=ledger)
+                if prepared:
+                    keys.append(prepared[1:])
+
+        queries = {}
+        for key in keys:
+            output = self.shared(hreport.query_results, key)
+            if output is None:
+                continue
+            cache_key = hreport.cache_keys.get(key)
+            queries[key] = (cache_key, None) if cache_key else (None, output)
+        return queries, reports
+
+    def render(self, name):
+        queries, reports = self.inputs(name)
+        with self.hreport.span('template', name, process=True):
+            future = self.executor.submit(render_report, name, queries,
+                                          reports)
+            try:
+                return future.result()
+            except BrokenProcessPool:
+                raise ClickException('The process rendering %s died' % name)
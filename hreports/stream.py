@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""Output of hledger read line by line while it runs."""
+
+import io
+import subprocess
+from collections import deque
+from sys import stdout
+
+from click.parser import split_arg_string
+from click.exceptions import UsageError
+
+
+# Lines kept once a stream is read, for filters like last
+TAIL = 100
+
+
+class LineStream(object):
+    """Lines of a command's output, read from the pipe as they are used.
+
+    The command starts when iteration starts and only the current line is
+    held in memory, so the output can be iterated only once. Stopping early
+    kills the command.
+
+    The last TAIL lines are kept, so last and reversed work, reading the
+    rest of the output if needed. The length is known once all output is
+    read.
+    """
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.consumed = False
+        self.tail = deque(maxlen=TAIL)
+        self.count = None
+
+    def __iter__(self):
+        if self.consumed:
+            raise UsageError('Output of %s can only be read once' % self.cmd)
+        self.consumed = True
+        return self.lines()
+
+    def __bool__(self):
+        # Testing a stream must not read it
+        return True
+
+    def read_to_end(self):
+        """Read all output not read yet, keeping only its tail."""
+        if self.count is not None:
+            return
+        if self.consumed:
+            raise UsageError('Output of %s is still being read' % self.cmd)
+        for line in self:
+            pass
+
+    def __len__(self):
+        # list() asks for the length first, so it must not read the output
+        if self.count is None:
+            raise TypeError('The length of %s is known once it is read' %
+                            self.cmd)
+        return self.count
+
+    def __reversed__(self):
+        self.read_to_end()
+        return self.reversed_tail()
+
+    def reversed_tail(self):
+        for line in reversed(self.tail):
+            yield line
+        if self.count > len(self.tail):
+            raise UsageError('Only the last %s lines of %s are kept' %
+                             (TAIL, self.cmd))
+
+    def lines(self):
+        try:
+            process = subprocess.Popen(split_arg_string(self.cmd),
+                                       stdout=subprocess.PIPE)
+        except OSError:
+            raise UsageError('Hledger was not found on your system')
+
+        finished = False
+        count = 0
+        try:
+            for line in io.TextIOWrapper(process.stdout,
+                                         encoding=stdout.encoding or 'utf-8'):
+                line = line[:-1] if line.endswith('\n') else line
+                self.tail.append(line)
+                count += 1
+                yield line
+            finished = True
+        finally:
+            if not finished:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
+        if process.returncode:
+            raise UsageError('Query %s returned non-zero exit status' %
+                             self.cmd)
+        self.count = count
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+"""Typed tables parsed from hledger's csv and json output."""
+
+import re
+import csv
+import json
+from collections import namedtuple, OrderedDict
+
+from .columns import KeywordFactors
+
+
+# Columns of hledger's csv output that do not hold amounts
+TEXT_COLUMNS = ('txnidx', 'date', 'date2', 'status', 'code', 'description',
+                'comment', 'posting-status', 'posting-comment', 'payee',
+                'note', 'tags')
+
+AMOUNT_RE = re.compile(r'^(?P<sign>[-+]?)\s*(?P<left>[^-+\d.,\s]*)\s*'
+                       r'(?P<sign2>[-+]?)(?P<number>\d[\d.,]*)?\s*'
+                       r'(?P<right>.*?)$')
+
+Row = namedtuple('Row', ['account', 'commodity', 'amounts', 'fields'])
+
+
+def parse_quantity(number):
+    """Convert a number with either decimal mark to a float.
+
+    If both marks occur, the last one is the decimal mark. A single mark
+    followed by exactly three digits is taken as a thousands separator if
+    it follows one to three digits other than zero, so "1,000" is 1000
+    but "0.125" and "1234.567" keep their fraction.
+    """
+    marks = [char for char in number if char in '.,']
+    if not marks:
+        return float(number)
+    decimal_mark = marks[-1]
+    if len(set(marks)) == 1:
+        integer, fraction = number.split(decimal_mark, 1)
+        if len(marks) > 1 or (len(fraction) == 3 and len(integer) <= 3 and
+                              integer.strip('0')):
+            decimal_mark = None
+    for mark in '.,':
+        if mark != decimal_mark:
+            number = number.replace(mark, '')
+    if decimal_mark:
+        number = number.replace(decimal_mark, '.')
+    return float(number)
+
+
+def parse_amounts(text):
+    """Parse an hledger amount cell into a {commodity: quantity} dict.
+
+    Cells with several commodities are separated by commas followed by a
+    space, e.g. "5 USD, -3 EUR". Returns None if the cell holds no amount.
+    """
+    amounts = OrderedDict()
+    text = text.strip()
+    if not text:
+        return amounts
+    for part in text.split(', '):
+        match = AMOUNT_RE.match(part.strip().replace('"', ''))
+        if not match or not match.group('number'):
+            return None
+        commodity = (match.group('left') or match.group('right')).strip()
+        quantity = parse_quantity(match.group('number'))
+        if '-' in (match.group('sign'), match.group('sign2')):
+            quantity = -quantity
+        amounts[commodity] = amounts.get(commodity, 0.0) + quantity
+    return amounts
+
+
+def format_amount(value):
+    if value is None:
+        return ''
+    return '{:,.2f}'.format(value)
+
+
+class Table(object):
+    """Query result with one row per account and commodity.
+
+    Each row holds one amount per entry in columns. A total row at the end
+    of hledger's output is kept separately in totals. Operations return new
+    tables and work column-wise on all rows at once.
+    """
+
+    def __init__(self, columns, rows, totals=None, fields=()):
+        self.columns = list(columns)
+        self.rows = list(rows)
+        self.totals = list(totals or [])
+        self.fields = list(fields)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __str__(self):
+        return '\n'.join(self.lines())
+
+    def column(self, index=-1, totals=False):
+        rows = self.rows + self.totals if totals else self.rows
+        return [row.amounts[index] for row in rows]
+
+    def copy(self, columns=None, rows=None, totals=None):
+        return Table(self.columns if columns is None else columns,
+                     self.rows if rows is None else rows,
+                     self.totals if totals is None else totals,
+                     self.fields)
+
+    def with_column(self, title, values, total_values=None):
+        """Return a new table with an extra amount column."""
+        rows = [row._replace(amounts=row.amounts + [value])
+                for row, value in zip(self.rows, values)]
+        if total_values is None:
+            total_values = [None] * len(self.totals)
+        totals = [row._replace(amounts=row.amounts + [value])
+                  for row, value in zip(self.totals, total_values)]
+        return self.copy(self.columns + [title], rows, totals)
+
+    def multiply_last_column(self, factor, title=None, keywords=None):
+        """Add a column with the last column multiplied by factor.
+
+        keywords maps substrings of account names to their own factor.
+        """
+        factors = KeywordFactors(factor, keywords).factors(
+            [row.account for row in self.rows])
+        values = [None if value is None else value * row_factor
+                  for value, row_factor in zip(self.column(), factors)]
+        total_values = [None if value is None else value * factor
+                        for value in [row.amounts[-1]
+                                      for row in self.totals]]
+        return self.with_column(title or '*%s' % factor, values,
+                                total_values)
+
+    def add_percentage_column(self):
+        """Add the share of each row in the total of the last column.
+
+        The total is taken from the total row of the commodity or, if hledger
+        printed none, from the sum of all rows.
+        """
+        totals = {}
+        for row in self.totals:
+            totals[row.commodity] = row.amounts[-1]
+        for row in self.rows:
+            if self.totals or row.amounts[-1] is None:
+                continue
+            totals[row.commodity] = totals.get(row.commodity, 0.0) + \
+                row.amounts[-1]
+
+        values = []
+        for row in self.rows:
+            total = totals.get(row.commodity)
+            if not total or row.amounts[-1] is None:
+                values.append(None)
+            else:
+                values.append(100 * row.amounts[-1] / total)
+        return self.with_column('%', values,
+                                [100.0 if totals.get(row.commodity) else None
+                                 for row in self.totals])
+
+    def round(self, ndigits=0):
+        def round_row(row):
+            return row._replace(amounts=[
+                None if value is None else round(value, ndigits)
+                for value in row.amounts])
+        return self.copy(rows=[round_row(row) for row in self.rows],
+                         totals=[round_row(row) for row in self.totals])
+
+    def cells(self):
+        """Return header and rows of the table as strings."""
+        header = ['account', 'commodity'] + self.fields + self.columns
+        body = []
+        for row in self.rows + self.totals:
+            body.append([row.account, row.commodity] +
+                        [row.fields.get(field, '') for field in self.fields] +
+                        [format_amount(value) for value in row.amounts])
+        return header, body
+
+    def lines(self):
+        """Render the table as aligned plain text."""
+        header, body = self.cells()
+        widths = [max(len(cell) for cell in column)
+                  for column in zip(header, *body)]
+        text_columns = 2 + len(self.fields)
+        lines = []
+        for cells in [header] + body:
+            line = []
+            for index, (cell, width) in enumerate(zip(cells, widths)):
+                if index < text_columns:
+                    line.append(cell.ljust(width))
+                else:
+                    line.append(cell.rjust(width))
+            lines.append('  '.join(line).rstrip())
+        return lines
+
+    def markdown(self):
+        """Render the table as a markdown pipe table."""
+        header, body = self.cells()
+        text_columns = 2 + len(self.fields)
+        alignment = [':--' if index < text_columns else '--:'
+                     for index in range(len(header))]
+        return ['| %s |' % ' | '.join(cells)
+                for cells in [header, alignment] + body]
+
+
+def rows_from_cells(account, cells, fields):
+    """Split amount cells of one line into a row per commodity."""
+    parsed = [parse_amounts(cell) for cell in cells]
+    commodities = []
+    for amounts in parsed:
+        for commodity in amounts or {}:
+            if commodity not in commodities:
+                commodities.append(commodity)
+    if not commodities:
+        commodities = ['']
+    rows = []
+    for commodity in commodities:
+        values = [None if amounts is None else amounts.get(commodity, 0.0)
+                  for amounts in parsed]
+        rows.append(Row(account, commodity, values, fields))
+    return rows
+
+
+def parse_csv(text):
+    records = list(csv.reader(text.splitlines()))
+    if not records:
+        return Table([], [])
+    header = records[0]
+    account_index = header.index('account') if 'account' in header else None
+    commodity_index = header.index('commodity') \
+        if 'commodity' in header else None
+    field_indexes = [index for index, name in enumerate(header)
+                     if name in TEXT_COLUMNS]
+    amount_indexes = [index for index in range(len(header))
+                      if index not in field_indexes and
+                      index not in (account_index, commodity_index)]
+
+    rows = []
+    totals = []
+    for record in records[1:]:
+        if not record:
+            continue
+        account = record[account_index] if account_index is not None else ''
+        fields = dict((header[index], record[index])
+                      for index in field_indexes)
+        cells = [record[index] for index in amount_indexes]
+        if commodity_index is not None:
+            # --layout bare puts the commodity in a column of its own
+            commodity = record[commodity_index]
+            cells = ['%s %s' % (cell, commodity) if cell else cell
+                     for cell in cells]
+        target = totals if account.lower() in ('total', 'total:') and \
+            record is records[-1] else rows
+        target.extend(rows_from_cells(account, cells, fields))
+    return Table([header[index] for index in amount_indexes], rows, totals,
+                 [header[index] for index in field_indexes])
+
+
+def json_amounts(amounts):
+    """Convert a list of hledger json amounts to {commodity: quantity}."""
+    result = OrderedDict()
+    for amount in amounts:
+        quantity = amount.get('aquantity', 0)
+        if isinstance(quantity, dict):
+            if 'floatingPoint' in quantity:
+                quantity = quantity['floatingPoint']
+            else:
+                quantity = quantity['decimalMantissa'] / \
+                    10.0 ** quantity['decimalPlaces']
+        commodity = amount.get('acommodity', '')
+        result[commodity] = result.get(commodity, 0.0) + float(quantity)
+    return result
+
+
+def json_rows(account, columns):
+    amounts = [json_amounts(column) for column in columns]
+    commodities = []
+    for column in amounts:
+        for commodity in column:
+            if commodity not in commodities:
+                commodities.append(commodity)
+    return [Row(account, commodity,
+                [column.get(commodity, 0.0) for column in amounts], {})
+            for commodity in commodities or ['']]
+
+
+def period_name(dates):
+    """Name a report column after the start date of its period."""
+    start = dates[0]
+    if isinstance(start, dict):
+        start = start.get('contents', '')
+    return str(start)
+
+
+def parse_json(text):
+    """Parse json output of hledger's balance command."""
+    data = json.loads(text)
+    rows = []
+    totals = []
+    if isinstance(data, dict):
+        # Multi-period balance reports
+        columns = [period_name(dates) for dates in data.get('prDates', [])]
+        for record in data.get('prRows', []):
+            name = record.get('prrName')
+            if isinstance(name, dict):
+                name = name.get('fullName', name.get('name', ''))
+            rows.extend(json_rows(name, record.get('prrAmounts', [])))
+        total = data.get('prTotals')
+        if total:
+            totals = json_rows('total', total.get('prrAmounts', []))
+    else:
+        # Single-period balance reports: [[[name, name, indent, amounts]],
+        # total amounts]
+        columns = ['balance']
+        for record in data[0]:
+            rows.extend(json_rows(record[0], [record[3]]))
+        if len(data) > 1:
+            totals = json_rows('total', [data[1]])
+    return Table(columns, rows, totals)
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'json': parse_json,
+}
+
+
+def parse_table(text, output_format='csv'):
+    """Parse hledger output in output_format into a Table."""
+    return PARSERS[output_format](text)
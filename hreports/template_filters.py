@@ -2,7 +2,12 @@
 
 import datetime
 import re
+from collections.abc import Iterator
 from jinja2.exceptions import FilterArgumentError
+from .table import Table
+from .stream import LineStream
+from .columns import TextColumns, KeywordFactors, format_value, \
+    percentages, column_spans, split_cells
 
 
 def datetimeformat(value, format='%H:%M / %d-%m-%Y'):
@@ -13,7 +18,17 @@ def datetime_strptime(value, format='%Y/%m'):
     return datetime.datetime.strptime(value, format)
 
 
+def is_stream(value):
+    """Whether value is streamed output or a filter applied to it."""
+    return isinstance(value, (LineStream, Iterator))
+
+
 def round_output(value):
+    if isinstance(value, Table):
+        return value.round()
+    if is_stream(value):
+        # Rounding never spans lines, so streams are rounded line by line
+        return (round_output(line) for line in value)
     value = value.replace("     0 ", "0.00")
     value = value.replace("EUR", "")
     return re.sub(r'\d+\.\d+',
@@ -22,33 +37,43 @@ def round_output(value):
 
 
 def format_table(table):
-    header = None
-    markdown_header = None
-    markdown_table = []
-    width = None
+    if isinstance(table, Table):
+        return table.markdown()
+    if is_stream(table):
+        return iter_format_table(table)
+    return list(iter_format_table(table))
+
+
+def iter_format_table(table):
+    """Yield hledger's table output as a markdown pipe table, one line at a
+    time.
+
+    The first line with "||" is the header, its labels give the column
+    spans every row is cut at, see column_spans. Separator lines are
+    dropped, lines around the table are passed on.
+    """
+    spans = None
     for line in table:
-        if header and not markdown_header:
-            assert width
-            header = line.split('++')
-            markdown_header = []
-            for index, char in enumerate(header[1]):
-                if index % width == 0:
-                    markdown_header.append(' ')
-                else:
-                    markdown_header.append('-')
-            markdown_table.append(header[0].replace('=', '-') +
-                                  ' ' + ''.join(markdown_header))
-
-        elif not header and "||" in line:
-            header = line.split('||')
-            cells = header[1].split()
-            width = len(header[1])/len(cells)
-            markdown_table.append(header[0] + ' ' + header[1])
-        elif header and markdown_header and '++' in line:
-            pass
+        bar = line.find('||')
+        if bar != -1:
+            right = line[bar + 2:]
+            if spans is None:
+                spans = column_spans(right)
+                yield markdown_row(line[:bar], right, spans)
+                yield '| %s |' % ' | '.join([':--'] + ['--:'] * len(spans))
+            else:
+                yield markdown_row(line[:bar], right, spans)
+        elif spans is not None and '++' in line:
+            continue
         else:
-            markdown_table.append(line.replace('||', '  '))
-    return markdown_table
+            spans = None
+            yield line
+
+
+def markdown_row(account, text, spans):
+    cells = [account.strip()] + split_cells(text, spans)
+    return '| %s |' % ' | '.join(cell.replace('|', '\\|')
+                                 for cell in cells)
 
 
 def german_float(value):
@@ -87,84 +112,36 @@ def parse_multiply_last_column_input(factor, keywords):
 
 
 def calculate_last_column(line, value, factor, keywords):
-    result = None
-    if keywords:
-        for keyword in keywords.keys():
-            if keyword in line:
-                factor = float(keywords.get(keyword))
-                return '{:,.2f}'.format(value*factor)
-    if not result:
-        return '{:,.2f}'.format(value*factor)
+    return format_value(value * KeywordFactors(factor, keywords)(line))
 
 
 def multiply_last_column(output, factor, title=None, keywords={}):
-    max_length = max([len(x) for x in output])
+    if isinstance(output, Table):
+        factor, keywords = parse_multiply_last_column_input(factor, keywords)
+        return output.multiply_last_column(float(factor), title, keywords)
     factor, keywords = parse_multiply_last_column_input(factor, keywords)
 
-    extra_column = []
-
-    # Split each line and find the last string that converts to a float
-    for line in output:
-        result = None
-        columns = line.split(' ')
-        columns.reverse()
-        for cell in columns:
-            try:
-                cell = cell.replace(",", "")
-                value = float(cell)
-                result = calculate_last_column(line, value, factor, keywords)
-                if result:
-                    extra_column.append(result)
-                    break
-            except ValueError:
-                value = cell
-
-        # Append space if no float was found in line
-        if not result:
-            extra_column.append(" ")
-
-    # Replace first instance with title
-    if title:
-        floats = [i for i, f in enumerate(extra_column) if f != " "]
-        if floats:
-            extra_column[floats[0]] = title
-
-        # Special case for the percentage filter
-        if title == "%":
-            return extra_column
-
-    # Append to existing output and align spacing
-    max_result_value = max([len(x) for x in extra_column])
-    output_with_extra_column = []
-
-    for line, column in zip(output, extra_column):
-        new_line = line + " "*(max_length-len(line)) + " " +\
-                   " "*(max_result_value-len(column)) + column
-        output_with_extra_column.append(new_line)
-
-    return output_with_extra_column
+    # Aligning the column needs all lines, so streams are read completely
+    columns = TextColumns(output)
+    extra_column = columns.cells(columns.multiplied(factor, keywords), title)
+
+    # Special case for the percentage filter
+    if title == "%":
+        return extra_column
+
+    return columns.append(extra_column)
 
 
 def add_percentage_column(output):
-    extra_column = multiply_last_column(output, 1.0, "%", {})
-    floats = [i for i, f in enumerate(extra_column) if f != " "]
-    for index in floats[1:]:
-        extra_column[index] = float(extra_column[index].replace(',', ''))
-    total = extra_column[floats[-1]]
-
-    total_percentage = 0
-    for index in floats[1:-1]:
-        percentage = 100*(extra_column[index]/total)
-        total_percentage += percentage
-        extra_column[index] = '{:,.2f}'.format(percentage)
-    extra_column[floats[-1]] = '{:,.2f}'.format(total_percentage)
-
-    max_result_value = max([len(x) for x in extra_column])
-    output_with_extra_column = []
-    max_length = max([len(x) for x in output])
-    for line, column in zip(output, extra_column):
-        new_line = line + " "*(max_length-len(line)) + " " +\
-                   " "*(max_result_value-len(column)) + column
-        output_with_extra_column.append(new_line)
-
-    return output_with_extra_column
+    if isinstance(output, Table):
+        return output.add_percentage_column()
+    columns = TextColumns(output)
+
+    # Percentages are taken of the values as printed, with two decimals.
+    # The first number is replaced by the title, the last one is the total.
+    values = [round(value, 2) for value in columns.numbers()]
+    total = values[-1]
+    shares, total_percentage = percentages(values[1:-1], total)
+    extra_column = (["%"] + shares)[:len(values) - 1] + [total_percentage]
+
+    return columns.append(columns.cells(extra_column))
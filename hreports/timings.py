@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+"""Wall time of the stages of a report run."""
+
+import os
+import sys
+import json
+import time
+import functools
+import threading
+import contextlib
+from collections import namedtuple, OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+Span = namedtuple('Span', ['category', 'name', 'start', 'duration', 'thread',
+                           'args'])
+
+# Stages in the order of a report run, for the summary
+CATEGORIES = ('config', 'context', 'render_string', 'hledger', 'template',
+              'filter', 'pandoc')
+
+# Used instead of a span if timings are off
+NO_SPAN = contextlib.nullcontext({})
+
+
+def children_max_rss():
+    """Return the largest RSS of any subprocess finished so far in KB.
+
+    This is a high-water mark of the whole process, not the RSS of the
+    last subprocess. Running processes, such as the hledger repl backend,
+    are not counted.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes on macOS, KB everywhere else
+        max_rss //= 1024
+    return max_rss
+
+
+class Timings(object):
+    """Collect spans of wall time and pass each one to hooks.
+
+    Hooks are called with every finished Span, from the thread that ran it:
+
+        timings = Timings()
+        timings.add_hook(lambda span: print(span.category, span.duration))
+        config.timings = timings
+        Hreport(config).render('report')
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    @contextlib.contextmanager
+    def span(self, category, name, rusage=False, **args):
+        """Time the block as a span.
+
+        The block gets the span's args and may add to them. With rusage
+        the high-water mark of finished subprocesses' RSS is added
+        afterwards, see children_max_rss.
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            duration = time.perf_counter() - start
+            if rusage:
+                args['max_rss_so_far_kb'] = children_max_rss()
+            self.add(Span(category, name, start - self.origin, duration,
+                          threading.get_ident(), args))
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+        for hook in list(self.hooks):
+            hook(span)
+
+    def wrap(self, function, category, name):
+        """Return function timed as a span on every call."""
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            with self.span(category, name):
+                return function(*args, **kwargs)
+        return timed
+
+    def max_rss(self):
+        values = [span.args.get('max_rss_so_far_kb') for span in self.spans]
+        values = [value for value in values if value is not None]
+        return max(values) if values else None
+
+    def summary(self):
+        """Return calls, total and max ms per stage.
+
+        Filters and templates are listed one by one.
+        """
+        rows = OrderedDict()
+        order = dict((category, index)
+                     for index, category in enumerate(CATEGORIES))
+        for span in sorted(self.spans,
+                           key=lambda span: order.get(span.category,
+                                                      len(order))):
+            key = span.category
+            if span.category in ('filter', 'template'):
+                key = '%s %s' % (span.category, span.name)
+            row = rows.setdefault(key, [0, 0.0, 0.0])
+            row[0] += 1
+            row[1] += span.duration * 1000.0
+            row[2] = max(row[2], span.duration * 1000.0)
+        return rows
+
+    def format_summary(self):
+        lines = ['%-32s %6s %10s %10s' % ('stage', 'calls', 'total ms',
+                                          'max ms')]
+        for key, (calls, total, longest) in self.summary().items():
+            lines.append('%-32s %6d %10.1f %10.1f' % (key[:32], calls, total,
+                                                      longest))
+        max_rss = self.max_rss()
+        if max_rss is not None:
+            lines.append('max RSS of any subprocess so far: %s KB' %
+                         max_rss)
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        """Return the spans in Chrome's trace event format."""
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            events.append({'name': span.name, 'cat': span.category,
+                           'ph': 'X', 'pid': pid, 'tid': span.thread,
+                           'ts': span.start * 1e6,
+                           'dur': span.duration * 1e6,
+                           'args': span.args})
+            if span.args.get('max_rss_so_far_kb') is not None:
+                events.append({'name': 'max RSS of any subprocess so far',
+                               'ph': 'C', 'pid': pid,
+                               'ts': (span.start + span.duration) * 1e6,
+                               'args': {
+                                   'KB': span.args['max_rss_so_far_kb']}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def speedscope(self):
+        """Return the spans as speedscope profile, one per thread."""
+        frames = []
+        frame_index = {}
+        threads = OrderedDict()
+        for span in sorted(self.spans,
+                           key=lambda span: (span.start, -span.duration)):
+            threads.setdefault(span.thread, []).append(span)
+
+        profiles = []
+        for thread, spans in threads.items():
+            events = []
+            stack = []
+            for span in spans:
+                while stack and stack[-1][0] <= span.start:
+                    end, frame = stack.pop()
+                    events.append({'type': 'C', 'frame': frame,
+                                   'at': end * 1000.0})
+                key = '%s: %s' % (span.category, span.name)
+                if key not in frame_index:
+                    frame_index[key] = len(frames)
+                    frames.append({'name': key})
+                frame = frame_index[key]
+                events.append({'type': 'O', 'frame': frame,
+                               'at': span.start * 1000.0})
+                stack.append((span.start + span.duration, frame))
+            while stack:
+                end, frame = stack.pop()
+                events.append({'type': 'C', 'frame': frame,
+                               'at': end * 1000.0})
+            profiles.append({'type': 'evented',
+                             'name': 'thread %s' % thread,
+                             'unit': 'milliseconds',
+                             'startValue': events[0]['at'],
+                             'endValue': events[-1]['at'],
+                             'events': events})
+
+        return {'$schema': 'https://www.speedscope.app/'
+                           'file-format-schema.json',
+                'shared': {'frames': frames},
+                'profiles': profiles,
+                'name': 'hreports',
+                'exporter': 'hreports'}
+
+    def write(self, path):
+        """Write a speedscope profile if path ends with .speedscope.json,
+        otherwise a Chrome trace."""
+        if path.endswith('.speedscope.json'):
+            data = self.speedscope()
+        else:
+            data = self.chrome_trace()
+        with open(path, 'w') as trace_file:
+            json.dump(data, trace_file)
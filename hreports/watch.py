@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""Rebuild reports when the files they read change."""
+
+import os
+import time
+import queue
+
+from click.exceptions import UsageError
+
+from .config import load_config
+from .batch import match_reports
+from .graph import ReportGraph
+
+
+# Seconds without further changes before reports are rebuilt, editors and
+# version control often write several files in a row
+DEBOUNCE = 0.2
+
+# Seconds between two looks at the watched files when polling
+POLL_INTERVAL = 0.25
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except EnvironmentError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PollingWatcher(object):
+    """Notice changed files by comparing their mtime and size."""
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.stamps = {}
+
+    def watch(self, paths):
+        """Watch paths instead of the files watched so far.
+
+        Changes to files that stay watched are still noticed.
+        """
+        self.stamps = dict((path, self.stamps[path] if path in self.stamps
+                            else file_stamp(path)) for path in paths)
+
+    def changes(self, timeout=None):
+        """Return the watched files that changed, waiting up to timeout
+        seconds or until there is a change if timeout is None."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            changed = set()
+            for path, stamp in self.stamps.items():
+                current = file_stamp(path)
+                if current != stamp:
+                    self.stamps[path] = current
+                    changed.add(path)
+            if changed:
+                return changed
+            if deadline is not None and time.time() >= deadline:
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class WatchdogWatcher(object):
+    """Get file changes from the operating system through watchdog.
+
+    watchdog uses inotify on Linux, FSEvents on macOS and
+    ReadDirectoryChangesW on Windows. Directories are watched rather than
+    files, so files replaced by editors keep being watched.
+    """
+
+    def __init__(self):
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                for path in (event.src_path,
+                             getattr(event, 'dest_path', None)):
+                    if path in watcher.paths:
+                        watcher.events.put(path)
+
+        self.handler = Handler()
+        self.events = queue.Queue()
+        self.paths = frozenset()
+        self.observer = Observer()
+        self.observer.start()
+
+    def watch(self, paths):
+        self.paths = frozenset(paths)
+        self.observer.unschedule_all()
+        directories = set(os.path.dirname(path) for path in self.paths)
+        for directory in sorted(directories):
+            if os.path.isdir(directory):
+                self.observer.schedule(self.handler, directory)
+
+    def changes(self, timeout=None):
+        changed = set()
+        try:
+            changed.add(self.events.get(timeout=timeout))
+            while True:
+                changed.add(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return changed
+
+    def close(self):
+        self.observer.stop()
+        self.observer.join()
+
+
+def get_watcher(poll=False):
+    """Return a WatchdogWatcher if watchdog is installed, otherwise or if
+    poll is set a PollingWatcher."""
+    if not poll:
+        try:
+            return WatchdogWatcher()
+        except ImportError:
+            pass
+    return PollingWatcher()
+
+
+class ReportWatcher(object):
+    """Reports matching patterns and the files they read.
+
+    One Hreport is kept between runs, so compiled templates, the query
+    cache and the hledger repl backend stay warm. Changes to the config
+    reload it and rebuild all matching reports.
+    """
+
+    def __init__(self, config, patterns, watcher, debounce=DEBOUNCE):
+        self.config = config
+        self.patterns = patterns
+        self.watcher = watcher
+        self.debounce = debounce
+        self.load()
+
+    def load(self):
+        from .hreports import Hreport
+
+        self.hreport = Hreport(self.config)
+        names = []
+        for pattern in self.patterns or [None]:
+            names.extend(name for name in match_reports(self.config, pattern)
+                         if name not in names)
+        self.names = names
+
+    def reload(self):
+        config = load_config(self.config.cfg_file)
+        for attribute in ('verbose', 'use_cache', 'refresh_cache',
+                          'force_save', 'timings', 'processes'):
+            if hasattr(self.config, attribute):
+                setattr(config, attribute, getattr(self.config, attribute))
+        self.config = config
+        self.load()
+
+    def files(self):
+        """Return the config files and all files the reports read."""
+        graph = ReportGraph(self.hreport)
+        files = set(os.path.abspath(path)
+                    for path in self.config.get_config_files())
+        try:
+            names = graph.dependencies(self.names)
+        except UsageError:
+            # Broken inputs are reported when the reports are built
+            names = self.names
+        for name_files in graph.files(names).values():
+            files |= name_files
+        return files
+
+    def wait(self):
+        """Return the files changed in the next burst of changes."""
+        changed = self.watcher.changes()
+        while True:
+            more = self.watcher.changes(self.debounce)
+            if not more:
+                return changed
+            changed |= more
+
+    def affected_by(self, changed):
+        """Return the reports to rebuild after changes to the files."""
+        config_files = set(os.path.abspath(path)
+                           for path in self.config.get_config_files())
+        if changed & config_files:
+            self.reload()
+            return self.names
+        try:
+            affected = ReportGraph(self.hreport).affected_by(changed)
+        except UsageError:
+            return self.names
+        return [name for name in self.names if name in affected]
+
+    def runs(self):
+        """Yield the changed files and the reports to rebuild, forever.
+
+        Starts with all reports. Results of earlier runs are forgotten
+        before each run, the query cache notices which queries to rerun.
+        """
+        watched = self.files()
+        self.watcher.watch(watched)
+        changed, names = set(), self.names
+        while True:
+            if names:
+                self.hreport.clear_contexts()
+                yield changed, names
+
+            # Includes, templates or the config may have changed
+            files = self.files()
+            if files != watched:
+                watched = files
+                self.watcher.watch(watched)
+
+            changed = self.wait()
+            names = self.affected_by(changed)
@@ -41,6 +41,13 @@ setup(
     },
     include_package_data=True,
     install_requires=requirements,
+    python_requires='>=3.9',
+    extras_require={
+        # Faster column arithmetic in the table filters
+        'numpy': ['numpy'],
+        # File change events instead of polling in hreports watch
+        'watch': ['watchdog'],
+    },
     license="MIT license",
     zip_safe=False,
     keywords='hreports',
@@ -49,11 +56,12 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Natural Language :: English',
-        "Programming Language :: Python :: 2",
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
     test_suite='tests',
     tests_require=test_requirements,
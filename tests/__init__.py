@@ -1,3 +1,88 @@
 # -*- coding: utf-8 -*-
 
 """Unit test package for hreports."""
+
+import os
+import atexit
+import shutil
+import tempfile
+import unittest
+
+from hreports import aio, config, hreports
+
+# Keep caches, snapshots and sockets of the tests out of the user's home
+_app_home = tempfile.mkdtemp()
+os.environ['XDG_CONFIG_HOME'] = _app_home
+atexit.register(shutil.rmtree, _app_home, True)
+
+
+LEDGER = '2010/1/12 *\n    income  243\n    asset\n'
+
+
+class Counting(object):
+    """Record the reports an Hreport renders and the queries it runs."""
+
+    def __init__(self, config):
+        super(Counting, self).__init__(config)
+        self.rendered = []
+        self.executed = []
+
+    def render(self, name):
+        self.rendered.append(name)
+        return super(Counting, self).render(name)
+
+    def execute(self, cmd, ledger=None, query=None):
+        self.executed.append(cmd)
+        return super(Counting, self).execute(cmd, ledger, query)
+
+    async def execute_async(self, cmd, ledger=None, query=None):
+        self.executed.append(cmd)
+        return await super(Counting, self).execute_async(cmd, ledger, query)
+
+
+class CountingHreport(Counting, hreports.Hreport):
+    pass
+
+
+class CountingAsyncHreport(Counting, aio.AsyncHreport):
+    pass
+
+
+class ReportTestCase(unittest.TestCase):
+    """Reports on a ledger in a temporary directory.
+
+    Subclasses set CONFIG, with %(directory)s and %(ledger)s standing for
+    the directory and the ledger, and TEMPLATES, which are written to the
+    templates directory next to the config.
+    """
+
+    CONFIG = None
+    TEMPLATES = {}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.ledger = self.write_file('test.journal', LEDGER)
+        for name, template in self.TEMPLATES.items():
+            self.write_file(os.path.join('templates', name), template)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, name, content):
+        """Write a file below the directory and return its path."""
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as output:
+            output.write(content)
+        return path
+
+    def write_config(self, **values):
+        """Write CONFIG with values for its placeholders."""
+        values = dict({'directory': self.directory, 'ledger': self.ledger},
+                      **values)
+        self.config_file = self.write_file('config.yml', self.CONFIG % values)
+        return self.config_file
+
+    def get_hreport(self, **values):
+        return CountingHreport(config.Config(self.write_config(**values)))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Smoke test for the benchmark suite of `hreports` package."""
+
+import json
+import unittest
+
+from click.testing import CliRunner
+
+from benchmarks import suite
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    """Tests for `benchmarks.suite` module."""
+
+    def test_suite_runs(self):
+        args = ['--postings', '200', '--reports', '4', '--repeat', '1']
+        result = CliRunner().invoke(suite.main, args)
+        assert not result.exception, result.output
+        report = json.loads(result.output)
+        self.assertEqual(report['postings'], 200)
+        for name in ['config.read_config', 'hreport.get_context',
+                     'hreport.run[register]', 'hreport.save',
+                     'filters.multiply_last_column']:
+            self.assertGreater(report['results'][name]['best_ms'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
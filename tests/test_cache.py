@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the query cache of `hreports` package."""
+
+import os
+import time
+import shutil
+import unittest
+import tempfile
+
+from hreports import cache
+
+
+class TestQueryCache(unittest.TestCase):
+    """Tests for `hreports.cache` module."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.ledger = os.path.join(self.directory, 'main.ledger')
+        self.included = os.path.join(self.directory, 'included.ledger')
+        with open(self.ledger, 'w') as ledger:
+            ledger.write('include included.ledger\n')
+        with open(self.included, 'w') as ledger:
+            ledger.write('2010/1/12 *\n    income  243\n    asset\n')
+        self.cache = cache.QueryCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ledger_files(self):
+        files = cache.ledger_files(self.ledger)
+        self.assertEqual(files, [self.ledger, self.included])
+
+    def test_key_changes_with_included_file(self):
+        key = self.cache.key('hledger bal', self.ledger)
+        self.assertEqual(key, self.cache.key('hledger bal', self.ledger))
+        self.assertNotEqual(key, self.cache.key('hledger reg', self.ledger))
+
+        with open(self.included, 'a') as ledger:
+            ledger.write('2010/1/13 *\n    income  1\n    asset\n')
+        self.assertNotEqual(key, self.cache.key('hledger bal', self.ledger))
+
+    def test_fingerprint_is_reused_until_a_file_changes(self):
+        fingerprint = cache.ledger_fingerprint(self.ledger)
+        walk_ledger = cache.walk_ledger
+        cache.walk_ledger = None
+        try:
+            # Unchanged files are only stat'ed, not read
+            self.assertEqual(cache.ledger_fingerprint(self.ledger),
+                             fingerprint)
+        finally:
+            cache.walk_ledger = walk_ledger
+
+        with open(self.included, 'a') as ledger:
+            ledger.write('2010/1/13 *\n    income  1\n    asset\n')
+        self.assertNotEqual(cache.ledger_fingerprint(self.ledger),
+                            fingerprint)
+
+    def test_missing_ledger_is_not_cached(self):
+        missing = os.path.join(self.directory, 'missing.ledger')
+        self.assertIsNone(self.cache.key('hledger bal', missing))
+
+    def test_get_and_set(self):
+        key = self.cache.key('hledger bal', self.ledger)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, u'243 €\n')
+        self.assertEqual(self.cache.get(key), u'243 €\n')
+
+    def test_evict_least_recently_used(self):
+        self.cache.max_size = 25
+        self.cache.set('a', 'x' * 10)
+        self.cache.set('b', 'x' * 10)
+        past = time.time() - 60
+        os.utime(self.cache.path('b'), (past, past))
+        self.cache.get('a')
+        self.cache.set('c', 'x' * 10)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('c'))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the column engine of `hreports` package."""
+
+import unittest
+
+from hreports import columns
+
+
+class TestColumns(unittest.TestCase):
+    """Tests for `hreports.columns` module."""
+
+    def test_last_numbers(self):
+        lines = ['assets   1,234.50 EUR   -3 EUR', 'income', '',
+                 'expenses 2e3', 'total 1.2.3', 'x5 ,5 5x']
+        self.assertEqual(columns.last_numbers(lines),
+                         [-3.0, None, None, 2000.0, None, 5.0])
+
+        # Anything float() takes counts, as before the column engine
+        lines = ['fees 1_000', 'rate inf', 'x -Infinity y', 'odd 1__0']
+        self.assertEqual(columns.last_numbers(lines),
+                         [1000.0, float('inf'), float('-inf'), None])
+        self.assertNotEqual(columns.last_numbers(['avg nan'])[0],
+                            columns.last_numbers(['avg nan'])[0])
+
+    def test_keyword_factors(self):
+        keywords = {'tax': 0.5, 'expenses:tax': 2}
+        factor_of = columns.KeywordFactors(1.5, keywords)
+        self.assertEqual(factor_of('expenses:tax'), 0.5)
+        self.assertEqual(factor_of('income'), 1.5)
+
+        # The first keyword in order wins, also when matched by a regex
+        many = dict(('keyword%s' % index, index) for index in range(10))
+        many = dict([('tax', 0.5)] + list(many.items()) +
+                    [('expenses:tax', 2)])
+        factor_of = columns.KeywordFactors(1.5, many)
+        self.assertIsNotNone(factor_of.pattern)
+        self.assertEqual(factor_of.factors(['expenses:tax', 'keyword3',
+                                            'income']), [0.5, 3.0, 1.5])
+
+    def test_column_spans(self):
+        header = '  2018-01  2018-02 '
+        spans = columns.column_spans(header)
+        self.assertEqual(spans, [(0, 9), (9, None)])
+        self.assertEqual(columns.split_cells(' 500 EUR        0 ', spans),
+                         ['500 EUR', '0'])
+        self.assertEqual(columns.column_spans('   '), [(0, None)])
+
+    def test_text_columns(self):
+        lines = ['      date  amount', 'a  1,000.00', 'b', 'total 1,000.00']
+        text_columns = columns.TextColumns(lines)
+        self.assertEqual(text_columns.numbered, [1, 3])
+        column = text_columns.cells(text_columns.multiplied(2), 'x2')
+        self.assertEqual(text_columns.append(column),
+                         ['      date  amount         ',
+                          'a  1,000.00              x2',
+                          'b                          ',
+                          'total 1,000.00     2,000.00'])
+
+
+if __name__ == '__main__':
+    unittest.main()
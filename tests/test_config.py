@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the config of `hreports` package."""
+
+import os
+import shutil
+import unittest
+import tempfile
+from click.testing import CliRunner
+
+from hreports import cli, config
+
+
+class TestDirectoryConfig(unittest.TestCase):
+    """Tests for `hreports.config.DirectoryConfig`."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cfg_arg = ['-c', self.directory]
+        self.runner = CliRunner()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_load_config(self):
+        self.assertIsInstance(config.load_config(self.directory),
+                              config.DirectoryConfig)
+
+    def test_create_update_and_delete_report(self):
+        args = ['create', 'tax_2017', '-q', 'bal', '-d', 'Taxes']
+        result = self.runner.invoke(cli.main, self.cfg_arg + args)
+        self.assertEqual(result.exit_code, 0)
+        report_file = os.path.join(self.directory, 'reports',
+                                   'tax_2017.yaml')
+        self.assertTrue(os.path.exists(report_file))
+
+        result = self.runner.invoke(cli.main, self.cfg_arg)
+        self.assertIn('tax_2017 -- Taxes', result.output)
+
+        args = ['update', 'tax_2017', '-q', 'reg']
+        result = self.runner.invoke(cli.main, self.cfg_arg + args)
+        args = ['-r', 'tax_2017']
+        result = self.runner.invoke(cli.main, self.cfg_arg + args)
+        self.assertIn('query: reg', result.output)
+
+        args = ['delete', 'tax_2017']
+        result = self.runner.invoke(cli.main, self.cfg_arg + args)
+        self.assertEqual(result.exit_code, 0)
+        self.assertFalse(os.path.exists(report_file))
+        result = self.runner.invoke(cli.main, self.cfg_arg)
+        self.assertIn('No reports saved', result.output)
+
+    def test_reports_are_read_on_demand(self):
+        first = config.load_config(self.directory)
+        first.update_report('a', {'query': 'bal'})
+        first.update_report('b', {'query': 'reg'})
+
+        second = config.load_config(self.directory)
+        self.assertEqual(sorted(second.get_stored_reports()), ['a', 'b'])
+        self.assertEqual(second.get_stored_reports().loaded, {})
+        self.assertEqual(second.get_stored_reports()['b']['query'], 'reg')
+        self.assertEqual(list(second.get_stored_reports().loaded), ['b'])
+
+    def test_concurrent_updates_are_merged(self):
+        first = config.load_config(self.directory)
+        second = config.load_config(self.directory)
+        first.update_report('a', {'query': 'bal'})
+        second.update_report('b', {'query': 'reg'})
+
+        third = config.load_config(self.directory)
+        self.assertEqual(sorted(third.get_stored_reports()), ['a', 'b'])
+
+    def test_split_config(self):
+        config_file = os.path.join(self.directory, 'config.yaml')
+        with open(config_file, 'w') as outfile:
+            outfile.write('global: {ledger: a.ledger}\n'
+                          'reports:\n  a: {query: bal, desc: Balance}\n')
+        target = os.path.join(self.directory, 'config.d')
+        args = ['-c', config_file, 'split-config', target]
+        result = self.runner.invoke(cli.main, args)
+        self.assertEqual(result.exit_code, 0)
+
+        split = config.load_config(target)
+        self.assertEqual(split.data['global'], {'ledger': 'a.ledger'})
+        self.assertEqual(split.get_stored_reports()['a']['query'], 'bal')
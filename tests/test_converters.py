@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the pdf converters of `hreports` package."""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from hreports import converters
+
+
+INVOICE = '''
+---
+papersize: a4
+margin-left: 25mm
+---
+# Invoice
+'''
+
+
+class PandocServerHandler(BaseHTTPRequestHandler):
+    """Answer like pandoc-server, with the markdown wrapped in html."""
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        request = json.loads(self.rfile.read(length).decode('utf-8'))
+        self.server.requests.append((self.path, request))
+        body = json.dumps({'output': '<html>%s</html>' %
+                           request['text']}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConverters(unittest.TestCase):
+    """Tests for `hreports.converters` module."""
+
+    def test_parse_metadata(self):
+        metadata = converters.parse_metadata(INVOICE)
+        self.assertEqual(metadata, {'papersize': 'a4',
+                                    'margin-left': '25mm'})
+        self.assertEqual(converters.parse_metadata('# Invoice'), {})
+        self.assertEqual(converters.parse_metadata('---\nnot closed'), {})
+
+    def test_pdf_engine_command(self):
+        converter = converters.PandocServerConverter()
+        cmd = converter.pdf_engine_command(INVOICE)
+        self.assertEqual(cmd, ['wkhtmltopdf', '--quiet', '--encoding',
+                               'utf-8', '--margin-left', '25mm',
+                               '--page-size', 'a4', '-', '-'])
+
+    def test_pdf_engine_options(self):
+        converter = converters.PandocServerConverter(pdf_engine='weasyprint')
+        self.assertEqual(converter.pdf_engine_command(INVOICE),
+                         ['weasyprint', '-', '-'])
+
+    def test_pandoc_server(self):
+        server = HTTPServer(('127.0.0.1', 0), PandocServerHandler)
+        server.requests = []
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        directory = tempfile.mkdtemp()
+        try:
+            css = os.path.join(directory, 'style.css')
+            with open(css, 'w') as css_file:
+                css_file.write('h1 { color: red; }')
+            output_file = os.path.join(directory, 'invoice.pdf')
+            # cat passes the html through as the "pdf"
+            converter = converters.get_converter(
+                'pandoc-server', pdf_engine='cat',
+                url='http://127.0.0.1:%s/' % server.server_port)
+            converter.convert('# Invoice', output_file, css)
+            with open(output_file) as pdf:
+                self.assertEqual(pdf.read(), '<html># Invoice</html>')
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+            shutil.rmtree(directory)
+
+        path, request = server.requests[0]
+        self.assertEqual(path, '/')
+        self.assertEqual(request['to'], 'html5')
+        self.assertIn('color: red', request['variables']['header-includes'])
+
+    def test_pandoc_command(self):
+        converter = converters.get_converter('pandoc', pdf_engine='weasyprint')
+        self.assertEqual(converter.command('out.pdf', 'style.css'),
+                         ['pandoc', '-t', 'html5', '-o', 'out.pdf',
+                          '--pdf-engine', 'weasyprint',
+                          '--css', 'style.css'])
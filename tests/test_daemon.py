@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the daemon of `hreports` package."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import yaml
+from click.testing import CliRunner
+
+from hreports import cli, daemon
+
+
+class TestDaemon(unittest.TestCase):
+    """Tests for `hreports.daemon` module."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'daemon.sock')
+        self.ledger = os.path.join(self.directory, 'test.journal')
+        with open(self.ledger, 'w') as ledger_file:
+            ledger_file.write('2010/1/12 *\n    income  243\n    asset\n')
+        self.config_file = os.path.join(self.directory, 'config.yml')
+        self.write_config({'balance': {'query': 'bal',
+                                       'ledger': self.ledger}})
+
+        self.server = daemon.create_server(self.config_file, self.socket_path)
+        self.requests = []
+        handle = self.server.daemon.handle
+
+        def record(request):
+            self.requests.append(request['command'])
+            return handle(request)
+        self.server.daemon.handle = record
+        self.thread = threading.Thread(target=daemon.serve,
+                                       args=(self.server,))
+        self.thread.start()
+        self.runner = CliRunner()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def write_config(self, reports):
+        data = {'global': {'socket': self.socket_path,
+                           'cache_dir': os.path.join(self.directory,
+                                                     'cache'),
+                           'manifest': False},
+                'reports': reports}
+        with open(self.config_file, 'w') as config_stream:
+            yaml.safe_dump(data, config_stream)
+
+    def invoke(self, *args):
+        return self.runner.invoke(cli.main, ['-c', self.config_file] +
+                                  list(args))
+
+    def test_show_and_save(self):
+        result = self.invoke('show', 'balance')
+        assert not result.exception
+        self.assertIn('243', result.output)
+        self.assertEqual(self.requests, ['show'])
+
+        output_file = os.path.join(self.directory, 'balance.pdf')
+        self.write_config({'balance': {'query': 'bal',
+                                       'ledger': self.ledger,
+                                       'filename': output_file}})
+        result = self.invoke('save', 'balance')
+        assert not result.exception
+        self.assertIn('Saved %s' % output_file, result.output)
+        self.assertTrue(os.path.exists(output_file))
+        self.assertEqual(self.requests, ['show', 'save'])
+
+    def test_errors_and_fallback(self):
+        result = self.invoke('show', 'balance', '--no-cache', '-q', 'reg')
+        assert not result.exception
+        self.assertEqual(self.requests, [])
+
+        result = self.invoke('--no-daemon', 'show', 'balance')
+        assert not result.exception
+        self.assertEqual(self.requests, [])
+
+        self.write_config({'broken': {'query': 'bal',
+                                      'output_format': 'xml'}})
+        result = self.invoke('show', 'broken')
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('Unsupported output format xml', result.output)
+        self.assertEqual(self.requests, ['show'])
+
+    def test_streamed_report_skips_daemon(self):
+        self.write_config({'balance': {'query': 'bal', 'ledger': self.ledger,
+                                       'stream': True}})
+        result = self.invoke('show', 'balance')
+        assert not result.exception
+        self.assertIn('243', result.output)
+        self.assertEqual(self.requests, [])
+
+    def test_unexpected_error(self):
+        reply = self.server.daemon.handle({'command': 'show',
+                                           'config': self.config_file})
+        self.assertEqual(reply, {'error': "KeyError: 'cwd'"})
+
+        result = self.invoke('show', 'balance')
+        assert not result.exception
+        self.assertIn('243', result.output)
+
+    def test_one_daemon_per_socket(self):
+        with self.assertRaises(daemon.click.UsageError):
+            daemon.create_server(self.config_file, self.socket_path)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for report dependencies of `hreports` package."""
+
+import os
+import unittest
+
+from click.exceptions import UsageError
+from click.testing import CliRunner
+
+from hreports import batch, cli, graph
+
+from . import LEDGER, CountingHreport, ReportTestCase
+
+
+CONFIG = '''global:
+  cache: false
+  manifest: false
+  queries:
+    net_worth: bal assets
+reports:
+  sub_a:
+    query: bal income
+    ledger: %(ledger)s
+  sub_b:
+    query: bal income
+    ledger: %(b)s
+  group:
+    template: group.md
+    ledger: %(ledger)s
+    inputs: [sub_a, sub_b, net_worth]
+  holding:
+    template: holding.md
+    ledger: %(ledger)s
+    inputs: group
+'''
+
+
+class TestReportGraph(ReportTestCase):
+    """Tests for `hreports.graph` module."""
+
+    CONFIG = CONFIG
+    TEMPLATES = {
+        'group.md': 'A {{ inputs.sub_a }}B {{ inputs.sub_b }}'
+                    'N {{ inputs.net_worth }}',
+        'holding.md': '{{ inputs.group|length > 0 }} {{ inputs|list }}',
+    }
+
+    def setUp(self):
+        super(TestReportGraph, self).setUp()
+        self.ledgers = {'a': self.ledger,
+                        'b': self.write_file('b.journal', LEDGER)}
+        self.hreport = self.get_hreport(b=self.ledgers['b'])
+        self.graph = graph.ReportGraph(self.hreport)
+
+    def test_dependencies(self):
+        self.assertEqual(self.graph.dependencies(['holding']),
+                         ['sub_a', 'sub_b', 'net_worth', 'group', 'holding'])
+        self.assertEqual(self.graph.dependents(['sub_b']),
+                         ['group', 'holding'])
+
+    def test_dependency_cycle(self):
+        reports = self.hreport.config.data['reports']
+        reports['sub_a']['inputs'] = ['holding']
+        with self.assertRaises(UsageError) as context:
+            self.graph.dependencies(['holding'])
+        self.assertIn('holding -> group -> sub_a -> holding',
+                      context.exception.message)
+        with self.assertRaises(UsageError):
+            self.hreport.render('sub_a')
+
+    def test_unknown_input(self):
+        self.hreport.config.data['reports']['sub_a']['inputs'] = ['missing']
+        with self.assertRaises(UsageError):
+            self.graph.dependencies(['sub_a'])
+
+    def test_affected_by(self):
+        self.assertEqual(self.graph.affected_by([self.ledgers['b']]),
+                         ['group', 'holding', 'sub_b'])
+        self.assertEqual(self.graph.affected_by([self.ledgers['a']]),
+                         ['group', 'holding', 'sub_a'])
+        self.assertEqual(self.graph.affected_by(['/missing.ledger']), [])
+        holding = os.path.join(self.directory, 'templates', 'holding.md')
+        self.assertEqual(self.graph.affected_by([holding]), ['holding'])
+
+        queries = self.hreport.config.data['global']['queries']
+        self.assertIsNone(self.graph.ledger_of('net_worth'))
+        queries['net_worth'] = {'query': 'bal assets',
+                                'ledger': self.ledgers['b']}
+        self.assertEqual(self.graph.ledger_of('net_worth'), self.ledgers['b'])
+        self.assertEqual(self.graph.affected_by([self.ledgers['b']]),
+                         ['group', 'holding', 'sub_b'])
+
+    def test_schedule_shares_inputs(self):
+        names = ['holding', 'group', 'sub_a']
+        results = list(graph.schedule(self.hreport, names, jobs=4))
+        self.assertEqual([name for name, result, error in results], names)
+        self.assertEqual([error for name, result, error in results],
+                         [None] * 3)
+        holding, group, sub_a = [result for name, result, error in results]
+        self.assertEqual(holding, "True ['group']")
+        self.assertIn('A ', group)
+        self.assertIn('243', sub_a)
+        self.assertIn(sub_a, group)
+        self.assertEqual(sorted(self.hreport.rendered),
+                         ['group', 'holding', 'sub_a', 'sub_b'])
+        # Named queries run against the ledger of the report using them
+        self.assertIn((self.ledgers['a'], 'bal assets'),
+                      self.hreport.query_results)
+
+    def test_failed_input(self):
+        def fail(name):
+            raise UsageError('sub_b is broken')
+
+        self.hreport.render = lambda name: fail(name) if name == 'sub_b' \
+            else CountingHreport.render(self.hreport, name)
+        results = list(graph.schedule(self.hreport, ['sub_a', 'holding'],
+                                      jobs=2))
+        self.assertIsNone(results[0][2])
+        self.assertEqual(results[1][2], 'Input group failed')
+
+    def test_failed_template(self):
+        def fail(name):
+            raise ValueError('could not convert')
+
+        self.hreport.render = lambda name: fail(name) if name == 'sub_a' \
+            else CountingHreport.render(self.hreport, name)
+        results = list(graph.schedule(self.hreport, ['sub_a', 'sub_b'],
+                                      jobs=2))
+        self.assertEqual(results[0][2], 'ValueError: could not convert')
+        self.assertIsNone(results[1][2])
+
+    def test_broken_template(self):
+        self.write_file(os.path.join('templates', 'broken.md'),
+                        '{{ "x"|german_float }}')
+        self.hreport.config.data['reports']['sub_b']['template'] = \
+            'broken.md'
+        results = list(batch.process_reports(self.hreport,
+                                             ['sub_a', 'sub_b'], jobs=2))
+        self.assertIsNone(results[0][2])
+        self.assertIn('243', results[0][1])
+        self.assertIn('ValueError', results[1][2])
+
+    def test_run_changed_reports(self):
+        args = ['-c', self.config_file, 'run-all', '--changed',
+                self.ledgers['b']]
+        result = CliRunner().invoke(cli.main, args)
+        assert not result.exception
+        self.assertIn('holding', result.output)
+        self.assertNotIn('sub_a', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
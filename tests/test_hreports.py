@@ -6,11 +6,18 @@
 import os
 import unittest
 import logging
+import sys
+import time
+import shutil
+import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from click.testing import CliRunner
 
 from hreports import cli, hreports
 
+from . import LEDGER, CountingAsyncHreport, CountingHreport
+
 logger = logging.getLogger()
 
 
@@ -26,7 +33,11 @@ class TestHreports(unittest.TestCase):
 
     @classmethod
     def tearDown(self):
+        from hreports import config
         self.config_file.close()
+        snapshot_file = config.get_snapshot_file(self.config_file.name)
+        if os.path.exists(snapshot_file):
+            os.unlink(snapshot_file)
 
     def test_command_line_interface(self):
         """Test the CLI."""
@@ -149,6 +160,322 @@ class TestHreports(unittest.TestCase):
         self.assertEqual(result.exit_code, 0)
         self.assertIn('test3', result.output)
 
+    def test_run_all(self):
+        ledger = tempfile.NamedTemporaryFile(mode='w')
+        ledger.write('2010/1/12 *\n    income  243\n    asset   \n')
+        ledger.flush()
+        for name in ['tax_2017', 'tax_2018', 'invoice']:
+            args = ['create', name, '-q "bal"', '-l', ledger.name]
+            result = self.runner.invoke(cli.main, self.cfg_arg + args)
+            self.assertEqual(result.exit_code, 0)
+
+        args = ['run-all', 'tax_*', '-j', '2']
+        result = self.runner.invoke(cli.main, self.cfg_arg + args)
+        assert not result.exception
+        self.assertIn('tax_2017', result.output)
+        self.assertIn('tax_2018', result.output)
+        self.assertNotIn('invoice', result.output)
+        self.assertIn('243', result.output)
+
+        args = ['run-all', 'missing_*']
+        result = self.runner.invoke(cli.main, self.cfg_arg + args)
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('No reports match', result.output)
+        ledger.close()
+
+    def test_show_report_streamed(self):
+        ledger = tempfile.NamedTemporaryFile(mode='w')
+        ledger.write('2010/1/12 *\n    income  243\n    asset   \n')
+        ledger.flush()
+        args = ['create', 'register', '-q', 'reg', '-l', ledger.name]
+        self.runner.invoke(cli.main, self.cfg_arg + args)
+
+        result = self.runner.invoke(cli.main, self.cfg_arg +
+                                    ['show', 'register', '--stream'])
+        assert not result.exception
+        self.assertIn('243', result.output)
+        ledger.close()
+
+    def test_show_shipped_template_streamed(self):
+        ledger = tempfile.NamedTemporaryFile(mode='w')
+        ledger.write('2010/1/12 *\n    income  243\n    asset   \n')
+        ledger.flush()
+        args = ['create', 'invoice', '-q', 'bal', '-l', ledger.name,
+                '-t', 'invoice_de.tpl', '-var', 'hourly_rate', '20',
+                '-var', 'VAT', '0.19']
+        result = self.runner.invoke(cli.main, self.cfg_arg + args)
+        self.assertEqual(result.exit_code, 0)
+
+        expected = self.runner.invoke(cli.main, self.cfg_arg +
+                                      ['show', 'invoice', '--no-cache'])
+        result = self.runner.invoke(cli.main, self.cfg_arg +
+                                    ['show', 'invoice', '--stream',
+                                     '--no-cache'])
+        assert not result.exception
+        self.assertIn('Rechnung', result.output)
+        self.assertEqual(result.output, expected.output)
+        ledger.close()
+
+    def test_show_report_with_repl_backend(self):
+        with open(self.config_file.name, 'w') as config_file:
+            config_file.write('global:\n  backend: repl\nreports: {}\n')
+        ledger = tempfile.NamedTemporaryFile(mode='w')
+        ledger.write('2010/1/12 *\n    income  243\n    asset   \n')
+        ledger.flush()
+
+        # Falls back to a hledger subprocess if repl is not available
+        args = ['show', '-q', 'bal', '-l', ledger.name, '--no-cache']
+        result = self.runner.invoke(cli.main, self.cfg_arg + args)
+        assert not result.exception
+        self.assertIn('243', result.output)
+        ledger.close()
+
+    def test_repl_errors(self):
+        from hreports import backends
+        ledger = tempfile.NamedTemporaryFile(mode='w')
+        ledger.write('2010/1/12 *\n    income  243\n    asset   \n')
+        ledger.flush()
+        repl = backends.HledgerRepl(ledger.name, timeout=10)
+        try:
+            expected = repl.query('bal')
+        except backends.ReplUnsupported:
+            ledger.close()
+            self.skipTest('hledger repl is not available')
+        self.assertIn('243', expected)
+
+        # Errors are not mistaken for output, not even by the next query
+        self.assertIsNone(repl.query('bal -b faildate'))
+        self.assertEqual(repl.query('bal'), expected)
+        self.assertFalse(repl.is_stale())
+        with open(ledger.name, 'a') as ledger_file:
+            ledger_file.write('2010/1/13 *\n    income  1\n    asset\n')
+        self.assertTrue(repl.is_stale())
+        repl.stop()
+        ledger.close()
+
+    def get_ledger(self):
+        ledger = tempfile.NamedTemporaryFile('w', suffix='.journal')
+        ledger.write(LEDGER)
+        ledger.flush()
+        self.addCleanup(ledger.close)
+        return ledger.name
+
+    def get_counting_hreport(self, cls=CountingHreport):
+        from hreports import config
+        hreport = cls(config.Config(self.config_file.name))
+        hreport.config.use_cache = False
+        return hreport
+
+    def test_identical_queries_run_once(self):
+        a, b = self.get_ledger(), self.get_ledger()
+        hreport = self.get_counting_hreport()
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            outputs = list(executor.map(
+                lambda i: hreport.run(query='bal', ledger=a), range(5)))
+        self.assertIn('243', outputs[0])
+        self.assertEqual(outputs, outputs[:1] * 5)
+        self.assertEqual(len(hreport.executed), 1)
+
+        hreport.run(query='bal', ledger=b)
+        self.assertEqual(len(hreport.executed), 2)
+
+        hreport.clear_query_results()
+        hreport.run(query='bal', ledger=a)
+        self.assertEqual(len(hreport.executed), 3)
+
+    def test_results_are_shared_within_a_batch(self):
+        from hreports import batch
+        ledger = self.get_ledger()
+        for name in ['a', 'b']:
+            args = ['create', name, '-q "bal"', '-l', ledger]
+            self.runner.invoke(cli.main, self.cfg_arg + args)
+        hreport = self.get_counting_hreport()
+
+        list(batch.process_reports(hreport, ['a', 'b']))
+        self.assertEqual(len(hreport.executed), 1)
+
+        # A long lived Hreport runs the query again for the next render
+        hreport.render('a')
+        hreport.render('a')
+        self.assertEqual(len(hreport.executed), 3)
+
+    def test_string_templates_are_compiled_once(self):
+        from hreports import config
+        hreport = hreports.Hreport(config.Config(self.config_file.name))
+        template = hreport.from_string('{{ now }}')
+        self.assertIs(template, hreport.from_string('{{ now }}'))
+        self.assertIsNot(template, hreport.from_string('{{ report_name }}'))
+
+    def test_bytecode_cache_is_created_on_first_write(self):
+        from hreports import config
+        directory = tempfile.mkdtemp()
+        try:
+            with open(self.config_file.name, 'w') as config_file:
+                config_file.write('global: {cache_dir: %s}\nreports: {}\n' %
+                                  directory)
+            hreport = hreports.Hreport(config.Config(self.config_file.name))
+            bytecode_dir = os.path.join(directory, '.bytecode')
+            self.assertFalse(os.path.exists(bytecode_dir))
+            hreport.env.get_template('invoice_de.tpl')
+            self.assertTrue(os.listdir(bytecode_dir))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_context_is_rendered_lazily(self):
+        from hreports import config
+        with open(self.config_file.name, 'w') as config_file:
+            config_file.write(
+                'global:\n'
+                '  variables:\n'
+                '    rate: "20"\n'
+                '    broken: "{{ undefined_var.attribute }}"\n'
+                'reports:\n'
+                '  invoice:\n'
+                '    query: "bal {{ client }}"\n'
+                '    variables:\n'
+                '      client: "client_{{ rate }}"\n'
+                '      rate: "{{ rate|int * 2 }}"\n')
+        hreport = hreports.Hreport(config.Config(self.config_file.name))
+
+        string = '{{ client }} {{ rate }} {{ report.query }} ' \
+            '{{ range(2)|list }}'
+        self.assertEqual(hreport.render_string(string, 'invoice'),
+                         'client_20 40 bal client_20 [0, 1]')
+        self.assertIs(hreport.get_context('invoice'),
+                      hreport.get_context('invoice'))
+
+        # Strings are rendered on access, broken ones only fail when used
+        self.assertIn('UndefinedError',
+                      hreport.render_string('{{ broken }}', 'invoice'))
+
+    def test_cli_defers_rendering_imports(self):
+        code = ('import sys, hreports.cli; '
+                'print(sorted(set(sys.modules) & {"jinja2", "yaml", '
+                '"subprocess", "tempfile", "hreports.hreports", '
+                '"hreports.batch"}))')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'[]')
+
+    def test_config_snapshot(self):
+        from hreports import config
+        with open(self.config_file.name, 'w') as config_file:
+            config_file.write('global: {}\nreports:\n  a: {query: bal}\n')
+        past = time.time() - 60
+        os.utime(self.config_file.name, (past, past))
+
+        first = config.Config(self.config_file.name)
+        snapshot_file = first.get_snapshot_file()
+        self.assertTrue(os.path.exists(snapshot_file))
+        self.assertNotEqual(os.path.dirname(snapshot_file),
+                            os.path.dirname(self.config_file.name))
+        self.assertEqual(first.read_snapshot(), first.data)
+
+        with open(self.config_file.name, 'w') as config_file:
+            config_file.write('global: {}\nreports:\n  b: {query: reg}\n')
+        second = config.Config(self.config_file.name)
+        self.assertIsNone(second.read_snapshot())
+        self.assertEqual(list(second.get_stored_reports()), ['b'])
+
+        # Only plain data is snapshotted, YAML dates are parsed every time
+        with open(self.config_file.name, 'w') as config_file:
+            config_file.write('global: {}\nreports:\n'
+                              '  c: {variables: {due: 2018-01-31}}\n')
+        os.utime(self.config_file.name, (past, past))
+        third = config.Config(self.config_file.name)
+        self.assertIsNone(third.read_snapshot())
+        self.assertEqual(list(third.get_stored_reports()), ['c'])
+
+    def test_save_skips_up_to_date_pdf(self):
+        directory = tempfile.mkdtemp()
+        manifest = os.path.join(directory, 'manifest.json')
+        ledger = os.path.join(directory, 'a.ledger')
+        output_file = os.path.join(directory, 'a.pdf')
+        with open(ledger, 'w') as ledger_file:
+            ledger_file.write('2010/1/12 *\n    income  2\n    asset\n')
+        with open(self.config_file.name, 'w') as config_file:
+            config_file.write('global: {manifest: %s}\nreports: {}\n' %
+                              manifest)
+        args = ['create', 'a', '-q', 'bal', '-l', ledger, '-f', output_file]
+        self.runner.invoke(cli.main, self.cfg_arg + args)
+
+        result = self.runner.invoke(cli.main, self.cfg_arg + ['save', 'a'])
+        self.assertIn('Saved %s' % output_file, result.output)
+        result = self.runner.invoke(cli.main, self.cfg_arg + ['save', 'a'])
+        self.assertIn('Skipped %s' % output_file, result.output)
+
+        args = ['save', 'a', '--force']
+        result = self.runner.invoke(cli.main, self.cfg_arg + args)
+        self.assertIn('Saved %s' % output_file, result.output)
+
+        os.unlink(output_file)
+        result = self.runner.invoke(cli.main, self.cfg_arg + ['save', 'a'])
+        self.assertIn('Saved %s' % output_file, result.output)
+        shutil.rmtree(directory)
+
+    def test_async_identical_queries_run_once(self):
+        import asyncio
+        ledger = self.get_ledger()
+        hreport = self.get_counting_hreport(CountingAsyncHreport)
+
+        async def run_queries():
+            return await asyncio.gather(*[
+                hreport.run_async(query='bal', ledger=ledger)
+                for i in range(5)])
+
+        outputs = asyncio.run(run_queries())
+        self.assertIn('243', outputs[0])
+        self.assertEqual(outputs, outputs[:1] * 5)
+        self.assertEqual(len(hreport.executed), 1)
+
+        # The synchronous methods share the results
+        self.assertEqual(hreport.run(query='bal', ledger=ledger), outputs[0])
+        self.assertEqual(len(hreport.executed), 1)
+
+    def test_async_render_sees_ledger_changes(self):
+        import asyncio
+        from hreports import aio, config, timings
+        directory = tempfile.mkdtemp()
+        ledger = os.path.join(directory, 'main.journal')
+        with open(ledger, 'w') as ledger_file:
+            ledger_file.write('2018-01-10 Salary\n    assets:bank  EUR 1000\n'
+                              '    income:salary\n')
+        with open(self.config_file.name, 'w') as config_file:
+            config_file.write('global: {backend: index, cache_dir: %s}\n'
+                              'reports:\n  r: {query: bal income, ledger: %s}'
+                              '\n' % (directory, ledger))
+        hreport = aio.AsyncHreport(config.Config(self.config_file.name))
+        hreport.timings = timings.Timings()
+        try:
+            self.assertIn('EUR -1000', asyncio.run(hreport.render_async('r')))
+            self.assertEqual([span.category for span in hreport.timings.spans
+                              if span.category == 'hledger'], ['hledger'])
+            with open(ledger, 'a') as ledger_file:
+                ledger_file.write('2018-02-10 Salary\n'
+                                  '    assets:bank  EUR 1000\n'
+                                  '    income:salary\n')
+            self.assertIn('EUR -2000', asyncio.run(hreport.render_async('r')))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_async_process_reports(self):
+        import asyncio
+        from hreports import aio, config
+        ledger = self.get_ledger()
+        for name in ['a', 'b']:
+            args = ['create', name, '-q "bal"', '-l', ledger]
+            self.runner.invoke(cli.main, self.cfg_arg + args)
+
+        hreport = aio.AsyncHreport(config.Config(self.config_file.name),
+                                   concurrency=2)
+        hreport.config.use_cache = False
+        results = asyncio.run(
+            hreport.process_reports_async(['b', 'a']))
+        self.assertEqual([name for name, result, error in results],
+                         ['b', 'a'])
+        for name, result, error in results:
+            self.assertIsNone(error)
+            self.assertIn('243', result)
+
     def test_get_global_config(self):
         from hreports import config
         test = config.Config(self.config_file.name)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the journal index of `hreports` package."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hreports import backends, config, hreports, journal
+
+
+MAIN = '''; sample
+2018-01-05 * (42) Groceries ; weekly
+    expenses:food      EUR 12.5
+    assets:cash
+
+2018/01/20 Rent
+    expenses:rent     500.00 EUR
+    assets:bank      -500.00 EUR
+
+include other.journal
+
+2018-02-01 "Quoted" desc
+    expenses:food  EUR 7.25
+    assets:cash  EUR -7.25
+'''
+
+OTHER = '''2018-01-10 Salary
+    assets:bank  EUR 1000
+    income:salary
+'''
+
+
+class TestJournalIndex(unittest.TestCase):
+    """Tests for `hreports.journal` module."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.ledger = os.path.join(self.directory, 'main.journal')
+        self.index_dir = os.path.join(self.directory, 'index')
+        for name, content in [('main.journal', MAIN),
+                              ('other.journal', OTHER)]:
+            with open(os.path.join(self.directory, name), 'w') as ledger:
+                ledger.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_balance(self):
+        index = journal.load_index(self.ledger, self.index_dir)
+        self.assertEqual(index.query('bal expenses'),
+                         '           EUR 19.75  expenses:food\n'
+                         '          EUR 500.00  expenses:rent\n'
+                         '--------------------\n'
+                         '          EUR 519.75\n')
+        self.assertEqual(index.query('balance -b 2018-01-15 -e 2018-02 '
+                                     '-O csv'),
+                         '"account","balance"\n'
+                         '"assets:bank","EUR -500.00"\n'
+                         '"expenses:rent","EUR 500.00"\n'
+                         '"total","0"\n')
+
+    def test_register(self):
+        index = journal.load_index(self.ledger, self.index_dir)
+        self.assertEqual(index.query('reg acct:food -Ocsv').splitlines(), [
+            '"txnidx","date","code","description","account","amount",'
+            '"total"',
+            '"1","2018-01-05","42","Groceries","expenses:food",'
+            '"EUR 12.50","EUR 12.50"',
+            '"4","2018-02-01","","""Quoted"" desc","expenses:food",'
+            '"EUR 7.25","EUR 19.75"'])
+
+    def test_unsupported(self):
+        index = journal.load_index(self.ledger, self.index_dir)
+        for query in ['reg food', 'bal --depth 1', 'bal date:2018',
+                      'bal -b lastmonth', 'print', 'bal -O json']:
+            self.assertIsNone(index.query(query), query)
+
+        with open(self.ledger, 'a') as ledger:
+            ledger.write('\nP 2018-01-01 EUR 1.2 USD\n')
+        with self.assertRaises(journal.Unsupported):
+            journal.load_index(self.ledger, self.index_dir)
+
+    def test_saved_index(self):
+        index = journal.load_index(self.ledger, self.index_dir)
+        self.assertEqual(os.path.dirname(journal.get_index_file(
+            self.ledger, self.index_dir)), self.index_dir)
+        saved = journal.read_index(self.ledger, self.index_dir)
+        self.assertEqual(saved.accounts, index.accounts)
+        self.assertEqual(saved.series, index.series)
+        self.assertEqual(saved.query('bal income'), index.query('bal income'))
+        with open(os.path.join(self.directory, 'other.journal'),
+                  'a') as ledger:
+            ledger.write('\n2018-03-01 Bonus\n    assets:bank  EUR 1\n'
+                         '    income:bonus\n')
+        self.assertIsNone(journal.read_index(self.ledger, self.index_dir))
+        self.assertIn('income:bonus',
+                      journal.load_index(self.ledger, self.index_dir).accounts)
+
+    def test_index_backend(self):
+        config_file = os.path.join(self.directory, 'config.yml')
+        with open(config_file, 'w') as config_stream:
+            config_stream.write('global:\n  backend: index\n  cache: false\n'
+                                '  cache_dir: %s/cache\nreports: {}\n' %
+                                self.directory)
+        hreport = hreports.Hreport(config.Config(config_file))
+        self.assertIsInstance(hreport.get_backend(), backends.IndexBackend)
+        output = hreport.run(query='bal income', ledger=self.ledger)
+        self.assertIn('EUR -1000.00  income:salary', output)
+
+        # Anything else is left to hledger
+        self.assertIsNone(hreport.get_backend().query(self.ledger,
+                                                      'bal --tree'))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for memory mapped lines of `hreports` package."""
+
+import os
+
+from hreports import lines
+
+from . import ReportTestCase
+
+
+CONFIG = '''global:
+  cache_dir: %(directory)s/cache
+reports:
+  last:
+    query: bal
+    ledger: %(ledger)s
+    template: last.md
+'''
+
+
+class TestMappedLines(ReportTestCase):
+    """Tests for `hreports.lines` module."""
+
+    CONFIG = CONFIG
+    TEMPLATES = {'last.md': '{{ output|length }} {{ output|last }}'}
+
+    def mapped(self, text, index_path=None):
+        path = os.path.join(self.directory, 'output')
+        with open(path, 'wb') as output:
+            output.write(text.encode('utf-8'))
+        return lines.MappedLines(path, index_path)
+
+    def test_like_splitlines(self):
+        for text in [u'', u'\n', u'a', u'a\n', u'a\n\nb', u'a\r\nb\r\n',
+                     u'243 €\n-243 income\n']:
+            self.assertEqual(list(self.mapped(text)), text.splitlines(),
+                             repr(text))
+
+    def test_sequence(self):
+        mapped = self.mapped(u''.join('line %s\n' % i for i in range(10)))
+        self.assertEqual(len(mapped), 10)
+        self.assertEqual(mapped[-1], 'line 9')
+        self.assertEqual(list(reversed(mapped))[0], 'line 9')
+        self.assertEqual(mapped[2:4], ['line 2', 'line 3'])
+        self.assertEqual(mapped[-3:][0], 'line 7')
+        self.assertEqual(mapped[::4], ['line 0', 'line 4', 'line 8'])
+        self.assertEqual(len(mapped[8:2]), 0)
+        with self.assertRaises(IndexError):
+            mapped[10]
+
+    def test_saved_offsets(self):
+        index_path = os.path.join(self.directory, 'output.lines')
+        self.mapped(u'a\nb\n', index_path)
+        self.assertEqual(list(lines.read_offsets(index_path, 4)), [0, 2, 4])
+        self.assertIsNone(lines.read_offsets(index_path, 5))
+        self.assertEqual(list(self.mapped(u'abc\nd\n', index_path)),
+                         ['abc', 'd'])
+
+    def test_render_from_cache(self):
+        hreport = self.get_hreport()
+        expected = hreport.render('last')
+        self.assertEqual(len(hreport.executed), 1)
+
+        hreport = self.get_hreport()
+        output = hreport.run_lines('last')
+        self.assertIsInstance(output, lines.MappedLines)
+        self.assertEqual(hreport.render('last'), expected)
+        self.assertEqual(hreport.executed, [])
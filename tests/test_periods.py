@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for reports split into periods of `hreports` package."""
+
+import datetime
+
+from click.exceptions import UsageError
+
+from hreports import config, hreports, periods
+
+from . import ReportTestCase
+
+
+CONFIG = '''global:
+  cache_dir: %(directory)s/cache
+  manifest: false
+reports:
+  pnl:
+    query: bal income
+    ledger: %(ledger)s
+    template: periods.md
+    periods:
+      every: month
+      count: 3
+'''
+
+
+class TestPeriods(ReportTestCase):
+    """Tests for `hreports.periods` module."""
+
+    CONFIG = CONFIG
+    TEMPLATES = {
+        'periods.md': '{% for period in periods %}{{ period.label }} '
+                      '{{ period.closed }} '
+                      '{{ period.output|first|trim }}\n{% endfor %}',
+    }
+
+    def setUp(self):
+        super(TestPeriods, self).setUp()
+        # One transaction in each of the report's periods
+        self.write_file('test.journal', ''.join(
+            '%s *\n    income  243\n    asset\n\n' % period.begin.isoformat()
+            for period in periods.expand_periods({'count': 3})))
+        self.write_config()
+
+    def test_expand_periods(self):
+        today = datetime.date(2018, 2, 14)
+        months = periods.expand_periods({'count': 3}, today)
+        self.assertEqual([period.label for period in months],
+                         ['2017-12', '2018-01', '2018-02'])
+        self.assertEqual(months[0].begin, datetime.date(2017, 12, 1))
+        self.assertEqual(months[0].end, datetime.date(2018, 1, 1))
+        self.assertEqual([period.closed for period in months],
+                         [True, True, False])
+
+        quarters = periods.expand_periods({'every': 'quarter', 'count': 2,
+                                           'end': '2017-12-31',
+                                           'closed_after': 60}, today)
+        self.assertEqual([(period.label, period.closed)
+                          for period in quarters],
+                         [('2017Q3', True), ('2017Q4', False)])
+        weeks = periods.expand_periods('week', today)
+        self.assertEqual([(period.label, period.begin) for period in weeks],
+                         [('2018-W07', datetime.date(2018, 2, 12))])
+
+        for spec in [{'every': 'fortnight'}, {'count': 0},
+                     {'end': 'yesterday'}, ['month']]:
+            with self.assertRaises(UsageError):
+                periods.expand_periods(spec, today)
+
+    def test_closed_periods_are_cached(self):
+        expected = ''.join('%s %s 243  income\n' %
+                           (period.label, period.closed)
+                           for period in periods.expand_periods(
+                               {'count': 3}))
+        hreport = self.get_hreport()
+        self.assertEqual(hreport.render('pnl'), expected)
+        self.assertEqual(len(hreport.executed), 3)
+        self.assertIn('-b ', hreport.executed[0])
+
+        with open(self.ledger, 'a') as ledger:
+            ledger.write('\n2010/1/13 *\n    income  1\n    asset\n')
+        hreport = self.get_hreport()
+        self.assertEqual(hreport.render('pnl'), expected)
+        self.assertEqual(len(hreport.executed), 1)
+
+        hreport.config.refresh_cache = True
+        hreport.clear_query_results()
+        hreport.render('pnl')
+        self.assertEqual(len(hreport.executed), 4)
+
+    def test_render_without_template(self):
+        hreport = hreports.Hreport(config.Config(self.config_file))
+        del hreport.get_report_config('pnl')['template']
+        labels = [line for line in hreport.render('pnl').splitlines()
+                  if line[:2] == '20']
+        self.assertEqual(labels, [period.label for period in
+                                  periods.expand_periods({'count': 3})])
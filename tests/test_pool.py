@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for rendering in worker processes of `hreports` package."""
+
+from hreports import batch
+
+from . import ReportTestCase
+
+
+CONFIG = '''global:
+  cache: %(cache)s
+  cache_dir: %(directory)s/cache
+  manifest: false
+  queries:
+    net_worth: bal assets
+reports:
+  sub_a:
+    query: bal income
+    ledger: %(ledger)s
+    template: lines.md
+  group:
+    template: group.md
+    ledger: %(ledger)s
+    inputs: [sub_a, net_worth]
+'''
+
+
+class TestRenderPool(ReportTestCase):
+    """Tests for `hreports.pool` module."""
+
+    CONFIG = CONFIG
+    TEMPLATES = {
+        'lines.md': '{{ output|length }}: {{ output|last }}',
+        'group.md': 'A {{ inputs.sub_a }} N {{ inputs.net_worth }}',
+    }
+
+    def process(self, hreport, processes=None):
+        hreport.config.processes = processes
+        return list(batch.process_reports(hreport, ['group', 'sub_a'],
+                                          jobs=2))
+
+    def test_same_results_as_threads(self):
+        for cache in ['true', 'false']:
+            hreport = self.get_hreport(cache=cache)
+            expected = self.process(hreport)
+            self.assertEqual(sorted(hreport.rendered), ['group', 'sub_a'])
+            self.assertTrue(all(error is None
+                                for name, result, error in expected))
+
+            hreport = self.get_hreport(cache=cache)
+            self.assertEqual(self.process(hreport, 2), expected, cache)
+            self.assertEqual(hreport.rendered, [])
+            self.assertIsNone(hreport.render_pool)
+            self.assertEqual(bool(hreport.cache_keys), cache == 'true')
+
+    def test_default_processes(self):
+        hreport = self.get_hreport(cache='false')
+        self.assertEqual(batch.default_processes(hreport.config), 0)
+        hreport.config.data['global']['processes'] = 3
+        self.assertEqual(batch.default_processes(hreport.config), 3)
+        hreport.config.processes = 1
+        self.assertEqual(batch.default_processes(hreport.config), 1)
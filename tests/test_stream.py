@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for streamed output of `hreports` package."""
+
+import unittest
+import itertools
+
+from click.exceptions import UsageError
+
+from hreports import stream, template_filters
+
+
+class TestLineStream(unittest.TestCase):
+    """Tests for `hreports.stream` module."""
+
+    def test_lines(self):
+        lines = stream.LineStream('printf "a\\nb\\n\\nc"')
+        self.assertEqual(list(lines), ['a', 'b', '', 'c'])
+        with self.assertRaises(UsageError):
+            list(lines)
+
+    def test_tail(self):
+        lines = stream.LineStream('seq 150')
+        self.assertTrue(lines)
+        with self.assertRaises(TypeError):
+            len(lines)
+        self.assertEqual(next(reversed(lines)), '150')
+        self.assertEqual(len(lines), 150)
+        with self.assertRaises(UsageError):
+            list(reversed(lines))
+
+    def test_stop_early(self):
+        lines = iter(stream.LineStream('yes'))
+        self.assertEqual(list(itertools.islice(lines, 3)), ['y'] * 3)
+        lines.close()
+
+    def test_errors(self):
+        with self.assertRaises(UsageError):
+            list(stream.LineStream('false'))
+        with self.assertRaises(UsageError):
+            list(stream.LineStream('missing-hreports-command'))
+
+    def test_streaming_filters(self):
+        output = template_filters.format_table(
+            template_filters.round_output(stream.LineStream(
+                'printf "a || 1.6\\n==++===\\nb || 2.2\\n"')))
+        self.assertTrue(template_filters.is_stream(output))
+        self.assertEqual(list(output),
+                         ['| a | 2 |', '| :-- | --: |', '| b | 2 |'])
+
+        table = ['a || 1.6', '==++===', 'b || 2.2']
+        self.assertEqual(template_filters.format_table(table),
+                         ['| a | 1.6 |', '| :-- | --: |', '| b | 2.2 |'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for structured query output of `hreports` package."""
+
+
+import unittest
+
+from hreports import table, template_filters
+
+
+BALANCE_CSV = '''"account","balance"
+"assets:cash","1,000.50 USD"
+"expenses:milk","5 USD, 2 EUR"
+"income:client1","-1,005.50 USD, -2 EUR"
+"total","0"
+'''
+
+MONTHLY_CSV = '''"account","2018-01","2018-02"
+"expenses:food","10 €","30 €"
+"expenses:rent","90 €","70 €"
+"total","100 €","100 €"
+'''
+
+BALANCE_JSON = '''[[["assets:cash","assets:cash",0,
+[{"acommodity":"USD","aquantity":{"decimalMantissa":500,
+"decimalPlaces":2,"floatingPoint":5}}]]],
+[{"acommodity":"USD","aquantity":{"decimalMantissa":500,
+"decimalPlaces":2,"floatingPoint":5}}]]'''
+
+
+class TestTable(unittest.TestCase):
+    """Tests for `hreports.table` module."""
+
+    def test_parse_quantity(self):
+        self.assertEqual(table.parse_quantity('1,000.50'), 1000.5)
+        self.assertEqual(table.parse_quantity('1.000,50'), 1000.5)
+        self.assertEqual(table.parse_quantity('1,000'), 1000.0)
+        self.assertEqual(table.parse_quantity('2,5'), 2.5)
+        self.assertEqual(table.parse_quantity('0.125'), 0.125)
+        self.assertEqual(table.parse_quantity('.125'), 0.125)
+        self.assertEqual(table.parse_quantity('1234.567'), 1234.567)
+        self.assertEqual(table.parse_quantity('1.234.567'), 1234567.0)
+
+    def test_parse_amounts(self):
+        amounts = table.parse_amounts('$-5.00, 3 EUR')
+        self.assertEqual(amounts, {'$': -5.0, 'EUR': 3.0})
+        self.assertEqual(table.parse_amounts('0'), {'': 0.0})
+        self.assertEqual(table.parse_amounts('0.125 BTC'), {'BTC': 0.125})
+        self.assertIsNone(table.parse_amounts('n/a'))
+
+    def test_parse_csv(self):
+        result = table.parse_table(BALANCE_CSV, 'csv')
+        self.assertEqual(result.columns, ['balance'])
+        self.assertEqual([(row.account, row.commodity) for row in result],
+                         [('assets:cash', 'USD'), ('expenses:milk', 'USD'),
+                          ('expenses:milk', 'EUR'), ('income:client1', 'USD'),
+                          ('income:client1', 'EUR')])
+        self.assertEqual(result.column(), [1000.5, 5, 2, -1005.5, -2])
+        self.assertEqual(len(result.totals), 1)
+
+    def test_parse_json(self):
+        result = table.parse_table(BALANCE_JSON, 'json')
+        self.assertEqual(result.rows[0].account, 'assets:cash')
+        self.assertEqual(result.rows[0].amounts, [5.0])
+        self.assertEqual(result.totals[0].amounts, [5.0])
+
+    def test_table_filters(self):
+        monthly = table.parse_table(MONTHLY_CSV, 'csv')
+
+        result = template_filters.multiply_last_column(
+            monthly, 2, 'double', [['rent', '0.5']])
+        self.assertEqual(result.columns, ['2018-01', '2018-02', 'double'])
+        self.assertEqual(result.column(), [60, 35])
+        self.assertEqual(result.totals[0].amounts[-1], 200)
+
+        result = template_filters.add_percentage_column(monthly)
+        self.assertEqual(result.column(), [30, 70])
+
+        result = template_filters.round_output(
+            template_filters.add_percentage_column(monthly))
+        self.assertEqual(result.column(), [30, 70])
+
+        markdown = template_filters.format_table(monthly)
+        self.assertEqual(markdown[0],
+                         '| account | commodity | 2018-01 | 2018-02 |')
+        self.assertEqual(markdown[2],
+                         '| expenses:food | € | 10.00 | 30.00 |')
@@ -78,3 +78,27 @@ class TestHreportsTemplateFilters(unittest.TestCase):
         with self.assertRaises(FilterArgumentError):
             r = template_filters.parse_multiply_last_column_input(factor,
                                                                   keywords)
+
+    def test_format_table(self):
+        lines = ['Balance changes in 2018-01-01..2018-02-28:',
+                 '',
+                 '               ||  2018-01  2018-02 ',
+                 '===============++==================',
+                 ' expenses:food || 10.00 €  30.00 € ',
+                 ' expenses:rent || 500 EUR        0 ',
+                 '---------------++------------------',
+                 '               || 10.00 €  30.00 € ',
+                 '               || 500 EUR        0 ',
+                 '',
+                 'done']
+        self.assertEqual(template_filters.format_table(lines), [
+            'Balance changes in 2018-01-01..2018-02-28:',
+            '',
+            '|  | 2018-01 | 2018-02 |',
+            '| :-- | --: | --: |',
+            '| expenses:food | 10.00 € | 30.00 € |',
+            '| expenses:rent | 500 EUR | 0 |',
+            '|  | 10.00 € | 30.00 € |',
+            '|  | 500 EUR | 0 |',
+            '',
+            'done'])
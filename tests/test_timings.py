@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for timings of `hreports` package."""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from hreports import cli, timings
+
+
+class TestTimings(unittest.TestCase):
+    """Tests for `hreports.timings` module."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_spans_and_hooks(self):
+        recorder = timings.Timings()
+        seen = []
+        recorder.add_hook(seen.append)
+        with recorder.span('template', 'outer') as args:
+            args['lines'] = 3
+            recorder.wrap(len, 'filter', 'length')('abc')
+        self.assertEqual([span.name for span in seen], ['length', 'outer'])
+        self.assertEqual(seen[1].args, {'lines': 3})
+        self.assertEqual(list(recorder.summary()),
+                         ['template outer', 'filter length'])
+
+    def test_exports(self):
+        recorder = timings.Timings()
+        with recorder.span('context', 'report'):
+            with recorder.span('render_string', '{{ a }}'):
+                pass
+        with recorder.span('hledger', 'hledger bal', rusage=True):
+            pass
+
+        trace = recorder.chrome_trace()
+        names = [event['name'] for event in trace['traceEvents']
+                 if event['ph'] == 'X']
+        self.assertEqual(names, ['{{ a }}', 'report', 'hledger bal'])
+        if timings.resource is not None:
+            self.assertIn('max_rss_so_far_kb', recorder.spans[-1].args)
+            self.assertIn('max RSS of any subprocess so far',
+                          recorder.format_summary())
+
+        profile = recorder.speedscope()
+        events = profile['profiles'][0]['events']
+        frames = [profile['shared']['frames'][event['frame']]['name']
+                  for event in events]
+        self.assertEqual([event['type'] for event in events],
+                         ['O', 'O', 'C', 'C', 'O', 'C'])
+        self.assertEqual(frames[:2], ['context: report',
+                                      'render_string: {{ a }}'])
+
+    def test_cli_timings_and_profile(self):
+        runner = CliRunner()
+        config_file = os.path.join(self.directory, 'config.yml')
+        ledger = os.path.join(self.directory, 'test.journal')
+        with open(ledger, 'w') as ledger_file:
+            ledger_file.write('2010/1/12 *\n    income  243\n    asset\n')
+        with open(config_file, 'w') as config_stream:
+            config_stream.write('')
+        runner.invoke(cli.main, ['-c', config_file, 'create', 'balance',
+                                 '-q', 'bal', '-l', ledger])
+
+        profile = os.path.join(self.directory, 'run.speedscope.json')
+        result = runner.invoke(cli.main, ['-c', config_file, '--timings',
+                                          '--profile', profile, 'show',
+                                          'balance', '--no-cache'])
+        assert not result.exception
+        self.assertIn('243', result.output)
+        self.assertIn('hledger', result.output)
+        with open(profile) as profile_file:
+            frames = json.load(profile_file)['shared']['frames']
+        categories = set(frame['name'].split(':')[0] for frame in frames)
+        self.assertTrue({'config', 'hledger'} <= categories)
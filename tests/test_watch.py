@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for watching files of `hreports` package."""
+
+import os
+import shutil
+import unittest
+import tempfile
+
+from click.testing import CliRunner
+
+from hreports import cli, config, watch
+
+
+CONFIG = '''global:
+  cache: false
+  manifest: false
+reports:
+  sub_a:
+    query: bal income
+    ledger: %(a)s
+  sub_b:
+    query: bal income
+    ledger: %(b)s
+    template: sub_b.md
+  group:
+    template: sub_b.md
+    ledger: %(a)s
+    inputs: [sub_b]
+'''
+
+
+class ScriptedWatcher(object):
+    """Report scripted changes, then stop like Ctrl-C does."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.watched = set()
+
+    def watch(self, paths):
+        self.watched = set(paths)
+
+    def changes(self, timeout=None):
+        if timeout is not None:
+            return set()
+        if not self.script:
+            raise KeyboardInterrupt()
+        return set(self.script.pop(0))
+
+    def close(self):
+        pass
+
+
+class TestWatch(unittest.TestCase):
+    """Tests for `hreports.watch` module."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.ledgers = {}
+        for name in ['a', 'b']:
+            self.ledgers[name] = os.path.join(self.directory,
+                                              '%s.ledger' % name)
+            with open(self.ledgers[name], 'w') as ledger:
+                ledger.write('2010/1/12 *\n    income  243\n    asset\n')
+        self.config_file = os.path.join(self.directory, 'config.yml')
+        with open(self.config_file, 'w') as config_file:
+            config_file.write(CONFIG % self.ledgers)
+        templates = os.path.join(self.directory, 'templates')
+        os.makedirs(templates)
+        self.template = os.path.join(templates, 'sub_b.md')
+        with open(self.template, 'w') as template:
+            template.write('{{ report_name }}: {{ output|first|trim }}')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_polling_watcher(self):
+        watcher = watch.PollingWatcher(interval=0.01)
+        watcher.watch([self.ledgers['a'], self.ledgers['b']])
+        self.assertEqual(watcher.changes(0), set())
+        with open(self.ledgers['a'], 'a') as ledger:
+            ledger.write('\n')
+        self.assertEqual(watcher.changes(1), {self.ledgers['a']})
+        self.assertEqual(watcher.changes(0), set())
+
+    def test_runs(self):
+        watcher = ScriptedWatcher([[self.ledgers['a']], [self.template],
+                                   ['/elsewhere']])
+        reports = watch.ReportWatcher(config.Config(self.config_file),
+                                      ['sub_*', 'group'], watcher, 0)
+        runs = reports.runs()
+        self.assertEqual(next(runs), (set(), ['sub_a', 'sub_b', 'group']))
+        self.assertTrue({self.config_file, self.template,
+                         self.ledgers['b']} <= watcher.watched)
+        self.assertEqual(next(runs), ({self.ledgers['a']},
+                                      ['sub_a', 'group']))
+        self.assertEqual(next(runs), ({self.template}, ['sub_b', 'group']))
+        with self.assertRaises(KeyboardInterrupt):
+            next(runs)
+
+    def test_watch_command(self):
+        get_watcher = watch.get_watcher
+        watch.get_watcher = lambda poll: ScriptedWatcher([[self.template]])
+        try:
+            result = CliRunner().invoke(cli.main, ['-c', self.config_file,
+                                                   'watch', '--show',
+                                                   'sub_b'])
+        finally:
+            watch.get_watcher = get_watcher
+        assert not result.exception
+        self.assertEqual(result.output.count('sub_b: 243  income'), 2)
+        self.assertIn('Changed %s' % self.template, result.output)